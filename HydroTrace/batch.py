@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser headless batch processing
+-------------------------------------------------------------------------------
+Processes a manifest of GC/temperature file pairs across a process pool, writing
+an .htd file per run and a summary of all runs, e.g.:
+
+>python -m HydroTrace.batch manifest.csv -o results -j 8
+
+The manifest is a comma delimited file with a header line naming the columns:
+gc, temp, spa, weight, rate, cycletime and optionally name, delay, channel and
+material. Relative paths are taken from the directory the manifest is in.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, sys, csv, argparse, yaml
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from HydroTrace.hydro_trace_common import resource_path
+from HydroTrace.rundata import RunData
+from HydroTrace.runfile import write_run, run_meta
+from HydroTrace.uncertainty import propagate
+from HydroTrace.profiling import traced, init_worker
+from HydroTrace.library import RunLibrary
+from HydroTrace.peaks import fit_peaks, heating_rate, kissinger
+from HydroTrace.resample import methods
+
+summary_fields = ['name','gc','temp','runs','total','total_low','total_high','seed','peak_rate','peak_temp',
+    'heating_rate','fit_peaks','fit_energy','htd','htb','status']
+
+#statuses of runs whose files couldn't be read, e.g. while they were being written
+unreadable = ('Could not read GC file.', 'Could not read temperature file.')
+
+def read_manifest(fname):
+    """
+    Reads a batch manifest, returning a list of dicts with file paths resolved and parameters as floats
+    """
+    basedir = os.path.dirname(os.path.abspath(fname))
+    runs = []
+    with open(fname, newline='') as f:
+        for num, row in enumerate(csv.DictReader(f), 2):
+            try:
+                run = dict(
+                    gc = os.path.join(basedir, row['gc'].strip()),
+                    temp = os.path.join(basedir, row['temp'].strip()),
+                    spa = float(row['spa']),
+                    weight = float(row['weight']),
+                    rate = float(row['rate']),
+                    cycletime = float(row['cycletime']),
+                    delay = float(row.get('delay') or 0),
+                    )
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError('%s, line %d: invalid manifest entry (%s).'%(fname,num,e))
+            name = (row.get('name') or '').strip()
+            run['name'] = name if name else os.path.splitext(os.path.basename(run['gc']))[0]
+            #temperature channel names, the mean is taken of several separated by ;
+            channel = (row.get('channel') or '').strip()
+            run['channel'] = [c.strip() for c in channel.split(';')] if channel else None
+            run['material'] = (row.get('material') or '').strip() or None
+            runs.append(run)
+    #keep output file names unique where names have been duplicated
+    names = [r['name'] for r in runs]
+    for i, run in enumerate(runs):
+        if names.count(run['name']) > 1:
+            run['name'] = '%04d_%s'%(i,run['name'])
+    return runs
+
+def write_htd(fname, common_time, common_temp, d_rate):
+    """
+    Writes aligned time, temperature and desorbtion rate columns in the format exported by the GUI
+    """
+    np.savetxt(fname,
+    np.column_stack((common_time,common_temp,d_rate)),
+    delimiter=',',
+    header = "Time (min),Temp (°C), D_rate (ppm/min)")
+
+@traced()
+def process_run(run, content, flowconst, outputd, htb = False, sd = None, fit = None, seed = 0):
+    """
+    Carries out the calculations of the basic and temperature tabs for a single manifest entry,
+    writing an .htd file to outputd, and an .htb file if htb is True. If sd gives standard
+    uncertainties (see uncertainty.propagate), the 95% interval of the total is found from draws
+    seeded with seed, which is recorded in the row, so that the same run gives the same interval. If fit is
+    given as (n_peaks, shape), peaks are fitted to desorbtion rate vs. temperature with
+    peaks.fit_peaks. Returns a summary row as a dict, failures are recorded in status.
+    """
+    row = dict.fromkeys(summary_fields, '')
+    row.update(name = run['name'], gc = run['gc'], temp = run['temp'], runs = 0, status = 'ok')
+    data = RunData.from_files(run['gc'], run['temp'], run.get('channel'), reduction = run.get('reduction'))
+    if data.area is None:
+        row['status'] = 'Could not read GC file.'
+        return row
+    row['runs'] = len(data.area)
+    row['total'] = data.total(content, run['spa'], run['weight'], flowconst, run['rate'], run['cycletime'])
+    if sd:
+        params = dict(content = content, spa = run['spa'], weight = run['weight'], molar_rate = flowconst,
+            rate = run['rate'], cycletime = run['cycletime'], delay = run['delay'])
+        row['total_low'], _, row['total_high'] = propagate(params, sd, data.area, seed = seed)['total']
+        row['seed'] = seed
+    if data.temp is None:
+        row['status'] = 'Could not read temperature file.'
+        return row
+    common_temp = data.calculate(content, run['spa'], run['weight'], flowconst, run['rate'], run['delay'])
+    if np.isnan(common_temp).all():
+        row['status'] = 'Temperature record does not span the GC runs.'
+        return row
+    common_time, d_rate = data.common_time, data.d_rate
+    peak = np.argmax(d_rate)
+    row['peak_rate'] = d_rate[peak]
+    row['peak_temp'] = common_temp[peak]
+    row['heating_rate'] = heating_rate(common_time, common_temp)
+    if fit:
+        result = fit_peaks(common_temp, d_rate, *fit)
+        #peak temperatures (°C) and energies (kJ/mol), separated by ;
+        row['fit_peaks'] = ';'.join('%0.2f'%t for t in result['peak_temp'])
+        if result['energy'] is not None:
+            row['fit_energy'] = ';'.join('%0.2f'%e for e in result['energy'])
+        if not result['success']:
+            row['status'] = 'Peak fit: %s'%result['message']
+        elif result['degenerate']:
+            row['status'] = 'Peak fit: %s'%result['degenerate']
+    row['htd'] = os.path.join(outputd, run['name'] + '.htd')
+    write_htd(row['htd'], common_time, common_temp, d_rate)
+    if htb:
+        row['htb'] = os.path.join(outputd, run['name'] + '.htb')
+        meta = run_meta(content, flowconst, run['spa'], run['weight'], run['rate'], run['cycletime'],
+            run['delay'], total = float(row['total']), gc = run['gc'], temp = run['temp'], channel = run.get('channel'),
+            reduction = run.get('reduction'))
+        write_run(row['htb'], data.columns(), meta)
+    return row
+
+def _process_run(args):
+    """
+    Unpacks arguments for process_run so it can be mapped over a pool, capturing any failure
+    """
+    try:
+        return process_run(*args)
+    except Exception as e:
+        return _failed_row(args[0], e)
+
+def _failed_row(run, e):
+    """
+    Returns the summary row of a run for which processing raised e
+    """
+    row = dict.fromkeys(summary_fields, '')
+    row.update(name = run['name'], gc = run['gc'], temp = run['temp'], runs = 0, status = '%s: %s'%(type(e).__name__,e))
+    return row
+
+def run_batch(runs, content, flowconst, outputd, workers = None, htb = False, sd = None, fit = None, seed = 0):
+    """
+    Processes a list of runs from read_manifest over a pool of workers, returning summary rows
+    in the same order as runs regardless of the order in which they complete.
+    """
+    os.makedirs(outputd, exist_ok = True)
+    jobs = [(run, content, flowconst, outputd, htb, sd, fit, seed) for run in runs]
+    if workers == 1 or len(jobs) < 2:
+        return [_process_run(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers = workers, initializer = init_worker) as pool:
+        return list(pool.map(_process_run, jobs))
+
+def write_summary(fname, rows):
+    """
+    Writes summary rows from run_batch to a comma delimited file
+    """
+    with open(fname, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames = summary_fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def write_kissinger(fname, rows, n_peaks):
+    """
+    Writes the activation energy of each fitted peak from a Kissinger analysis of the peak temperatures
+    and heating rates of summary rows, which need to span several heating rates. Only rows whose status
+    is ok are used, leaving out failed and degenerate peak fits, and for each peak only those with its
+    temperature. Where a peak can't be analysed, the reason is given in place of its energy.
+    """
+    fitted = [r for r in rows if r['status'] == 'ok' and r['fit_peaks'] and r['heating_rate'] != '']
+    rates = [float(r['heating_rate']) for r in fitted]
+    temps = [[float(t) for t in r['fit_peaks'].split(';')] for r in fitted]
+    with open(fname, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['peak', 'runs', 'energy', 'intercept', 'r2', 'note'])
+        for k in range(n_peaks):
+            found = [(rate, t[k]) for rate, t in zip(rates, temps) if len(t) > k and np.isfinite(t[k])]
+            note = ''
+            try:
+                energy, intercept, r2 = kissinger([rate for rate, t in found], [t for rate, t in found])
+            except ValueError as e:
+                energy = intercept = r2 = ''
+                note = str(e)
+            writer.writerow([k + 1, len(found), energy, intercept, r2, note])
+
+def read_settings(filec = None):
+    """
+    Returns H standard content and carrier gas molar rate from the settings file
+    """
+    if filec is None:
+        filec = resource_path("HydroTraceSettings.yml")
+    with open(filec,'r') as ymlfile:
+        cfg = yaml.load(ymlfile, Loader=yaml.FullLoader)
+    return float(cfg['FlowSettings']['content']), float(cfg['FlowSettings']['molar_rate'])
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'python -m HydroTrace.batch',
+        description = 'Headless batch processing of HydroTrace runs.')
+    parser.add_argument('manifest', help = 'comma delimited manifest of runs')
+    parser.add_argument('-o', '--output', default = '.', help = 'output directory (default: current)')
+    parser.add_argument('-j', '--workers', type = int, default = None,
+        help = 'number of worker processes (default: number of processors)')
+    parser.add_argument('--content', type = float, default = None,
+        help = 'hydrogen standard content in ppm (default: from settings)')
+    parser.add_argument('--molar-rate', type = float, default = None,
+        help = 'carrier gas molar flow rate in µmol/s (default: from settings)')
+    parser.add_argument('--settings', default = None, help = 'alternative settings file')
+    parser.add_argument('--htb', action = 'store_true', help = 'also write binary .htb run files')
+    parser.add_argument('--library', default = None, nargs = '?', const = '',
+        help = 'add runs to a run library, the default library if no file is given (implies --htb)')
+    parser.add_argument('--resample', type = int, default = None,
+        help = 'average temperature records onto a grid of this many seconds as they are read')
+    parser.add_argument('--smooth', default = None, choices = methods,
+        help = 'smooth temperature records with a rolling mean, median or Savitzky-Golay filter')
+    parser.add_argument('--window', type = int, default = 5, help = 'smoothing window, odd (default: 5)')
+    parser.add_argument('--order', type = int, default = 2, help = 'Savitzky-Golay polynomial order (default: 2)')
+    parser.add_argument('--report', action = 'store_true',
+        help = 'also render figures and a summary sheet of each run to a report directory (implies --htb)')
+    parser.add_argument('--fit-peaks', type = int, default = 0,
+        help = 'number of peaks to fit to desorbtion rate vs. temperature, giving a Kissinger analysis of the campaign')
+    parser.add_argument('--peak-shape', default = 'gaussian', choices = ['gaussian', 'first-order'],
+        help = 'shape of fitted peaks (default: gaussian)')
+    parser.add_argument('--uncertainty', default = None,
+        help = 'YAML file of parameter standard uncertainties, adds a 95%% interval on the total')
+    parser.add_argument('--seed', type = int, default = 0,
+        help = 'seed of the draws giving the interval on the total, recorded in the summary (default: 0)')
+    args = parser.parse_args(argv)
+
+    content, flowconst = args.content, args.molar_rate
+    if content is None or flowconst is None:
+        cfg_content, cfg_flowconst = read_settings(args.settings)
+        content = cfg_content if content is None else content
+        flowconst = cfg_flowconst if flowconst is None else flowconst
+
+    sd = None
+    if args.uncertainty is not None:
+        with open(args.uncertainty, 'r') as ymlfile:
+            sd = {k: float(v) for k, v in yaml.load(ymlfile, Loader=yaml.FullLoader).items()}
+
+    runs = read_manifest(args.manifest)
+    if args.resample or args.smooth:
+        for run in runs:
+            run['reduction'] = dict(step = args.resample, method = args.smooth, window = args.window, order = args.order)
+    fit = (args.fit_peaks, args.peak_shape) if args.fit_peaks else None
+    htb = args.htb or args.library is not None or args.report
+    rows = run_batch(runs, content, flowconst, args.output, args.workers, htb, sd, fit, args.seed)
+    write_summary(os.path.join(args.output, 'summary.csv'), rows)
+    if fit:
+        write_kissinger(os.path.join(args.output, 'kissinger.csv'), rows, args.fit_peaks)
+    if args.report:
+        #imported here so that batch processing doesn't pull in matplotlib unless reports are wanted
+        from HydroTrace.report import render_campaign, write_report_index
+        reportd = os.path.join(args.output, 'report')
+        report = render_campaign([r['htb'] for r in rows if r['htb']], reportd, args.workers)
+        write_report_index(os.path.join(reportd, 'report.csv'), report)
+    if args.library is not None:
+        with RunLibrary(args.library or None) as lib:
+            for run, row in zip(runs, rows):
+                if row['htb']:
+                    lib.add_run_file(row['htb'], name = run['name'], material = run['material'])
+    failed = [r for r in rows if r['status'] != 'ok']
+    for r in failed:
+        print('%s: %s'%(r['name'], r['status']))
+    print('Processed %d runs, %d failed.'%(len(rows), len(failed)))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
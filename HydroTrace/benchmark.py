@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser benchmarks
+-------------------------------------------------------------------------------
+Generates synthetic ChemStation reports and Pico csv files in the formats of
+those in exampledata and times the processing pipeline on them, e.g.:
+
+>python -m HydroTrace.benchmark --sizes 1e3,1e4,1e5,1e6 -o results.json
+>python -m HydroTrace.benchmark --baseline results.json
+
+Import time of the calculation functions, batch processing and the interface
+is measured in fresh interpreters first. Results, including peak memory
+allocated, are written as JSON. Given a baseline
+from a previous run, any benchmark slower than the baseline by more than the
+tolerance is reported and the exit status is 1.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, sys, json, time, argparse, platform, tempfile, tracemalloc
+import subprocess as sp
+import numpy as np
+from HydroTrace.hydro_trace_common import read_cs_file, read_pico_csv, read_pico_csv_bulk, \
+    interp_datetime, calc_total, calc_desorbtion_rate, align_temp
+from HydroTrace.plotting import TempTabPlot
+from HydroTrace.uncertainty import propagate
+from HydroTrace.rundata import RunData
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+_start = np.datetime64('2020-03-09T17:08:41')
+
+def _stamp_fields(t):
+    """
+    Returns day, month, year, hour, minute, second arrays for datetime64[s] array t
+    """
+    days = t.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    secs = (t - days).astype(np.int64)
+    return ((days - months).astype(np.int64) + 1, (months - years).astype(np.int64) + 1,
+        years.astype(np.int64) + 1970, secs//3600, secs//60 % 60, secs % 60)
+
+def ramp_profile(minutes, rate = 1.0, hold = 300.0, ambient = 25.0, noise = 0.02, seed = 0):
+    """
+    Temperature of a ramp at rate °C/min from ambient to hold, then held, with gaussian noise
+    """
+    rng = np.random.default_rng(seed)
+    return np.minimum(ambient + rate*minutes, hold) + noise*rng.standard_normal(len(minutes))
+
+def write_pico_csv(fname, n, start = _start, period = 1, chunk = 1<<18, channels = 1):
+    """
+    Writes n samples of a ramp and hold temperature record every period seconds in the format
+    of Pico's PLW2CSV.exe, with dates and times which are not zero padded. Further channels read
+    progressively higher than the first.
+    """
+    with open(fname, 'w', encoding='latin-1', newline='\n') as f:
+        f.write('Sample number, Date/Time,' + ','.join('Channel %d (\xb0C)'%(c+1) for c in range(channels)) + '\n')
+        for i in range(0, n, chunk):
+            k = np.arange(i, min(i + chunk, n))
+            t = start + k*period
+            temp = ramp_profile(k*period/60, seed = i)[:,None] + np.arange(channels)
+            rows = np.column_stack((k,) + _stamp_fields(t))
+            fmt = '%d,%d/%d/%d %d:%d:%d,'
+            vals = ','.join(['%.5f']*channels) + '\n'
+            f.write(''.join([fmt%tuple(r) + vals%tuple(v) for r, v in zip(rows.tolist(), temp.tolist())]))
+
+def write_cs_report(fname, n, start = _start + 47, cycle = 139, chunk = 1<<16):
+    """
+    Writes a ChemStation statistic report in UTF-16 with a sequence table of n runs every cycle
+    seconds and a peak area table for those runs (about 60%) where hydrogen was detected, with
+    the '---|' delimited layout read_cs_file relies on.
+    """
+    rng = np.random.default_rng(1)
+    with open(fname, 'w', encoding='utf16', newline='\r\n') as f:
+        f.write('                    S t a t i s t i c    R e p o r t\n\n')
+        f.write('Sequence table:      C:\\Users\\Public\\Documents\\ChemStation\\1\\Data\\Synthetic.S\n')
+        f.write('Sequence Operator:   SYSTEM\nOperator:            SYSTEM\n\n')
+        f.write('Run Location Inj     Inj. Date/Time         File Name       Sample Name\n')
+        f.write(' #            #\n')
+        f.write('---|--------|---|------------------------|-----------------|----------------\n')
+        for i in range(0, n, chunk):
+            k = np.arange(i, min(i + chunk, n))
+            d, m, y, hh, mm, ss = _stamp_fields(start + k*cycle)
+            f.write(''.join(['%3d 1          1 %02d/%02d/%04d %02d:%02d:%02d      Synthetic         Synthetic\n'%tuple(r)
+                for r in np.column_stack((k + 1, d, m, y, hh, mm, ss)).tolist()]))
+        f.write('\n\nCompound: hydrogen (Signal: AIB1 D, 4th Signal)\n\n')
+        f.write('Run             Peak area\n #              [15 \xb5V*s]\n---|---------------------\n')
+        for i in range(0, n - 2, chunk):
+            #last two runs are left out so that int_run+1 indexes the sequence table
+            k = np.arange(i, min(i + chunk, n - 2))
+            k = k[rng.random(len(k)) < 0.6]
+            area = 1000 + 1500*np.exp(-((k - n/2)/(n/6 + 1))**2) + 50*rng.standard_normal(len(k))
+            f.write(''.join(['%3d %19.5f\n'%r for r in zip((k + 1).tolist(), area.tolist())]))
+        f.write('-------------------------\nMean:          0.00000\n\n')
+
+def _measure(fn, repeat):
+    """
+    Returns the best time of repeat calls to fn and the peak memory allocated during one
+    """
+    best = np.inf
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def render_cases(common_time, common_temp, d_rate, temp_time, temp):
+    """
+    Returns a function per temperature tab view rendering it offscreen with the Agg backend
+    """
+    fig = Figure(figsize = (8, 6))
+    FigureCanvasAgg(fig)
+    plot = TempTabPlot(fig)
+    plot.set_data(common_time, common_temp, d_rate, temp_time, temp)
+    def case(mode):
+        def render():
+            plot.show(mode)
+            fig.canvas.draw()
+        return render
+    return {'render_' + mode: case(mode) for mode in ('DvsTemp', 'DvsTime', 'TvsTime')}
+
+#modules timed on startup, and heavy modules which each may not pull in
+startup_modules = dict(
+    startup_core = ('HydroTrace.hydro_trace_common', ['PyQt5', 'matplotlib', 'scipy']),
+    startup_batch = ('HydroTrace.batch', ['PyQt5', 'matplotlib', 'scipy']),
+    startup_main = ('HydroTrace.main', ['matplotlib', 'scipy']),
+    )
+
+_startup_script = '''import sys, time, json
+t = time.perf_counter()
+import %s
+print(json.dumps([time.perf_counter() - t, [m for m in %r if m in sys.modules]]))'''
+
+def measure_startup(module, heavy, repeat = 3):
+    """
+    Returns the best time to import module in a fresh interpreter, and those of the modules in
+    heavy which it imported
+    """
+    best, loaded = np.inf, []
+    for _ in range(repeat):
+        out = sp.run([sys.executable, '-c', _startup_script%(module, heavy)], check = True,
+            capture_output = True, text = True).stdout
+        seconds, loaded = json.loads(out.splitlines()[-1])
+        best = min(best, seconds)
+    return best, loaded
+
+def run_startup(repeat = 3):
+    """
+    Times the import of each of startup_modules, returning a list of result dicts along with a list of
+    descriptions of any heavy modules imported at startup
+    """
+    results, problems = [], []
+    for name, (module, heavy) in startup_modules.items():
+        seconds, loaded = measure_startup(module, heavy, repeat)
+        results.append(dict(name = name, size = 0, seconds = seconds, peak_bytes = 0, file_bytes = 0))
+        print('%-22s %10d %10.4f s'%(name, 0, seconds))
+        if loaded:
+            problems.append('%s imports %s at startup'%(module, ', '.join(loaded)))
+    return results, problems
+
+def run_benchmarks(sizes, repeat = 3, workdir = None, python_reader = True):
+    """
+    Generates files for each size, being the number of temperature samples and GC runs, and times
+    each stage of the pipeline on them. Returns a list of result dicts. The line by line reader
+    read_pico_csv is skipped beyond 10^6 samples, or altogether if python_reader is False.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir = workdir) as tmp:
+        for n in sizes:
+            n = int(n)
+            pico = os.path.join(tmp, 'temp_%d.csv'%n)
+            cs = os.path.join(tmp, 'gc_%d.txt'%n)
+            #both files have n rows, GC runs every second so that they lie inside the temperature record
+            write_pico_csv(pico, n + 100)
+            wide = os.path.join(tmp, 'temp8_%d.csv'%n)
+            write_pico_csv(wide, n + 100, channels = 8)
+            write_cs_report(cs, n, cycle = 1)
+            int_run, area, dt = read_cs_file(cs, cache = False)
+            temp, temp_dt = read_pico_csv_bulk(pico)
+            params = (61., 86485., 1.66, 7.44, 20.)
+            common_temp, common_time, temp_time = align_temp(temp, temp_dt, dt, int_run, 0.5)
+            d_rate = calc_desorbtion_rate(*params, area)
+            cases = dict(
+                read_cs_file = lambda: read_cs_file(cs, cache = False),
+                read_pico_csv_bulk = lambda: read_pico_csv_bulk(pico),
+                read_pico_channel_of_8 = lambda: read_pico_csv_bulk(wide, channel = 'Channel 3'),
+                load_run = lambda: RunData.from_files(cs, pico, cache = False),
+                interp_datetime = lambda: interp_datetime(temp_dt, temp, dt[int_run+1]),
+                align_temp = lambda: align_temp(temp, temp_dt, dt, int_run, 0.5),
+                calc_total = lambda: calc_total(*params, 2.3, area),
+                calc_desorbtion_rate = lambda: calc_desorbtion_rate(*params, area),
+                propagate = lambda: propagate(dict(content = 61., spa = 86485., weight = 1.66, molar_rate = 7.44,
+                    rate = 20., cycletime = 2.3, delay = 0.5), dict(spa = 1500., weight = 0.005, rate = 0.2,
+                    molar_rate = 0.05, delay = 0.1), area, temp, temp_dt, dt, int_run),
+                )
+            if python_reader and n <= 10**6:
+                cases['read_pico_csv'] = lambda: read_pico_csv(pico, cache = False)
+            cases.update(render_cases(common_time, common_temp, d_rate, temp_time, temp))
+            for name, fn in cases.items():
+                seconds, peak = _measure(fn, repeat)
+                results.append(dict(name = name, size = n, seconds = seconds, peak_bytes = peak,
+                    file_bytes = os.path.getsize(cs if name == 'read_cs_file' else wide if name.endswith('of_8') else pico)))
+                print('%-22s %10d %10.4f s %10.1f MB'%(name, n, seconds, peak/2**20))
+            os.remove(pico)
+            os.remove(wide)
+            os.remove(cs)
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of descriptions of results slower than those of the same name and size in
+    baseline by more than tolerance (fractional)
+    """
+    base = {(b['name'], b['size']): b for b in baseline}
+    slower = []
+    for r in results:
+        b = base.get((r['name'], r['size']))
+        if b is not None and r['seconds'] > b['seconds']*(1 + tolerance):
+            slower.append('%s (%d): %0.4f s against %0.4f s'%(r['name'], r['size'], r['seconds'], b['seconds']))
+    return slower
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'python -m HydroTrace.benchmark',
+        description = 'Benchmarks the HydroTrace processing pipeline on synthetic data.')
+    parser.add_argument('--sizes', default = '1e3,1e4,1e5,1e6',
+        help = 'comma separated numbers of samples/runs, up to 1e8 (default: 1e3,1e4,1e5,1e6)')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'repeats of each, best is kept (default: 3)')
+    parser.add_argument('-o', '--output', default = None, help = 'JSON file to write results to')
+    parser.add_argument('--baseline', default = None, help = 'JSON results to compare against')
+    parser.add_argument('--tolerance', type = float, default = 0.25,
+        help = 'fractional slow down against baseline allowed (default: 0.25)')
+    parser.add_argument('--workdir', default = None, help = 'directory for generated files (default: system temp)')
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(s)) for s in args.sizes.split(',')]
+    results, slower = run_startup(args.repeat)
+    results += run_benchmarks(sizes, args.repeat, args.workdir)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(python = platform.python_version(), numpy = np.__version__,
+                platform = platform.platform(), results = results), f, indent = 1)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            slower += compare(results, json.load(f)['results'], args.tolerance)
+    for s in slower:
+        print('Regression: ' + s)
+    return 1 if slower else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser parsed file cache
+-------------------------------------------------------------------------------
+Keeps the arrays parsed from instrument files on disk as .npy files, keyed by the
+content hash of the source file so that reloading a file, or a copy of it, maps
+the arrays back in rather than parsing it again. The hash of a path is only
+recomputed when its size or modification time changes. The index is only
+updated under a lock file, as GUI threads, worker processes and batch workers
+may all load through the same cache at once.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, json, time, shutil, hashlib, tempfile
+from contextlib import contextmanager
+import numpy as np
+from HydroTrace.hydro_trace_common import parse_cs_file, read_pico_channels, pico_header, Cancelled
+from HydroTrace.profiling import span
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(f):
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass #LK_LOCK gives up after 10 s, keep waiting
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def default_cache_dir():
+    """
+    Returns the cache location, HYDROTRACE_CACHE if set, otherwise a per-user cache directory
+    """
+    if os.environ.get('HYDROTRACE_CACHE'):
+        return os.environ['HYDROTRACE_CACHE']
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'HydroTrace')
+
+def file_hash(fname, chunk = 1<<20):
+    """
+    Returns the blake2b hex digest of the contents of fname
+    """
+    h = hashlib.blake2b(digest_size = 20)
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class FileCache(object):
+    """
+    Content addressed cache of parsed arrays. Entries are directories of .npy files named
+    hash-tag, where tag identifies the parser; index.json records entry sizes and last use for
+    least recently used eviction once max_bytes is exceeded, along with the size, mtime and hash
+    last seen for each source path held. index.json is replaced in a single step, so it can be read
+    at any time, but is only changed while holding index.lock, see _update.
+    """
+    def __init__(self, cachedir = None, max_bytes = 1<<30):
+        self.cachedir = default_cache_dir() if cachedir is None else cachedir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cachedir, exist_ok = True)
+        self.index_file = os.path.join(self.cachedir, 'index.json')
+        self.lock_file = os.path.join(self.cachedir, 'index.lock')
+
+    def _read_index(self):
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict(entries = {}, paths = {})
+
+    def _write_index(self, index):
+        fd, tmp = tempfile.mkstemp(dir = self.cachedir, suffix = '.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_file)
+
+    @contextmanager
+    def _update(self):
+        """
+        Holds the lock on the index while the block runs, giving the current index to change, which is
+        written once the block completes
+        """
+        with open(self.lock_file, 'a+') as f:
+            _lock_file(f)
+            try:
+                index = self._read_index()
+                yield index
+                self._write_index(index)
+            finally:
+                _unlock_file(f)
+
+    def _hash(self, fname, index):
+        """
+        Returns the content hash of fname and its path record for the index, reusing the hash recorded
+        in index if its size and mtime are unchanged
+        """
+        fname = os.path.abspath(fname)
+        st = os.stat(fname)
+        seen = index['paths'].get(fname)
+        if seen is not None and seen['size'] == st.st_size and seen['mtime'] == st.st_mtime_ns:
+            return seen['hash'], seen
+        digest = file_hash(fname)
+        return digest, dict(size = st.st_size, mtime = st.st_mtime_ns, hash = digest)
+
+    def load(self, fname, parser, tag):
+        """
+        Returns the tuple of arrays parser(fname) gives, from the cache if present. Cached arrays are
+        memory mapped read only. Results containing None are returned but not cached. The file is
+        hashed and parsed without holding the lock on the index.
+        """
+        with span('FileCache.load', file = fname, tag = tag, hit = False) as s:
+            digest, seen = self._hash(fname, self._read_index())
+            key = '%s-%s'%(digest, tag)
+            entry = os.path.join(self.cachedir, key)
+            with self._update() as index:
+                held = index['entries'].get(key)
+                if held is not None and os.path.isdir(entry):
+                    held['used'] = time.time()
+                    index['paths'][os.path.abspath(fname)] = seen
+            if held is not None:
+                try:
+                    result = tuple(np.load(os.path.join(entry, '%d.npy'%i), mmap_mode = 'r') for i in range(held['n']))
+                    s['hit'], s['rows'] = True, len(result[-1])
+                    return result
+                except OSError:
+                    pass #evicted since, parsed again
+
+            result = parser(fname)
+            if any(r is None for r in result):
+                return result
+            s['rows'] = len(result[-1])
+            tmp = tempfile.mkdtemp(dir = self.cachedir)
+            nbytes = 0
+            for i, r in enumerate(result):
+                np.save(os.path.join(tmp, '%d.npy'%i), np.asarray(r))
+                nbytes += os.path.getsize(os.path.join(tmp, '%d.npy'%i))
+            with self._update() as index:
+                shutil.rmtree(entry, ignore_errors = True)
+                os.replace(tmp, entry)
+                index['entries'][key] = dict(n = len(result), bytes = nbytes, used = time.time())
+                index['paths'][os.path.abspath(fname)] = seen
+                self._evict(index)
+            return result
+
+    def _evict(self, index):
+        """
+        Removes least recently used entries until the cache is within max_bytes, and the paths whose
+        contents no longer have any entries
+        """
+        entries = index['entries']
+        total = sum(e['bytes'] for e in entries.values())
+        for key in sorted(entries, key = lambda k: entries[k]['used']):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]['bytes']
+            del entries[key]
+            shutil.rmtree(os.path.join(self.cachedir, key), ignore_errors = True)
+        held = {key.split('-')[0] for key in entries}
+        index['paths'] = {p: seen for p, seen in index['paths'].items() if seen['hash'] in held}
+
+    def invalidate(self, fname):
+        """
+        Removes all entries parsed from the current contents of fname
+        """
+        digest, seen = self._hash(fname, self._read_index())
+        with self._update() as index:
+            for key in [k for k in index['entries'] if k.startswith(digest + '-')]:
+                del index['entries'][key]
+                shutil.rmtree(os.path.join(self.cachedir, key), ignore_errors = True)
+            index['paths'].pop(os.path.abspath(fname), None)
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        with self._update() as index:
+            for key in index['entries']:
+                shutil.rmtree(os.path.join(self.cachedir, key), ignore_errors = True)
+            index['entries'], index['paths'] = {}, {}
+
+_default_cache = None
+
+def get_cache():
+    """
+    Returns a FileCache in the default location
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FileCache()
+    return _default_cache
+
+def cached_read_cs_file(fname, cache = None):
+    """
+    As read_cs_file, going through cache (default: get_cache())
+    """
+    cache = get_cache() if cache is None else cache
+    try:
+        return cache.load(fname, parse_cs_file, 'cs1')
+    except Exception as e:
+        print(e)
+        return None, None, None
+
+def cached_read_pico_channels(fname, cache = None, progress = None, dtype = np.float64):
+    """
+    As read_pico_channels for all channels, going through cache (default: get_cache()). progress
+    is passed to read_pico_channels when the file has to be parsed.
+    """
+    cache = get_cache() if cache is None else cache
+    dtype = np.dtype(dtype)
+    tag = 'pico2' if dtype == np.float64 else 'pico2-' + dtype.name
+    try:
+        temp, dt = cache.load(fname, lambda f: read_pico_channels(f, progress = progress, dtype = dtype)[1:], tag)
+        if temp is None:
+            return None, None, None
+        return pico_header(fname), temp, dt
+    except Cancelled:
+        raise
+    except Exception as e:
+        print(e)
+        return None, None, None
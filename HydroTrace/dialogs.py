@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser dialogs
+-------------------------------------------------------------------------------
+File dialogs, the settings dialog and the delay calibration dialog, kept apart
+from hydro_trace_common so that the calculation functions can be imported
+without PyQt5.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os.path, yaml
+from PyQt5.QtGui import QIcon, QFont
+from PyQt5.QtWidgets import QApplication, QFileDialog, QGridLayout, QPushButton, QLabel, QDoubleSpinBox, \
+    QDialogButtonBox
+from HydroTrace.hydro_trace_common import resource_path
+
+def get_file(*args):
+    '''
+    Returns absolute path to filename and the directory it is located in from a PyQt5 filedialog. First value is file extension, second is the directory to start in, or a file to select (default: current directory).
+    '''
+    ext = args[0]
+    if len(args)>1 and args[1] is not None:
+        launchdir = args[1]
+    else: launchdir = os.getcwd()
+    ftypeName={}
+    ftypeName['*.txt']=["Chem Station file:", "*.txt", "TXT File"]
+    ftypeName['*.csv']=["Pico-generated csv file:", "*.csv", "CSV File"]
+    ftypeName['*.htb']=["HydroTrace run file:", "*.htb", "HTB File"]
+        
+    filer = QFileDialog.getOpenFileName(None, ftypeName[ext][0], 
+         launchdir,(ftypeName[ext][2]+' ('+ftypeName[ext][1]+');;All Files (*.*)'))
+
+    if filer[0] == '':
+        filer = None
+        startdir = None
+        return filer, startdir
+        
+    else: #return the filename/path
+        return filer[0], os.path.dirname(filer[0])
+
+def get_save_file(ext,outputd):
+    '''
+    Returns a the complete path to the file name with ext, starting in outputd. Checks extensions and if an extension is not imposed, it will write the appropriate extension based on ext. ext may be a list of extensions to choose from.
+    '''
+    ftypeName={}
+    ftypeName['*.htd']='Comma delimited HydroTrace data file'
+    ftypeName['*.htb']='Binary HydroTrace run file'
+    if isinstance(ext,str): ext=[ext]
+
+    
+    if outputd==None: id=str(os.getcwd())
+    else: id=outputd
+    lapp = QApplication.instance()
+    if lapp is None:
+        lapp = QApplication([])
+
+    filters = [str(ftypeName[e]+' ('+e+')') for e in ext]
+    filer, selected = QFileDialog.getSaveFileName(None, "Save as:", id, ';;'.join(filters))
+
+    if filer == '':
+        return None, None
+    else:
+        if os.path.splitext(filer)[1] == '':
+            filer += ext[filters.index(selected)][1:] if selected in filters else ext[0][1:]
+        return filer, os.path.dirname(filer)
+
+class Ui_get_config_dialog(object):
+    """
+    Generates the pop-up window to manage default settings
+    """
+    def setupUi(self, get_config_dialog):
+        # getFEAconfigDialog.resize(200, 200)
+        get_config_dialog.setWindowTitle('Standard settings')
+        get_config_dialog.setWindowIcon(QIcon(resource_path("meta/icon.png")))
+        layout = QGridLayout(get_config_dialog)
+        self.pushButton = QPushButton('Update')
+        H_std_content_label = QLabel("Hydrogen standard content (ppm):")
+        self.H_std_content=QDoubleSpinBox(get_config_dialog)
+        Carrier_gas_molar_rate_label = QLabel("Carrier gas molar flow rate (µmol/s):")
+        self.Carrier_gas_molar_rate=QDoubleSpinBox(get_config_dialog)
+        
+        self.file_loc = QLabel(get_config_dialog)
+        self.file_loc.setFont(QFont("Helvetica",italic=True))
+        self.file_loc.setWordWrap(True)
+        
+        layout.addWidget(H_std_content_label,0,0,1,1)
+        layout.addWidget(self.H_std_content,0,1,1,1)
+        layout.addWidget(Carrier_gas_molar_rate_label,1,0,1,1)
+        layout.addWidget(self.Carrier_gas_molar_rate,1,1,1,1)
+        
+        
+        
+        layout.addWidget(self.pushButton,2,1,1,1)
+        layout.addWidget(self.file_loc,3,0,1,2)
+        
+        self.pushButton.clicked.connect(lambda: self.make_config_change(get_config_dialog))
+
+
+    def make_config_change(self, get_config_dialog):
+        """
+        Imposes configuration changes.
+        """
+        try:
+
+            data= dict(FlowSettings = 
+            dict( 
+            content = self.H_std_content.value(), #61.00
+            molar_rate = self.Carrier_gas_molar_rate.value() #7.44e-6
+            )
+            )
+            with open(str(self.file_loc.text()), 'w') as outfile:
+                yaml.dump(data, outfile, default_flow_style=False)
+
+        except:
+            print("Configuration change failed.")
+            
+
+        get_config_dialog.close()
+
+
+class Ui_delay_dialog(object):
+    """
+    Generates the pop-up window showing the cost of each temperature delay from calibrate_delay, for
+    the delay with the lowest cost, or another, to be accepted
+    """
+    def setupUi(self, delay_dialog, delays, cost, best):
+        #matplotlib's Qt backend is only imported once needed, as in the main window
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from HydroTrace.plotting import DelayCostPlot
+        delay_dialog.setWindowTitle('Temperature delay')
+        delay_dialog.setWindowIcon(QIcon(resource_path("meta/icon.png")))
+        layout = QGridLayout(delay_dialog)
+        self.figure = Figure(figsize=(5,3))
+        self.canvas = FigureCanvas(self.figure)
+        self.plot = DelayCostPlot(self.figure)
+        self.plot.set_data(delays, cost)
+        self.plot.set_delay(best)
+        self.delay = QDoubleSpinBox(delay_dialog)
+        self.delay.setRange(float(delays[0]), float(delays[-1]))
+        self.delay.setValue(best)
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        
+        layout.addWidget(self.canvas,0,0,1,2)
+        layout.addWidget(QLabel("Lowest cost at %0.2f min, apply delay (m):"%best),1,0,1,1)
+        layout.addWidget(self.delay,1,1,1,1)
+        layout.addWidget(self.buttons,2,0,1,2)
+        
+        self.delay.valueChanged.connect(self.on_delay_changed)
+        self.buttons.accepted.connect(delay_dialog.accept)
+        self.buttons.rejected.connect(delay_dialog.reject)
+
+    def on_delay_changed(self, delay):
+        self.plot.set_delay(delay)
+        self.canvas.draw_idle()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser computation graph
+-------------------------------------------------------------------------------
+Named inputs and stages computed from them, where a stage is only recomputed
+when one of the values it depends on has changed since it was last computed.
+Changes are tracked with a version number for each value: setting an input to
+something other than what it holds, or recomputing a stage, moves its version
+on, and a stage is out of date when the versions of its inputs differ from
+those it was computed with, e.g.:
+
+>>>g = Graph()
+>>>g.input('area'); g.input('k')
+>>>g.stage('d_rate', lambda k, area: k*area, 'k', 'area')
+>>>g.set('area', area); g.set('k', 0.5)
+>>>g.get('d_rate') #computed
+>>>g.get('d_rate') #held
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+from collections import Counter
+import numpy as np
+
+def _same(a, b):
+    """
+    Arrays are taken to be unchanged if they are the same object, anything else if equal
+    """
+    if a is b:
+        return True
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return False
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+class Graph(object):
+    """
+    Dependency tracked values. Inputs are set with set, stages added with stage are computed by get.
+    computed counts how many times each stage has been computed.
+    """
+    def __init__(self):
+        self.values = {}
+        self.versions = {}
+        self.stages = {}
+        self.keys = {}
+        self.computed = Counter()
+
+    def input(self, name, value = None):
+        self.values[name] = value
+        self.versions[name] = 0
+
+    def stage(self, name, fn, *inputs):
+        """
+        Adds a stage computing name as fn of the values of inputs, which must already be in the graph
+        """
+        missing = [i for i in inputs if i not in self.versions]
+        if missing:
+            raise ValueError('%s depends on %s, which are not in the graph.'%(name, ', '.join(missing)))
+        self.stages[name] = (fn, inputs)
+        self.values[name] = None
+        self.versions[name] = 0
+
+    def set(self, name, value):
+        """
+        Sets input name, returning True if value differs from what it held
+        """
+        if _same(self.values[name], value):
+            return False
+        self.values[name] = value
+        self.versions[name] += 1
+        return True
+
+    def key(self, name):
+        """
+        Returns the versions of the inputs of stage name, bringing any stages among them up to date
+        """
+        for i in self.stages[name][1]:
+            if i in self.stages:
+                self.get(i)
+        return tuple(self.versions[i] for i in self.stages[name][1])
+
+    def fresh(self, name):
+        """
+        Returns True if name is up to date, without computing anything
+        """
+        if name not in self.stages:
+            return True
+        inputs = self.stages[name][1]
+        return name in self.keys and all(self.fresh(i) for i in inputs) and \
+            self.keys[name] == tuple(self.versions[i] for i in inputs)
+
+    def get(self, name):
+        """
+        Returns the value of name, computing it, and any stages it depends on, if out of date
+        """
+        if name not in self.stages:
+            return self.values[name]
+        key = self.key(name)
+        if self.keys.get(name) != key:
+            fn, inputs = self.stages[name]
+            self.store(name, fn(*[self.values[i] for i in inputs]), key)
+            self.computed[name] += 1
+        return self.values[name]
+
+    def store(self, name, value, key):
+        """
+        Stores the value of stage name computed elsewhere, e.g. on another thread, from inputs at the
+        versions key gives; if they have changed since, it is computed again when next asked for
+        """
+        self.values[name] = value
+        self.versions[name] += 1
+        self.keys[name] = key
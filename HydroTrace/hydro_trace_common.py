@@ -10,88 +10,399 @@ __email__ = "matthew.roy@manchester.ac.uk"
 __status__ = "Experimental"
 __copyright__ = "(c) M. J. Roy, 2019-2020"
 
-import sys, os.path, shutil, yaml
-import subprocess as sp
-from pkg_resources import Requirement, resource_filename
+import io, os.path
+from importlib.resources import files
 import numpy as np
-import scipy.io as sio
-from scipy.interpolate import interp1d
-from datetime import datetime, timedelta
-import matplotlib.dates as mdates
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
-from PyQt5.QtWidgets import *
+from HydroTrace.profiling import span, traced
 
-def read_cs_file(fname):
+def resource_path(name):
     """
-    Reads the first two 'paragraphs' of a chem station file, returning the 
-    following numpy arrays: int_run and area from the second paragraph and 
-    dt, a list of datetime objects. The total number of runs can be indexed 
-    from dt.
+    Returns the path of a file installed with HydroTrace, e.g. 'meta/icon.png'
     """
-    try:
-        #get lines where data tables start and stop
-        line_flag = []
-        with open(fname, encoding='utf16') as f:
-            for num, line in enumerate(f, 1):
-                if "---|" in line:
-                    line_flag.append(num)
-        line_flag = np.asarray(line_flag)
-
-
-        #run through the file again with specific formatting applied
-        dt = [] #date time for all runs
-        int_run = [] #integrated run number
-        area = []
-        with open(fname, encoding='utf16') as f:
-            i=1
-            for num, line in enumerate(f, 1):
-                if line_flag[0] < num < line_flag[1]-6: #1st paragraph
-                    ls = line.strip().split()
-                    dt.append(datetime.strptime(ls[3]+" "+ls[4],'%d/%m/%Y %H:%M:%S'))
-                if line_flag[1] < num < line_flag[2]-8: #2nd paragraph
-                    ls = line.strip().split()
+    return str(files('HydroTrace').joinpath(name))
+
+def __getattr__(name):
+    #file dialogs and the settings dialog were moved to dialogs, which imports PyQt5 on first use
+    if name in ('get_file', 'get_save_file', 'Ui_get_config_dialog'):
+        from HydroTrace import dialogs
+        return getattr(dialogs, name)
+    raise AttributeError("module %r has no attribute %r"%(__name__, name))
+
+class Cancelled(Exception):
+    """
+    Raised from progress callbacks to stop a long running read or calculation
+    """
+    pass
+
+class ChemStationError(ValueError):
+    """
+    Raised by parse_cs_file when a Chem Station report can't be read, lineno is the offending line
+    """
+    def __init__(self, fname, lineno, msg):
+        self.fname = fname
+        self.lineno = lineno
+        ValueError.__init__(self, '%s, line %d: %s'%(fname,lineno,msg))
+
+def parse_cs_file(fname):
+    """
+    Single pass parser for Chem Station reports. The sequence table is the first '---|' delimited
+    table with an injection Date/Time column and runs until a blank line; the area table is the one
+    headed 'Peak area' and runs until its '-----' footer. Reading stops once both are found. Returns
+    int_run (int64), area (float64) and dt (datetime64[s]) numpy arrays, raises ChemStationError with
+    the line number on failure.
+    """
+    state = 'seek' #seek -> seq -> seek -> area -> done
+    prev = ['','']  #two lines preceding a delimiter form the table header
+    stamps, int_run, area = [], [], []
+    num = 0
+    with open(fname, encoding='utf16') as f:
+        for num, line in enumerate(f, 1):
+            line = line.strip()
+            if state == 'seek':
+                if line.startswith('---|'):
+                    if not stamps and 'Date/Time' in prev[0]:
+                        state = 'seq'
+                    elif stamps and 'Peak area' in prev[0]:
+                        state = 'area'
+                prev = [prev[1], line]
+            elif state == 'seq':
+                if line == '':
+                    if not stamps:
+                        raise ChemStationError(fname, num, 'sequence table is empty.')
+                    state = 'seek'
+                    continue
+                ls = line.split()
+                try:
+                    d, m, y = ls[3].split('/')
+                    hh, mm, ss = ls[4].split(':')
+                    stamps.append((int(d), int(m), int(y), int(hh), int(mm), int(ss)))
+                except (IndexError, ValueError):
+                    raise ChemStationError(fname, num, 'expected injection date/time, got "%s".'%line)
+            elif state == 'area':
+                if line == '' or line.startswith('-'):
+                    state = 'done'
+                    break
+                ls = line.split()
+                try:
                     int_run.append(int(ls[0]))
                     area.append(float(ls[1]))
-        
-        int_run = np.asarray(int_run)
-        area = np.asarray(area)
-        return int_run, area, dt #total number of runs indexed off of dt
-    except:
-        return None, None, None
+                except (IndexError, ValueError):
+                    raise ChemStationError(fname, num, 'expected run number and peak area, got "%s".'%line)
+    if state != 'done':
+        missing = 'sequence' if not stamps else 'peak area'
+        raise ChemStationError(fname, num, 'end of file reached without a complete %s table.'%missing)
+    
+    dt = pico_epoch(*np.array(stamps, dtype=np.int64).T)
+    return np.array(int_run, dtype=np.int64), np.array(area, dtype=np.float64), dt
+
+def _cached(fname, parser, tag, cache):
+    """
+    Returns parser(fname) through the parsed file cache (see HydroTrace.cache): the default one if
+    cache is True, otherwise the FileCache given. fname is parsed directly if cache is False or the
+    default cache can't be created.
+    """
+    if cache is True:
+        from HydroTrace.cache import get_cache #imported here as it imports this module
+        try:
+            cache = get_cache()
+        except OSError:
+            cache = None
+    return cache.load(fname, parser, tag) if cache else parser(fname)
 
-def read_pico_csv(fname):
+def read_cs_file(fname, cache = True):
+    """
+    Reads the first two 'paragraphs' of a chem station file, returning the 
+    following numpy arrays: int_run and area from the second paragraph and 
+    dt, a datetime64[s] array. The total number of runs can be indexed 
+    from dt. Returns None for each if the file could not be read, reporting why.
+    The arrays are kept in the parsed file cache, as for _cached, and read only
+    if they come from it.
+    """
+    with span('read_cs_file', file = fname) as s:
+        try:
+            int_run, area, dt = _cached(fname, parse_cs_file, 'cs1', cache) #total number of runs indexed off of dt
+        except (OSError, UnicodeError, ChemStationError) as e:
+            print(e)
+            return None, None, None
+        s['rows'] = len(dt)
+        return int_run, area, dt
+
+def read_pico_csv(fname, cache = True):
     """
     Reads a csv file generated by Pico's PLW2CSV.exe function reads second (datetime) and third (temp) columns
-    returns a numpy array of temperatures and an array of datetime objects
+    returns a numpy array of temperatures and an array of datetime objects. The record is kept in the parsed
+    file cache as for read_cs_file.
     """
-    try:
-        dt = []
-        temp = []
-        with open(fname) as f:
-            for num, line in enumerate(f,1):
-                if num > 1: #skip first line
-                    ls = line.split(',')
-                    dt.append(datetime.strptime(ls[1],'%d/%m/%Y %H:%M:%S'))
-                    temp.append(float(ls[2]))
-        return np.asarray(temp), dt
-    except:
+    temp, dt = _cached(fname, read_pico_csv_bulk, 'bulk1', cache)
+    if temp is None:
         return None, None
+    with span('datetime conversion', rows = len(dt)):
+        return temp, dt.astype(object).tolist()
+
+#maps the separators in a Pico record onto commas so that each block of rows can be read as a flat run of numbers
+_pico_sep = str.maketrans({'/':',', ' ':',', ':':',', '\n':',', '\r':None})
+#as _pico_sep, keeping rows on their own lines
+_pico_fields = str.maketrans({'/':',', ' ':',', ':':','})
+
+def _pico_block(lines, nfield, usecols = None):
+    """
+    Converts a list of lines from a Pico csv into an (n,nfield) float array. If usecols is given, only
+    those columns are converted, with the others skipped, giving an (n,len(usecols)) array.
+    """
+    if usecols is not None:
+        text = ''.join(lines).translate(_pico_fields)
+        if text.strip() == '':
+            return np.empty((0,len(usecols)))
+        return np.loadtxt(io.StringIO(text), delimiter=',', usecols=usecols, comments=None, ndmin=2)
+    text = ''.join(lines).translate(_pico_sep).strip(',')
+    if text == '':
+        return np.empty((0,nfield))
+    vals = np.fromstring(text, sep=',')
+    if vals.size % nfield != 0:
+        raise ValueError('Malformed Pico record, %d values do not divide into rows of %d.'%(vals.size,nfield))
+    return vals.reshape(-1,nfield)
+
+def pico_header(fname):
+    """
+    Returns the names of the channels recorded in a Pico csv, e.g. ['Channel 1 (°C)']
+    """
+    with open(fname, encoding='latin-1') as f:
+        header = f.readline()
+    return [h.strip() for h in header.rstrip('\r\n').split(',')[2:]]
+
+def pico_columns(names, channels):
+    """
+    Returns the indices in names, from pico_header, of channels: a list of header names, with or without
+    the unit, e.g. 'Channel 2', or indices. A single name or index may be given, None selects all.
+    """
+    if channels is None:
+        return list(range(len(names)))
+    if isinstance(channels, (str, int, np.integer)):
+        channels = [channels]
+    bare = [n.split('(')[0].strip() for n in names]
+    cols = []
+    for c in channels:
+        if isinstance(c, (int, np.integer)) and 0 <= c < len(names):
+            cols.append(int(c))
+        elif isinstance(c, str) and c.strip() in names:
+            cols.append(names.index(c.strip()))
+        elif isinstance(c, str) and c.strip() in bare:
+            cols.append(bare.index(c.strip()))
+        else:
+            raise ValueError('No channel %s, the record has %s.'%(c, ', '.join(names)))
+    return cols
+
+def pico_epoch(d,m,y,hh,mm,ss):
+    """
+    Converts arrays of day, month, year, hour, minute and second values into a datetime64[s] array
+    """
+    months = (np.asarray(y,dtype=np.int64)-1970)*12 + np.asarray(m,dtype=np.int64)-1
+    days = months.astype('datetime64[M]').astype('datetime64[D]') + (np.asarray(d,dtype=np.int64)-1)
+    return days.astype('datetime64[s]') + (np.asarray(hh,dtype=np.int64)*3600
+        + np.asarray(mm,dtype=np.int64)*60 + np.asarray(ss,dtype=np.int64))
+
+def _pico_layout(header, channels):
+    """
+    Returns the names of channels (see pico_columns) in the header line of a Pico csv, the number of
+    fields in each row and the columns to convert for them, None if all are needed
+    """
+    #sample number, 6 date/time fields and the remaining channels
+    nfield = header.count(',') + 6
+    names = [h.strip() for h in header.rstrip('\r\n').split(',')[2:]]
+    cols = pico_columns(names, channels)
+    usecols = None if cols == list(range(nfield-7)) else tuple(range(1,7)) + tuple(7+c for c in cols)
+    return [names[c] for c in cols], nfield, usecols
 
+def _pico_rows(lines, nfield, usecols, dtype):
+    """
+    Converts lines from a Pico csv laid out as given by _pico_layout, returning a datetime64[s] array
+    and an array of dtype with a column for each channel
+    """
+    block = _pico_block(lines,nfield,usecols)
+    if usecols is None:
+        block = block[:,1:]
+    return pico_epoch(*block[:,:6].T), block[:,6:].astype(dtype, copy=False)
+
+def read_pico_channels(fname, channels = None, block_size = 1<<24, progress = None, dtype = np.float64):
+    """
+    Reads the channels (see pico_columns, default: all) of a Pico csv in blocks of approximately
+    block_size bytes, parsing the non-zero padded d/m/Y H:M:S stamps in each with array operations.
+    Columns of other channels are skipped rather than converted. Returns the channel names, an
+    (n,len(channels)) array of their values, of dtype, and a datetime64[s] array. If given, progress is called
+    with the fraction of the file read after each block, and may raise Cancelled to stop reading.
+    """
+    with span('read_pico_channels', file = fname) as s:
+        try:
+            temp = []
+            dt = []
+            size = max(os.path.getsize(fname),1)
+            with open(fname, encoding='latin-1') as f:
+                header = f.readline()
+                names, nfield, usecols = _pico_layout(header, channels)
+                nread = len(header)
+                while True:
+                    lines = f.readlines(block_size)
+                    if not lines:
+                        break
+                    d, t = _pico_rows(lines,nfield,usecols,dtype)
+                    dt.append(d)
+                    temp.append(t)
+                    if progress is not None:
+                        nread += sum(len(l) for l in lines)
+                        progress(min(nread/size,1.0))
+            s['rows'] = sum(len(d) for d in dt)
+            s['channels'] = len(names)
+            if not dt:
+                return names, np.empty((0,len(names)),dtype=dtype), np.empty(0,dtype='datetime64[s]')
+            return names, np.concatenate(temp), np.concatenate(dt)
+        except Cancelled:
+            raise
+        except Exception as e:
+            print(e)
+            return None, None, None
+
+def read_pico_csv_bulk(fname, block_size = 1<<24, progress = None, channel = None):
+    """
+    Bulk version of read_pico_csv, see read_pico_channels. Returns a numpy array of temperatures
+    from channel (default: the first), a header name or index, or the mean of a list of channels,
+    and a datetime64[s] array, dt.view(np.int64) gives epoch seconds.
+    """
+    names, temp, dt = read_pico_channels(fname, 0 if channel is None else channel, block_size, progress)
+    if temp is None:
+        return None, None
+    return np.ascontiguousarray(temp[:,0] if temp.shape[1] == 1 else temp.mean(axis=1)), dt
+
+def interp_epoch(t0,d0,t1,delay=0,out_of_range='nan'):
+    """
+    Linearly interpolates d0 recorded at sorted int64 epoch times t0 onto int64 epoch times t1,
+    with the record t0 delayed by delay (same units as t0, may be fractional). Rather than shifting
+    t0, t1 is shifted back so neither t0 nor d0 are copied; cost is O(m log n) for m values of t1.
+    delay may also be an array which broadcasts against t1, e.g. shape (k,1) for k delays.
+    Values of t1 outside the delayed record are treated according to out_of_range: 'nan' fills
+    them with nan, 'clip' takes the nearest recorded value and 'raise' raises a ValueError.
+    """
+    t0 = np.asarray(t0)
+    t1 = np.asarray(t1, dtype=np.int64)
+    if t0.size < 2:
+        raise ValueError('At least two recorded values are needed to interpolate.')
+    if out_of_range not in ('nan','clip','raise'):
+        raise ValueError('Unknown out_of_range policy %s.'%out_of_range)
+    #split the delay so that the search is carried out on integers; as t0 is integer,
+    #t0 <= q - frac is the same as t0 <= q - 1 for any fractional part
+    whole = np.floor(delay).astype(np.int64)
+    frac = delay - whole
+    q = t1 - whole
+    hi = np.clip(np.searchsorted(t0, q - (frac > 0), side='right'), 1, t0.size-1)
+    lo = hi - 1
+    width = (t0[hi] - t0[lo]).astype(np.float64)
+    w = np.divide((q - t0[lo]) - frac, width, out=np.zeros(width.shape), where=width>0)
+    out = d0[lo] + w*(d0[hi] - d0[lo])
+    x = (q - t0[0]) - frac #position relative to the start of the record
+    outside = (x < 0) | (x > t0[-1] - t0[0])
+    if outside.any():
+        if out_of_range == 'raise':
+            raise ValueError('%d of %d interpolation times are outside of the recorded range.'%(outside.sum(),t1.size))
+        elif out_of_range == 'nan':
+            out[outside] = np.nan
+        else:
+            out = np.where(x < 0, d0[0], np.where(x > t0[-1] - t0[0], d0[-1], out))
+    return out
+
+def _epoch(when):
+    """
+    Converts epoch seconds, or a date/time string, datetime or datetime64 into epoch seconds
+    """
+    if isinstance(when, (int, np.integer)):
+        return int(when)
+    return int(np.datetime64(when, 's').astype(np.int64))
+
+@traced()
 def interp_datetime(dt0,d0,dt1):
     """
     Linearly interpolates d0 over datetime array dt1 with input datetime array dt0
     Returns interpolated values. Assumes min and max values in dt0 exceed that of dt1
     """
+    import matplotlib.dates as mdates
     try:
-        dt0 = mdates.date2num(dt0)
-        dt1 = mdates.date2num(dt1)
-        f = interp1d(dt0,d0)
-        return f(dt1), dt1
+        t0 = np.asarray(dt0,dtype='datetime64[us]').view(np.int64)
+        t1 = np.asarray(dt1,dtype='datetime64[us]')
+        return interp_epoch(t0,d0,t1.view(np.int64),out_of_range='raise'), mdates.date2num(t1)
     except Exception as e:
         print(e)
         return None, None
 
+@traced()
+def align_temp(temp,temp_dt,dt,int_run,delay,out_of_range='nan'):
+    """
+    Interpolates the temperature record temp, temp_dt delayed by delay minutes, onto the GC injection
+    times dt indexed by int_run. Returns the interpolated temperatures and the GC (common) and
+    temperature record times in minutes, zeroed on the earliest time in either record. GC times
+    outside of the delayed record are treated according to out_of_range, see interp_epoch.
+    """
+    t0 = np.asarray(temp_dt,dtype='datetime64[s]').view(np.int64)
+    t1 = np.asarray(dt,dtype='datetime64[s]')[int_run+1].view(np.int64)
+    common_temp = interp_epoch(t0,temp,t1,delay*60,out_of_range)
+    #zero off of earliest time and convert to minutes
+    mintime = min(t1.min(),t0[0])
+    return common_temp, (t1 - mintime)/60, (t0 - mintime)/60
+
+def delay_cost(common_temp,d_rate,time=None):
+    """
+    Misfit of desorbtion rate d_rate to the temperature for each row of common_temp: the fraction of
+    the variance of d_rate left by a least squares fit of a quadratic in temperature plus a drift
+    linear in time (the GC run times, default: run number), which takes up the depletion of the sample
+    through a hold. As the rate follows the temperature with the delay of the gas reaching the GC, the
+    fit is best when the change from ramp to hold in the aligned temperature lines up with that in the
+    rate. Insensitive to the scale of d_rate. Rows containing nan, i.e. GC runs outside of the
+    temperature record, are given inf.
+    """
+    common_temp = np.atleast_2d(common_temp)
+    d_rate = np.asarray(d_rate,dtype=np.float64)
+    n = common_temp.shape[1]
+    time = np.arange(n,dtype=np.float64) if time is None else np.asarray(time,dtype=np.float64)
+    cost = np.full(len(common_temp), np.inf)
+    valid = ~np.isnan(common_temp).any(axis=1)
+    y = d_rate - d_rate.mean()
+    if not valid.any() or n < 5 or not y.any():
+        return cost
+    #standardised columns keep the normal equations well conditioned, solved for all delays at once
+    T = common_temp[valid]
+    T = (T - T.mean(axis=1,keepdims=True))/np.maximum(T.std(axis=1,keepdims=True),1e-12)
+    t = np.broadcast_to((time - time.mean())/max(time.std(),1e-12), T.shape)
+    X = np.stack((np.ones_like(T), T, T**2, t), axis=2)
+    XtX = np.einsum('kni,knj->kij', X, X)
+    Xty = np.einsum('kni,n->ki', X, y)
+    try:
+        coef = np.linalg.solve(XtX, Xty[...,None])[...,0]
+    except np.linalg.LinAlgError:
+        coef = np.stack([np.linalg.lstsq(a, b, rcond=None)[0] for a, b in zip(XtX, Xty)])
+    resid = y - np.einsum('kni,ki->kn', X, coef)
+    cost[valid] = np.sum(resid**2,axis=1)/np.sum(y**2)
+    return cost
+
+@traced()
+def calibrate_delay(temp,temp_dt,dt,int_run,d_rate,delays=None,cost=delay_cost):
+    """
+    Evaluates cost(common_temp,d_rate) for the temperature record aligned onto the GC runs at each
+    of delays (minutes, default 0-30 in 0.01 increments) in one pass, with common_temp of shape
+    (len(delays),len(int_run)); the default cost is also given the GC run times in minutes. As it is
+    insensitive to scale, area from read_cs_file can be used for d_rate. Returns the delay with the
+    lowest cost, the delays and their cost.
+    """
+    if delays is None:
+        delays = np.arange(0,3001)*0.01
+    delays = np.asarray(delays,dtype=np.float64)
+    t0 = np.asarray(temp_dt,dtype='datetime64[s]').view(np.int64)
+    t1 = np.asarray(dt,dtype='datetime64[s]')[int_run+1].view(np.int64)
+    common_temp = interp_epoch(t0,temp,t1,delays[:,None]*60,'nan')
+    if cost is delay_cost:
+        c = delay_cost(common_temp,d_rate,(t1-t1[0])/60)
+    else:
+        c = cost(common_temp,d_rate)
+    if np.isinf(c).all():
+        return None, delays, c
+    return delays[np.argmin(c)], delays, c
+
 def calc_total(hsc,std_pa,w,cgas,frate,ctime,area):
     """
     With H std content in ppm(hsc), H std peak area (std_pa), weight in g(w), carrier gas µmol/s (cgas),
@@ -107,101 +418,3 @@ def calc_desorbtion_rate(hsc,std_pa,w,cgas,frate,area):
     hydrogen desorbtion rate in ppm/min
     """
     return (hsc*frate*(cgas*1e-6)*12/(std_pa*w))*area
-    
-def get_file(*args):
-    '''
-    Returns absolute path to filename and the directory it is located in from a PyQt5 filedialog. First value is file extension, second is a string which overwrites the window message.
-    '''
-    ext = args[0]
-    if len(args)>1:
-        launchdir = args[1]
-    else: launchdir = os.getcwd()
-    ftypeName={}
-    ftypeName['*.txt']=["Chem Station file:", "*.txt", "TXT File"]
-    ftypeName['*.csv']=["Pico-generated csv file:", "*.csv", "CSV File"]
-        
-    filer = QFileDialog.getOpenFileName(None, ftypeName[ext][0], 
-         os.getcwd(),(ftypeName[ext][2]+' ('+ftypeName[ext][1]+');;All Files (*.*)'))
-
-    if filer[0] == '':
-        filer = None
-        startdir = None
-        return filer, startdir
-        
-    else: #return the filename/path
-        return filer[0], os.path.dirname(filer[0])
-
-def get_save_file(ext,outputd):
-    '''
-    Returns a the complete path to the file name with ext, starting in outputd. Checks extensions and if an extension is not imposed, it will write the appropriate extension based on ext.
-    '''
-    ftypeName={}
-    ftypeName['*.htd']='Comma delimited HydroTrace data file'
-
-    
-    if outputd==None: id=str(os.getcwd())
-    else: id=outputd
-    lapp = QApplication.instance()
-    if lapp is None:
-        lapp = QApplication([])
-
-    filer, _ = QFileDialog.getSaveFileName(None, "Save as:", id,str(ftypeName[ext]+' ('+ext+')'))
-
-    if filer == '':
-        return None, None
-    else:
-        return filer, os.path.dirname(filer)
-
-class Ui_get_config_dialog(object):
-    """
-    Generates the pop-up window to manage default settings
-    """
-    def setupUi(self, get_config_dialog):
-        # getFEAconfigDialog.resize(200, 200)
-        get_config_dialog.setWindowTitle('Standard settings')
-        get_config_dialog.setWindowIcon(QIcon(resource_filename("HydroTrace","meta/icon.png")))
-        layout = QGridLayout(get_config_dialog)
-        self.pushButton = QPushButton('Update')
-        H_std_content_label = QLabel("Hydrogen standard content (ppm):")
-        self.H_std_content=QDoubleSpinBox(get_config_dialog)
-        Carrier_gas_molar_rate_label = QLabel("Carrier gas molar flow rate (µmol/s):")
-        self.Carrier_gas_molar_rate=QDoubleSpinBox(get_config_dialog)
-        
-        self.file_loc = QLabel(get_config_dialog)
-        self.file_loc.setFont(QFont("Helvetica",italic=True))
-        self.file_loc.setWordWrap(True)
-        
-        layout.addWidget(H_std_content_label,0,0,1,1)
-        layout.addWidget(self.H_std_content,0,1,1,1)
-        layout.addWidget(Carrier_gas_molar_rate_label,1,0,1,1)
-        layout.addWidget(self.Carrier_gas_molar_rate,1,1,1,1)
-        
-        
-        
-        layout.addWidget(self.pushButton,2,1,1,1)
-        layout.addWidget(self.file_loc,3,0,1,2)
-        
-        self.pushButton.clicked.connect(lambda: self.make_config_change(get_config_dialog))
-
-
-    def make_config_change(self, get_config_dialog):
-        """
-        Imposes configuration changes.
-        """
-        try:
-
-            data= dict(FlowSettings = 
-            dict( 
-            content = self.H_std_content.value(), #61.00
-            molar_rate = self.Carrier_gas_molar_rate.value() #7.44e-6
-            )
-            )
-            with open(str(self.file_loc.text()), 'w') as outfile:
-                yaml.dump(data, outfile, default_flow_style=False)
-
-        except:
-            print("Configuration change failed.")
-            
-
-        get_config_dialog.close()
-
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser run library
+-------------------------------------------------------------------------------
+Keeps processed runs in an indexed SQLite database: run parameters, results and
+summary statistics in one table for querying, and the aligned time, temperature
+and desorbtion rate records as blobs in another, so that runs can be found and
+their curves overlaid without the original GC or temperature files, e.g.:
+
+>python -m HydroTrace.library add results/*.htb --material "Alloy 718"
+>python -m HydroTrace.library query --material "Alloy 718" --since 2020-01-01 --min-total 1 --plot overlay.png
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, sys, time, glob, argparse, hashlib, json, sqlite3
+import numpy as np
+from HydroTrace.hydro_trace_common import _epoch
+from HydroTrace.runfile import read_run
+
+_schema = '''
+create table if not exists runs (
+    id integer primary key,
+    key text unique,
+    name text,
+    material text,
+    sample text,
+    started real,
+    ingested real,
+    gc_path text, gc_hash text,
+    temp_path text, temp_hash text,
+    channel text,
+    content real, molar_rate real, spa real, weight real, rate real, cycletime real, delay real,
+    total real,
+    peak_rate real,
+    peak_temp real,
+    max_temp real,
+    n_runs integer,
+    notes text
+);
+create index if not exists runs_material on runs (material, started);
+create index if not exists runs_started on runs (started);
+create index if not exists runs_total on runs (total);
+create index if not exists runs_peak_temp on runs (peak_temp);
+create table if not exists curves (
+    id integer primary key references runs (id) on delete cascade,
+    common_time blob,
+    common_temp blob,
+    d_rate blob
+);
+'''
+
+param_names = ['content','molar_rate','spa','weight','rate','cycletime','delay']
+
+def default_library():
+    """
+    Returns the library location, HYDROTRACE_LIBRARY if set, otherwise in a per-user data directory
+    """
+    if os.environ.get('HYDROTRACE_LIBRARY'):
+        return os.environ['HYDROTRACE_LIBRARY']
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_DATA_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'HydroTrace', 'library.sqlite')
+
+class RunLibrary(object):
+    """
+    SQLite run library at path (default: default_library()). Use as a context manager, or call close.
+    """
+    def __init__(self, path = None):
+        self.path = default_library() if path is None else path
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('pragma foreign_keys = on')
+        self.db.executescript(_schema)
+
+    def add(self, params, common_time, common_temp, d_rate, total = None, name = None, material = None,
+        sample = None, started = None, sources = None, channel = None, notes = None, reduction = None):
+        """
+        Adds a processed run, params being a dict of param_names as stored by runfile.run_meta and
+        sources and reduction its 'sources' and 'reduction' entries. A run with the same name, sources,
+        channel, reduction and parameters replaces that already held, so that processing again updates
+        it while the same files processed as differently named runs, or reduced differently, are kept
+        apart. Peak desorbtion rate, the temperature it occurs at and the maximum temperature are found
+        from the curves. Returns the id of the run.
+        """
+        common_time = np.ascontiguousarray(common_time, dtype = '<f8')
+        common_temp = np.ascontiguousarray(common_temp, dtype = '<f8')
+        d_rate = np.ascontiguousarray(d_rate, dtype = '<f8')
+        sources = sources or {}
+        gc, temp = sources.get('gc', {}), sources.get('temp', {})
+        if gc.get('hash') or temp.get('hash'):
+            key = json.dumps([name, gc.get('hash'), temp.get('hash'), channel, reduction,
+                [params.get(p) for p in param_names]], sort_keys = True)
+        else:
+            #without source hashes, runs are told apart by their curves
+            key = hashlib.blake2b(d_rate.tobytes() + common_temp.tobytes(), digest_size = 20).hexdigest()
+        valid = ~np.isnan(common_temp)
+        peak = np.argmax(np.where(valid, d_rate, -np.inf)) if valid.any() else None
+        row = dict(key = key, name = name, material = material, sample = sample,
+            started = None if started is None else _epoch(started), ingested = time.time(),
+            gc_path = gc.get('path'), gc_hash = gc.get('hash'), temp_path = temp.get('path'),
+            temp_hash = temp.get('hash'), channel = None if channel is None else json.dumps(channel),
+            total = total, peak_rate = None if peak is None else float(d_rate[peak]),
+            peak_temp = None if peak is None else float(common_temp[peak]),
+            max_temp = float(np.nanmax(common_temp)) if valid.any() else None,
+            n_runs = len(d_rate), notes = notes)
+        row.update((p, params.get(p)) for p in param_names)
+        with self.db:
+            self.db.execute('delete from runs where key = ?', (key,))
+            cur = self.db.execute('insert into runs (%s) values (%s)'%(','.join(row), ','.join('?'*len(row))),
+                list(row.values()))
+            self.db.execute('insert into curves values (?,?,?,?)', (cur.lastrowid, common_time.tobytes(),
+                common_temp.tobytes(), d_rate.tobytes()))
+        return cur.lastrowid
+
+    def add_run_file(self, fname, **kwargs):
+        """
+        Adds a run saved as .htb, keyword arguments are passed to add. The run is named after the
+        file and started at its first GC injection unless these are given.
+        """
+        columns, meta = read_run(fname)
+        kwargs.setdefault('name', os.path.splitext(os.path.basename(fname))[0])
+        if 'dt' in columns and 'int_run' in columns and len(columns['int_run']):
+            kwargs.setdefault('started', columns['dt'][columns['int_run']+1].min())
+        return self.add(meta['params'], columns['common_time'], columns['common_temp'], columns['d_rate'],
+            total = meta.get('total'), sources = meta.get('sources'), channel = meta.get('channel'),
+            reduction = meta.get('reduction'), **kwargs)
+
+    def query(self, material = None, name = None, since = None, until = None, min_total = None,
+        max_total = None, min_peak_temp = None, max_peak_temp = None, order = 'started'):
+        """
+        Returns a list of dicts of the runs matching all of the criteria given, where name and
+        material may contain % wildcards and since/until are dates, e.g. '2020-03-09'. Curves are not
+        read, see curves.
+        """
+        clauses, args = [], []
+        for column, op, value in (('material', '=', material), ('name', '=', name),
+            ('started', '>=', since), ('started', '<', until), ('total', '>=', min_total),
+            ('total', '<=', max_total), ('peak_temp', '>=', min_peak_temp), ('peak_temp', '<=', max_peak_temp)):
+            if value is not None:
+                if op == '=' and '%' in value:
+                    op = 'like'
+                clauses.append('%s %s ?'%(column, op))
+                args.append(_epoch(value) if column == 'started' else value)
+        if order not in ('started', 'total', 'peak_temp', 'name', 'id'):
+            raise ValueError('Cannot order runs by %s.'%order)
+        sql = 'select * from runs' + (' where ' + ' and '.join(clauses) if clauses else '') + ' order by ' + order
+        return [dict(r) for r in self.db.execute(sql, args)]
+
+    def curves(self, ids):
+        """
+        Returns a dict of run id to (common_time, common_temp, d_rate) arrays for each of ids
+        """
+        ids = list(ids)
+        found = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i+500]
+            for r in self.db.execute('select * from curves where id in (%s)'%','.join('?'*len(chunk)), chunk):
+                found[r['id']] = tuple(np.frombuffer(r[k], dtype = '<f8') for k in ('common_time', 'common_temp', 'd_rate'))
+        return found
+
+    def remove(self, run_id):
+        with self.db:
+            self.db.execute('delete from runs where id = ?', (run_id,))
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def plot_overlay(fname, rows, curves):
+    """
+    Writes an overlay of the desorbtion vs. temperature curves of rows from RunLibrary.query to fname
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize = (8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    for r in rows:
+        common_time, common_temp, d_rate = curves[r['id']]
+        ax.plot(common_temp, d_rate, 'o-', ms = 3, label = r['name'])
+    ax.set_xlabel('Temperature (°C)')
+    ax.set_ylabel('Desorbtion rate (ppm/min)')
+    ax.grid(True, which='major', color='#666666', linestyle='-')
+    if len(rows) <= 20:
+        ax.legend(loc = 'upper left')
+    fig.tight_layout()
+    fig.savefig(fname)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'python -m HydroTrace.library',
+        description = 'Adds processed HydroTrace runs to a library and queries it.')
+    parser.add_argument('--library', default = None, help = 'library file (default: %s)'%default_library())
+    commands = parser.add_subparsers(dest = 'command', required = True)
+    add = commands.add_parser('add', help = 'add .htb run files')
+    add.add_argument('files', nargs = '+')
+    add.add_argument('--material', default = None)
+    add.add_argument('--sample', default = None)
+    query = commands.add_parser('query', help = 'list runs, optionally overlaying their curves')
+    query.add_argument('--material', default = None, help = 'material, %% is a wildcard')
+    query.add_argument('--name', default = None, help = 'run name, %% is a wildcard')
+    query.add_argument('--since', default = None, help = 'first date, e.g. 2020-01-01')
+    query.add_argument('--until', default = None, help = 'date after the last')
+    query.add_argument('--min-total', type = float, default = None, help = 'minimum total hydrogen (ppm)')
+    query.add_argument('--max-total', type = float, default = None, help = 'maximum total hydrogen (ppm)')
+    query.add_argument('--plot', default = None, help = 'image file to overlay desorbtion vs. temperature curves in')
+    args = parser.parse_args(argv)
+
+    with RunLibrary(args.library) as lib:
+        if args.command == 'add':
+            files = [f for pattern in args.files for f in (glob.glob(pattern) or [pattern])]
+            for f in files:
+                lib.add_run_file(f, material = args.material, sample = args.sample)
+            print('Added %d runs.'%len(files))
+            return 0
+        rows = lib.query(material = args.material, name = args.name, since = args.since, until = args.until,
+            min_total = args.min_total, max_total = args.max_total)
+        for r in rows:
+            started = '' if r['started'] is None else str(np.datetime64(int(r['started']), 's'))
+            print('%6d %-24s %-16s %-19s %10.4f %8.1f'%(r['id'], r['name'], r['material'] or '', started,
+                r['total'] if r['total'] is not None else np.nan, r['peak_temp'] if r['peak_temp'] is not None else np.nan))
+        if args.plot is not None:
+            plot_overlay(args.plot, rows, lib.curves(r['id'] for r in rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
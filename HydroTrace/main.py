@@ -10,17 +10,25 @@ __email__ = "matthew.roy@manchester.ac.uk"
 __status__ = "Experimental"
 __copyright__ = "(c) M. J. Roy, 2019-2020"
 
-import os,io,sys,time,yaml,ctypes
-import subprocess as sp
-from pkg_resources import Requirement, resource_filename
+import os,sys,yaml,ctypes
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import scipy.io as sio
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-import matplotlib.pyplot as plt
 from PyQt5 import QtCore, QtGui, QtWidgets
 #Change following to local import for dev
 from HydroTrace.hydro_trace_common import *
+from HydroTrace.dialogs import get_file, get_save_file, Ui_get_config_dialog, Ui_delay_dialog
+from HydroTrace.cache import cached_read_cs_file, cached_read_pico_channels
+from HydroTrace.workers import Job, Prefetch
+from HydroTrace.sharedmem import SharedPool
+from HydroTrace.plotting import TempTabPlot, AreaPlot
+from HydroTrace.tail import LiveRun
+from HydroTrace.runfile import write_run, read_run, run_meta
+from HydroTrace.rundata import RunData, run_graph
+from HydroTrace.timeindex import read_pico_window
+from HydroTrace.resample import read_pico_reduced
+from HydroTrace.pairing import neighbours, record_spans, find_temperature, find_report
+from HydroTrace import profiling
+from HydroTrace.profiling import traced
 
         
 class HT_main_window(object):
@@ -28,13 +36,18 @@ class HT_main_window(object):
     Class to build qt interaction, setupUi builds
     """
     def setupUi(self, MainWindow):
+        #matplotlib's Qt backend is imported here rather than at startup so the splash screen shows first
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
         MainWindow.setObjectName("MainWindow")
         MainWindow.setWindowTitle(("HydroTrace - v%s" %__version__))
         MainWindow.setMinimumWidth(600)
         MainWindow.setMinimumHeight(600)
-        MainWindow.setWindowIcon(QtGui.QIcon(resource_filename("HydroTrace","meta/icon.png")))
-        myappid = 'mycompany.myproduct.subproduct.version' # arbitrary string
-        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid) #windows taskbar icon
+        MainWindow.setWindowIcon(QtGui.QIcon(resource_path("meta/icon.png")))
+        if hasattr(ctypes,'windll'):
+            myappid = 'mycompany.myproduct.subproduct.version' # arbitrary string
+            ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid) #windows taskbar icon
         self.centralwidget = QtWidgets.QWidget(MainWindow)
         self.tabWidget = QtWidgets.QTabWidget(self.centralwidget)
         self.mainLayout = QtWidgets.QVBoxLayout(self.centralwidget)
@@ -52,15 +65,18 @@ class HT_main_window(object):
         horizLine.setFrameStyle(QtWidgets.QFrame.HLine)
         image = QtWidgets.QLabel()
         image.setGeometry(QtCore.QRect(0, 0, 10, 10))
-        pixmap = QtGui.QPixmap(resource_filename("HydroTrace","meta/InstitutionLogo.png"))
+        pixmap = QtGui.QPixmap(resource_path("meta/InstitutionLogo.png"))
         pixmap.scaledToWidth(20)
         image.setPixmap(pixmap)
         image.show()
         self.settingsButton = QtWidgets.QPushButton('Settings')
+        self.cancelButton = QtWidgets.QPushButton('Cancel')
+        self.cancelButton.setEnabled(False)
         self.mainLayout.addWidget(horizLine)
         footerLayout = QtWidgets.QHBoxLayout()
         footerLayout.addWidget(image)
         footerLayout.addStretch()
+        footerLayout.addWidget(self.cancelButton)
         footerLayout.addWidget(self.settingsButton)
         self.mainLayout.addLayout(footerLayout)
         
@@ -83,6 +99,7 @@ class HT_main_window(object):
         horizLine1.setFrameStyle(QtWidgets.QFrame.HLine)
         
         self.reloadButton = QtWidgets.QPushButton('Load')
+        self.openPairButton = QtWidgets.QPushButton('Load with temperature')
         self.calcButton = QtWidgets.QPushButton('Calculate')
         self.calcButton.resize(self.calcButton.sizeHint())
         
@@ -103,6 +120,7 @@ class HT_main_window(object):
         #add widgets to ui
         
         mainUiBox.addWidget(self.reloadButton,0,0,1,1)
+        mainUiBox.addWidget(self.openPairButton,0,1,1,1)
         mainUiBox.addWidget(self.calcButton,1,0,1,1)
         for i in range(0,4):
             mainUiBox.addWidget(QtWidgets.QLabel(labels[i]),3+i,0,1,1)
@@ -120,10 +138,11 @@ class HT_main_window(object):
         
         
         #plot
-        self.figure1 = plt.figure(figsize=(2,2))
+        self.figure1 = Figure(figsize=(2,2))
         self.canvas1 = FigureCanvas(self.figure1)
+        self.areaPlot = AreaPlot(self.figure1)
         self.toolbar1 = NavigationToolbar(self.canvas1, self.ttltab)
-        plt_layout1 = QVBoxLayout()
+        plt_layout1 = QtWidgets.QVBoxLayout()
         plt_layout1.addWidget(self.canvas1)
         plt_layout1.addWidget(self.toolbar1)
         # plt_layout.addWidget(self.statLabel)
@@ -163,25 +182,65 @@ class HT_main_window(object):
         self.delay = QtWidgets.QDoubleSpinBox()
         self.delay.setValue(0)
         
+        self.autoDelayButton = QtWidgets.QPushButton('Auto delay')
+        self.autoDelayButton.setEnabled(False)
+        
         self.exportButton = QtWidgets.QPushButton('Export')
         self.exportButton.setEnabled(False)
         
+        self.followButton = QtWidgets.QPushButton('Follow')
+        self.followButton.setCheckable(True)
+        self.followTimer = QtCore.QTimer()
+        self.followTimer.setInterval(2000)
+        
+        self.openRunButton = QtWidgets.QPushButton('Open run')
+        
+        self.channel = QtWidgets.QComboBox()
+        self.channel.setEnabled(False)
+        
+        #reduction of the temperature record as it is read, see resample
+        self.resampleStep = QtWidgets.QSpinBox()
+        self.resampleStep.setRange(0,3600)
+        self.resampleStep.setSpecialValueText('As recorded')
+        self.smoothMethod = QtWidgets.QComboBox()
+        self.smoothMethod.addItems(['None', 'Moving average', 'Median', 'Savitzky-Golay'])
+        self.smoothWindow = QtWidgets.QSpinBox()
+        self.smoothWindow.setRange(3,999)
+        self.smoothWindow.setSingleStep(2)
+        self.smoothWindow.setValue(5)
+        
         tempUiButtonBox.addWidget(self.loadTempButton,0,0,1,1)
         tempUiButtonBox.addWidget(self.calcTempButton,0,1,1,1)
         tempUiButtonBox.addWidget(QtWidgets.QLabel("Temperature delay (m):"),1,0,1,1)
         tempUiButtonBox.addWidget(self.delay,1,1,1,1)
         tempUiButtonBox.addLayout(plottingBoxlayout,2,0,1,2)
-        tempUiButtonBox.addWidget(self.exportButton,4,0,1,1)
-        
-        tempUiButtonBox.addWidget(self.tempLabel,6,0,1,2)
+        tempUiButtonBox.addWidget(QtWidgets.QLabel("Temperature channel:"),3,0,1,1)
+        tempUiButtonBox.addWidget(self.channel,3,1,1,1)
+        tempUiButtonBox.addWidget(QtWidgets.QLabel("Resample (s):"),4,0,1,1)
+        tempUiButtonBox.addWidget(self.resampleStep,4,1,1,1)
+        tempUiButtonBox.addWidget(QtWidgets.QLabel("Smoothing:"),5,0,1,1)
+        tempUiButtonBox.addWidget(self.smoothMethod,5,1,1,1)
+        tempUiButtonBox.addWidget(QtWidgets.QLabel("Smoothing window:"),6,0,1,1)
+        tempUiButtonBox.addWidget(self.smoothWindow,6,1,1,1)
+        tempUiButtonBox.addWidget(self.exportButton,7,0,1,1)
+        tempUiButtonBox.addWidget(self.autoDelayButton,7,1,1,1)
+        tempUiButtonBox.addWidget(self.followButton,8,0,1,1)
+        tempUiButtonBox.addWidget(self.openRunButton,8,1,1,1)
+        
+        tempUiButtonBox.addWidget(self.tempLabel,9,0,1,2)
         
         tempmainlayout = QtWidgets.QHBoxLayout()
         
         #plot
-        self.figure2 = plt.figure(figsize=(2,2))
+        self.figure2 = Figure(figsize=(2,2))
         self.canvas2 = FigureCanvas(self.figure2)
+        self.tempPlot = TempTabPlot(self.figure2)
         self.toolbar2 = NavigationToolbar(self.canvas2, self.temptab)
-        plt_layout2 = QVBoxLayout()
+        if profiling.enabled:
+            #time redraws, which happen after the handlers asking for them have returned
+            self.canvas1.draw = traced('draw basic tab')(self.canvas1.draw)
+            self.canvas2.draw = traced('draw temperature tab')(self.canvas2.draw)
+        plt_layout2 = QtWidgets.QVBoxLayout()
         plt_layout2.addWidget(self.canvas2)
         plt_layout2.addWidget(self.toolbar2)
         # plt_layout.addWidget(self.statLabel)
@@ -196,15 +255,35 @@ class HT_main_window(object):
         #connections
         #------------------------------------------------------------
         self.reloadButton.clicked.connect(lambda: self.get_input_data())
+        self.openPairButton.clicked.connect(lambda: self.open_pair())
         self.loadTempButton.clicked.connect(lambda: self.get_input_temp_data())
         self.calcButton.clicked.connect(lambda: self.calc())
         self.calcTempButton.clicked.connect(lambda: self.calc_temp())
         self.exportButton.clicked.connect(lambda: self.export())
+        self.autoDelayButton.clicked.connect(lambda: self.auto_delay())
+        self.cancelButton.clicked.connect(lambda: self.cancel_job())
+        self.followButton.toggled.connect(self.follow)
+        self.openRunButton.clicked.connect(lambda: self.open_run())
+        self.channel.activated.connect(lambda i: self.select_channel())
+        self.followTimer.timeout.connect(lambda: self.follow_update())
+        self.job = None
+        self.run = RunData()
+        self.reduction = None
+        self.graph = run_graph()
+        #companion files read ahead, see start_prefetch
+        self.prefetch = None
+        QtWidgets.QApplication.instance().aboutToQuit.connect(lambda: self.claim_prefetch())
+        #parse and align in a worker process, handing arrays back through shared memory
+        self.pool = None
+        if os.environ.get('HYDROTRACE_PROCESS'):
+            self.pool = SharedPool()
+            QtWidgets.QApplication.instance().aboutToQuit.connect(self.pool.close)
         
         self.spa.valueChanged.connect(self.onValueChanged)
         self.weight.valueChanged.connect(self.onValueChanged)
         self.rate.valueChanged.connect(self.onValueChanged)
         self.cycletime.valueChanged.connect(self.onValueChanged)
+        self.delay.valueChanged.connect(self.onDelayChanged)
 
         self.DvsTempButton.clicked.connect(lambda: self.update_temptab_plot('DvsTemp'))
         self.DvsTimeButton.clicked.connect(lambda: self.update_temptab_plot('DvsTime'))
@@ -214,7 +293,7 @@ class HT_main_window(object):
         #load standards
         #------------------------------------------------------------
         try:
-            self.filec = resource_filename("HydroTrace","HydroTraceSettings.yml")
+            self.filec = resource_path("HydroTraceSettings.yml")
         except:
             print("Did not find config file in the installation directory.")
         try:
@@ -234,12 +313,67 @@ class HT_main_window(object):
                 sys.exit("Failed to set config file. Quitting.")
         self.settingsButton.clicked.connect(lambda: get_config([],self.filec))
         
+    def run_job(self, fn, done, label, msg):
+        """
+        Runs fn(progress) on a background thread, reporting progress with msg on label. Buttons which start other jobs are disabled until it completes, then done is called with the result of fn on the gui thread.
+        """
+        self.job_buttons = [self.reloadButton, self.openPairButton, self.calcButton, self.loadTempButton,
+            self.calcTempButton, self.autoDelayButton, self.exportButton, self.channel]
+        self.job_state = [b.isEnabled() for b in self.job_buttons]
+        for b in self.job_buttons:
+            b.setEnabled(False)
+        self.cancelButton.setEnabled(True)
+        label.setText(msg)
+        
+        def finished(result):
+            self._end_job()
+            done(result)
+        def failed(e):
+            self._end_job()
+            label.setText(e)
+        def cancelled():
+            self._end_job()
+            label.setText('Cancelled.')
+        
+        self.job = Job(traced(msg)(fn))
+        self.job.progress.connect(lambda f: label.setText('%s (%d%%)'%(msg,100*f)))
+        self.job.finished.connect(finished)
+        self.job.failed.connect(failed)
+        self.job.cancelled.connect(cancelled)
+        self.job.start()
+    
+    def background(self, fn, *args, **kwargs):
+        """
+        Returns fn(*args, **kwargs) as a job for run_job, called in the worker process where there is one, otherwise on the job's thread. fn is passed the job's progress callback if progress = True is given.
+        """
+        report = kwargs.pop('progress', False)
+        if self.pool is not None:
+            return lambda progress: self.pool.call(fn, args, kwargs, progress, report)
+        if report:
+            return lambda progress: fn(*args, progress = progress, **kwargs)
+        return lambda progress: fn(*args, **kwargs)
+    
+    def _end_job(self):
+        """
+        Restores buttons after a job
+        """
+        for b, state in zip(self.job_buttons, self.job_state):
+            b.setEnabled(state)
+        self.cancelButton.setEnabled(False)
+        self.job.wait()
+        self.job = None
+    
+    def cancel_job(self):
+        if self.job is not None:
+            self.job.cancel()
+    
+    @traced()
     def get_input_temp_data(self):
         """
-        Gets a valid temperature file
+        Gets a valid temperature file, reading it in the background. Once a GC file has been read, only the window of the temperature record around its runs is read. The record is resampled and/or smoothed as it is read if set on the ui. A record already read ahead by start_prefetch is taken as it is.
         """
         
-        filep,startdir=get_file('*.csv')
+        filep,startdir=get_file('*.csv',self.prefetch_path('temp'))
         if filep is None:
             return
         if not(os.path.isfile(filep)):
@@ -247,15 +381,73 @@ class HT_main_window(object):
             return
         
         if filep != None: #because filediag can be cancelled
-            self.temp_filename = filep
-            self.tempLabel.setText(filep)
-            self.temp, self.temp_dt = read_pico_csv(self.temp_filename)
+            reduction = self.temp_reduction()
+            has_gc = self.run.area is not None and len(self.run.area)
+            read = self.temp_reader(filep, reduction, self.run.temp_window() if has_gc else None)
+            if has_gc:
+                read = self.prefetched(read, filep, kind = 'temp', source = self.cs_filename, reduction = reduction)
+            def done(result):
+                if self.set_temp_data(filep, reduction, result) and not has_gc:
+                    self.start_prefetch('gc', filep)
+            self.run_job(read, done, self.tempLabel, 'Reading %s'%filep)
+    
+    def temp_reader(self, filep, reduction, window = None):
+        """
+        Returns the reading of temperature record filep as a job for run_job, reduced as given by temp_reduction, and only the part spanning window, epoch seconds (start, stop), if given
+        """
+        start, stop = (None, None) if window is None else window
+        if reduction is not None:
+            return self.background(read_pico_reduced, filep, start = start, stop = stop, progress = True,
+                dtype = np.float32, **reduction)
+        if window is not None:
+            return self.background(read_pico_window, filep, start, stop, progress = True, dtype = np.float32)
+        return self.background(cached_read_pico_channels, filep, progress = True, dtype = np.float32)
+    
+    def set_temp_data(self, filep, reduction, result):
+        """
+        Takes the temperature record read from filep, as read by temp_reader. Returns False if there isn't one.
+        """
+        names, channels, temp_dt = result
+        if channels is None:
+            self.tempLabel.setText('Could not read %s.'%filep)
+            return False
+        if len(channels) < 2:
+            self.tempLabel.setText('Temperature record does not span the GC runs.')
+            return False
+        self.run.set_temp(names, channels, temp_dt)
+        self.reduction = reduction
+        self.channel.clear()
+        self.channel.addItems(names + (['Mean of channels'] if len(names) > 1 else []))
+        self.channel.setEnabled(len(names) > 1)
+        self.select_channel()
+        self.temp_filename = filep
+        self.tempLabel.setText(filep)
+        return True
+    
+    def temp_reduction(self):
+        """
+        Returns the resampling and smoothing of temperature records set on the ui, as the keyword arguments of resample.pipeline, or None where records are taken as recorded
+        """
+        step = self.resampleStep.value() or None
+        method = [None, 'mean', 'median', 'savgol'][self.smoothMethod.currentIndex()]
+        if step is None and method is None:
+            return None
+        return dict(step = step, method = method, window = self.smoothWindow.value() | 1, order = 2)
+    
+    def select_channel(self):
+        """
+        Takes the temperature record from the channel selected, or the mean of all channels, clearing any results calculated with another
+        """
+        self.run.select_channel(self.channel.currentIndex())
+        self.tempPlot.clear()
+        self.canvas2.draw_idle()
         
+    @traced()
     def get_input_data(self):
         """
-        Gets a valid GC file and reads contents
+        Gets a valid GC file and reads contents in the background, then reads ahead the temperature record which goes with it, see start_prefetch
         """
-        filep,startdir=get_file('*.txt')
+        filep,startdir=get_file('*.txt',self.prefetch_path('gc'))
         if filep is None:
             return
         if not(os.path.isfile(filep)):
@@ -263,116 +455,408 @@ class HT_main_window(object):
             return
         
         if filep != None: #because filediag can be cancelled
-            self.cs_filename = filep
-            self.statLabel.setText(filep)
-            self.int_run, self.area, self.dt = read_cs_file(self.cs_filename)
-            self.onValueChanged
+            def done(result):
+                if self.set_gc_data(filep, result):
+                    self.start_prefetch('temp', filep)
+            read = self.prefetched(self.background(cached_read_cs_file, filep), filep, kind = 'gc')
+            self.run_job(read, done, self.statLabel, 'Reading %s'%filep)
+    
+    def set_gc_data(self, filep, result):
+        """
+        Takes the GC runs read from filep. Returns False if there are none.
+        """
+        int_run, area, dt = result
+        if area is None:
+            self.statLabel.setText('Could not read %s.'%filep)
+            return False
+        self.run.set_gc(int_run, area, dt)
+        self.cs_filename = filep
+        self.statLabel.setText(filep)
+        self.onValueChanged()
+        return True
+    
+    @traced()
+    def open_pair(self):
+        """
+        Gets a valid GC file and reads it along with the temperature record which goes with it, see pairing.find_temperature. The GC file is parsed while the records beside it are indexed, then the window of the record around its runs is read, unless it has already been read ahead.
+        """
+        filep,startdir=get_file('*.txt',self.prefetch_path('gc'))
+        if filep is None:
+            return
+        if not(os.path.isfile(filep)):
+            print('Data file invalid.')
+            return
+        
+        reduction = self.temp_reduction()
+        read_gc = self.background(cached_read_cs_file, filep)
+        prefetch = self.claim_prefetch(kind = 'temp', source = filep, reduction = reduction)
+        
+        def work(progress):
+            if prefetch is not None:
+                try:
+                    temp_path, temp = prefetch.result(progress)
+                except Cancelled:
+                    raise
+                except Exception:
+                    temp_path = None
+                if temp_path is not None:
+                    return read_gc(progress), temp_path, temp
+            with ThreadPoolExecutor(max_workers = 2) as pool:
+                gc = pool.submit(read_gc, progress)
+                spans = pool.submit(record_spans, neighbours(filep, '*.csv'))
+                gc, spans = gc.result(), spans.result()
+            int_run, area, dt = gc
+            if area is None or not len(area):
+                return gc, None, None
+            run = RunData()
+            run.set_gc(int_run, area, dt)
+            temp_path = find_temperature(filep, (int(run.run_epoch.min()), int(run.run_epoch.max())), spans)
+            if temp_path is None:
+                return gc, None, None
+            return gc, temp_path, self.temp_reader(temp_path, reduction, run.temp_window())(progress)
+        
+        def done(result):
+            gc, temp_path, temp = result
+            if not self.set_gc_data(filep, gc):
+                return
+            if temp_path is None:
+                self.tempLabel.setText('No temperature record found for %s.'%filep)
+            else:
+                self.set_temp_data(temp_path, reduction, temp)
+        
+        self.run_job(work, done, self.statLabel, 'Reading %s'%filep)
+    
+    def start_prefetch(self, kind, source):
+        """
+        Finds the temperature record (kind 'temp') or GC file (kind 'gc') which goes with source, the file just read, and reads it ahead in the background while the run's parameters are filled in, so that it's ready by the time it's asked for. Replaces any prefetch before.
+        """
+        self.claim_prefetch()
+        if kind == 'temp':
+            span = int(self.run.run_epoch.min()), int(self.run.run_epoch.max())
+            window = self.run.temp_window()
+            reduction = self.temp_reduction()
+            find = lambda: find_temperature(source, span)
+            read = lambda path: self.temp_reader(path, reduction, window)
+            tags = dict(kind = kind, source = source, reduction = reduction)
+        else:
+            find = lambda: find_report(source)
+            read = lambda path: self.background(cached_read_cs_file, path)
+            tags = dict(kind = kind, source = source)
+        
+        def fetch(progress):
+            path = find()
+            return path, None if path is None else read(path)(progress)
+        
+        prefetch = Prefetch(traced('prefetch')(fetch), **tags)
+        prefetch.ready.connect(lambda: self.prefetch_ready(prefetch))
+        self.prefetch = prefetch
+    
+    def prefetch_ready(self, prefetch):
+        """
+        Reports what a prefetch has read ahead, if it's still wanted
+        """
+        path = self.prefetch_path(prefetch.tags['kind'])
+        if prefetch is not self.prefetch or path is None or self.job is not None:
+            return
+        label = self.tempLabel if prefetch.tags['kind'] == 'temp' else self.statLabel
+        label.setText('Read ahead %s, load it to use it.'%path)
+    
+    def prefetch_path(self, kind):
+        """
+        Returns the file of kind the prefetch has read, if it has finished doing so, otherwise None
+        """
+        prefetch = self.prefetch
+        if prefetch is None or not prefetch.matches(kind = kind) or not prefetch.done():
+            return None
+        try:
+            return prefetch.result()[0]
+        except Exception:
+            return None
     
+    def claim_prefetch(self, **tags):
+        """
+        Hands over the prefetch, finished or not, where it matches tags, see Prefetch.matches. Otherwise it is cancelled, returning None. Given no tags, cancels it.
+        """
+        prefetch, self.prefetch = self.prefetch, None
+        if prefetch is None:
+            return None
+        if tags and prefetch.matches(**tags):
+            return prefetch
+        prefetch.cancel()
+        return None
+    
+    def prefetched(self, read, filep, **tags):
+        """
+        Returns read, a job for run_job reading filep, as a job taking what the prefetch read instead where it matches tags and read filep, waiting for it to finish if needs be
+        """
+        prefetch = self.claim_prefetch(**tags)
+        if prefetch is None:
+            return read
+        def work(progress):
+            try:
+                path, result = prefetch.result(progress)
+            except Cancelled:
+                raise
+            except Exception:
+                path = None
+            return result if path == filep else read(progress)
+        return work
+    
+    @traced()
     def export(self):
         """
-        Collects data from ui, gets a valid file to write to.
+        Collects data from ui, gets a valid file to write to. Writes either aligned columns as text (*.htd) or the complete run with parameters (*.htb).
         """
         
-        fileo,startdir=get_save_file('*.htd',None)
+        fileo,startdir=get_save_file(['*.htd','*.htb'],None)
         if fileo is None:
             return
         
-        if fileo != None: #because filediag can be cancelled
+        if fileo.endswith('.htb'):
+            params = (self.content, self.flowconst, self.spa.value(), self.weight.value(),
+                self.rate.value(), self.cycletime.value(), self.delay.value())
+            self.sync_graph()
+            total = self.graph.get('total')
+            meta = run_meta(*params, total = float(total), gc = getattr(self,'cs_filename',None),
+                temp = getattr(self,'temp_filename',None), channel = self.run.channel, reduction = self.reduction)
+            write_run(fileo, self.run.columns(), meta)
+        elif fileo != None: #because filediag can be cancelled
             np.savetxt(fileo,
-            np.column_stack((self.common_time,self.common_temp,self.d_rate)), 
+            np.column_stack((self.run.common_time,self.run.common_temp,self.run.d_rate)), 
             delimiter=',',
             header = "Time (min),Temp (°C), D_rate (ppm/min)")
     
+    @traced()
+    def open_run(self):
+        """
+        Restores a run exported as *.htb, including parameters, without reading the original files
+        """
+        filep,startdir=get_file('*.htb')
+        if filep is None:
+            return
+        try:
+            columns, meta = read_run(filep)
+        except (OSError, ValueError) as e:
+            self.tempLabel.setText(str(e))
+            return
+        params = meta['params']
+        for box, key in ((self.spa,'spa'), (self.weight,'weight'), (self.rate,'rate'),
+            (self.cycletime,'cycletime'), (self.delay,'delay')):
+            box.blockSignals(True)
+            box.setValue(params[key])
+            box.blockSignals(False)
+        self.run = RunData.from_columns(columns, meta.get('channel'))
+        self.reduction = meta.get('reduction')
+        self.sync_graph()
+        if self.run.common_temp is not None and self.run.temp is not None:
+            #aligned with the delay restored
+            self.graph.store('common_temp', self.run.common_temp, self.graph.key('common_temp'))
+        for key, attr in (('gc','cs_filename'), ('temp','temp_filename')):
+            if key in meta['sources']:
+                setattr(self, attr, meta['sources'][key]['path'])
+        if meta.get('total') is not None:
+            self.result.setText("%0.4f"%meta['total'])
+        self.channel.clear()
+        if self.run.channel is not None:
+            self.channel.addItem(self.run.channel if isinstance(self.run.channel, str) else 'Mean of channels')
+        self.channel.setEnabled(False)
+        self.calcTempButton.setEnabled(True)
+        self.autoDelayButton.setEnabled(True)
+        self.exportButton.setEnabled(True)
+        self.tempPlot.set_run(self.run)
+        self.DvsTempButton.setChecked(True)
+        self.update_temptab_plot('DvsTemp')
+        self.tempLabel.setText(filep)
+    
+    @traced()
     def calc(self):
         """
         Calculate total H content, make plot in tab 1
         """
-        if hasattr(self,'area'):
-            if self.area.any() != None:
-                ans = calc_total(self.content, self.spa.value(),self.weight.value(),
-                    self.flowconst,self.rate.value(),self.cycletime.value(),self.area)
-                self.result.setText("%0.4f"%ans)
+        if self.run.area is not None:
+            if len(self.run.area):
+                self.sync_graph()
+                self.result.setText("%0.4f"%self.graph.get('total'))
                 
                 #plot
-                self.figure1.clear()
-                
-                ax = self.figure1.add_subplot(111)
-                ax.scatter(self.int_run,self.area)
-                ax.set_xlabel('Run number')
-                ax.set_ylabel('Area (15 µV-s)')
-                ax.grid(b=True, which='major', color='#666666', linestyle='-')
-                ax.minorticks_on()
-                ax.grid(b=True, which='minor', color='#999999', linestyle='-', alpha=0.2)
-                self.figure1.tight_layout()
+                self.areaPlot.set_run(self.run)
                 self.canvas1.draw()
                 self.calcTempButton.setEnabled(True) #temperature calculation can happen
+                self.autoDelayButton.setEnabled(True)
             else:
                 self.statLabel.setText('Invalid data.')
         else: self.statLabel.setText('No data read from file.')
     
+    @traced()
     def calc_temp(self):
         """
-        Based on read-in temperature and datetime values, linearly interpolate these temperature values on a delayed delayed temperature datetime series. Zeroes overall time on the basis of the earliest datetime recorded between both GC and temperature records, converting time records from datetime to float values in minutes for plotting.
-        """
-        if hasattr(self,'temp'):
-            if self.temp.any() != None:
-                #get delay
-                tempdelay = timedelta(minutes=self.delay.value())
-                delayed_time = [tempdelay + times for times in self.temp_dt]
-                self.common_temp, self.common_time, = interp_datetime(delayed_time,self.temp,[self.dt[j] for j in self.int_run+1])
-                self.d_rate = calc_desorbtion_rate(self.content, self.spa.value(),self.weight.value(),
-                    self.flowconst,self.rate.value(),self.area)
-                #adjust mdates to minutes and zero off of earliest datetime
-                self.temp_time = mdates.date2num(self.temp_dt)
-                mintime = np.min(np.append(self.common_time,self.temp_time))
-                self.common_time = (self.common_time - mintime)*1440 #minutes
-                self.temp_time = (self.temp_time - mintime)*1440 #minutes
-                #update ui
-                self.DvsTempButton.setChecked(True)
-                self.update_temptab_plot('DvsTemp')
-                self.exportButton.setEnabled(True)
+        Based on read-in temperature and datetime values, linearly interpolate these temperature values on a delayed delayed temperature datetime series. Zeroes overall time on the basis of the earliest datetime recorded between both GC and temperature records, converting time records from datetime to float values in minutes for plotting. Calculation is carried out in the background.
+        """
+        if self.run.temp is not None:
+            if self.run.area is not None and self.spa.value() and self.weight.value():
+                #collect inputs on the gui thread, the graph is only used there
+                run = self.run
+                delay = self.delay.value()
+                self.sync_graph()
+                key = self.graph.key('common_temp')
+                held = self.graph.values['common_temp'] if self.graph.fresh('common_temp') else None
+                align = self.background(interp_epoch, run.temp_epoch, run.temp, run.run_epoch, delay*60, 'nan')
+                
+                def work(progress):
+                    common_temp = align(progress) if held is None else held
+                    progress(0.5)
+                    #derive times for plotting here rather than on the gui thread
+                    run.common_time, run.temp_time
+                    return common_temp
+                
+                def done(common_temp):
+                    self.graph.store('common_temp', common_temp, key)
+                    outside = np.isnan(common_temp).sum()
+                    if outside == len(common_temp):
+                        self.tempLabel.setText('Temperature record does not span the GC runs.')
+                        return
+                    elif outside:
+                        self.tempLabel.setText('%d GC runs are outside of the temperature record.'%outside)
+                    else:
+                        self.tempLabel.setText('Idle')
+                    run.common_temp, run.d_rate = self.graph.get('common_temp'), self.graph.get('d_rate')
+                    run.delay = delay
+                    self.tempPlot.set_run(run)
+                    #update ui
+                    self.DvsTempButton.setChecked(True)
+                    self.update_temptab_plot('DvsTemp')
+                    self.exportButton.setEnabled(True)
+                
+                self.run_job(work, done, self.tempLabel, 'Calculating')
             else:
                 self.tempLabel.setText('Invalid data.')
         else: self.tempLabel.setText('No data read from file.')
 
+    @traced()
+    def auto_delay(self):
+        """
+        Sweeps the temperature delay from 0 to 30 minutes in the background, then shows the cost of each delay for the one with the lowest, or another, to be accepted, recalculating with it if so
+        """
+        if self.run.temp is not None and self.run.area is not None:
+            run = self.run
+            delays = np.arange(0,3001)*0.01
+            
+            def done(result):
+                best, delays, cost = result
+                if best is None:
+                    self.tempLabel.setText('Temperature record does not span the GC runs for any delay.')
+                    return
+                delay = get_delay(delays, cost, best)
+                if delay is None:
+                    self.tempLabel.setText('Lowest cost at a delay of %0.2f min, not applied.'%best)
+                    return
+                self.delay.setValue(delay)
+                self.calc_temp()
+            
+            self.run_job(self.background(calibrate_delay, run.temp, run.temp_dt, run.dt, run.int_run, run.area, delays),
+                done, self.tempLabel, 'Evaluating %d delays'%len(delays))
+        else: self.tempLabel.setText('No data read from file.')
+
+    def follow(self, on):
+        """
+        Starts or stops following the loaded GC and temperature files while they are being written
+        """
+        if not on:
+            self.followTimer.stop()
+            self.live = None
+            self.tempLabel.setText('Idle')
+            return
+        if not (hasattr(self,'cs_filename') and hasattr(self,'temp_filename')):
+            self.tempLabel.setText('Load GC and temperature files to follow.')
+            self.followButton.setChecked(False)
+            return
+        self.live = LiveRun(self.cs_filename, self.temp_filename, *self.run_params(),
+            channel = self.run.channel)
+        self.follow_update()
+        self.followTimer.start()
+    
+    def run_params(self):
+        """
+        Returns parameters from the ui in the order taken by LiveRun
+        """
+        return (self.content, self.spa.value(), self.weight.value(), self.flowconst,
+            self.rate.value(), self.cycletime.value(), self.delay.value())
+    
+    @traced()
+    def follow_update(self):
+        """
+        Picks up any new data from followed files, updating the result and plots
+        """
+        live = self.live
+        live.set_params(*self.run_params())
+        if not live.poll() and live.origin is not None:
+            return
+        run = self.run
+        channel = run.channel
+        run.set_gc(live.int_run, live.area, live.dt)
+        run.set_temp(None, live.temp, live.temp_dt)
+        self.reduction = None #followed records are taken as recorded
+        run.channel = channel
+        self.result.setText("%0.4f"%live.total)
+        if live.origin is None:
+            self.tempLabel.setText('Following, waiting for data.')
+            return
+        run.common_temp, run.d_rate, run.delay = live.common_temp, live.d_rate, live.delay
+        run.temp_time = live.temp_time.data
+        self.tempPlot.set_run(run)
+        if self.tempPlot.mode is None:
+            self.tempPlot.show('DvsTemp')
+        self.canvas2.draw_idle()
+        self.exportButton.setEnabled(True)
+        self.tempLabel.setText('Following, %d GC runs and %d temperature values.'%(len(run.area),len(run.temp)))
+    
+    @traced()
     def update_temptab_plot(self,s):
         """
         Updates plots in temperature tab
         """
-        if hasattr(self,'common_time') != None:
-            #plot
-            self.figure2.clear()
-            ax = self.figure2.add_subplot(111)
-            ax.grid(b=True, which='major', color='#666666', linestyle='-')
-            ax.minorticks_on()
-            ax.grid(b=True, which='minor', color='#999999', linestyle='-', alpha=0.2)
-            if s == 'DvsTemp':
-                ax.scatter(self.common_temp,self.d_rate,color=((0.3,0,0.6,1)) )
-                ax.axis(ymin = 0, ymax = 1.1*self.d_rate.max())
-                ax.set_xlabel('Temperature (°C)')
-                ax.set_ylabel('Desorbtion rate (ppm/min)')
-            elif s == 'DvsTime':
-                ax.scatter(self.common_time,self.d_rate, color=((0,0.7,1,1)) )
-                ax.axis(ymin = 0, ymax = 1.1*self.d_rate.max())
-                ax.set_xlabel('Time (min)')
-                ax.set_ylabel('Desorbtion rate (ppm/min)')
-            elif s == 'TvsTime':
-                ax.scatter(self.common_time,self.common_temp, s=50, color=((1,0.549,0,1)),label = 'Common' )
-                ax.scatter(self.temp_time,self.temp, s=10, color=((1,0.647,0,0.25)), label = 'Raw' )
-                ax.axis(ymin = 0, ymax = 1.1*self.temp.max())
-                ax.legend(loc='upper left');
-                ax.set_xlabel('Time (min)')
-                ax.set_ylabel('Temperature (°C)')
-            self.figure2.tight_layout()
-            self.figure2.autofmt_xdate()
-            self.canvas2.draw()
+        if self.run.common_temp is not None:
+            self.tempPlot.show(s)
+            self.canvas2.draw_idle()
             
+    def sync_graph(self):
+        """
+        Sets the inputs of the computation graph from the ui and run data, those unchanged are left as they are
+        """
+        run = self.run
+        for name, value in (('content', self.content), ('spa', self.spa.value()), ('weight', self.weight.value()),
+            ('molar_rate', self.flowconst), ('rate', self.rate.value()), ('cycletime', self.cycletime.value()),
+            ('delay', self.delay.value()), ('area', run.area), ('temp', run.temp), ('temp_epoch', run.temp_epoch),
+            ('run_epoch', run.run_epoch)):
+            self.graph.set(name, value)
+    
     def onValueChanged(self):
         """
-        Changes result box if any inputs are changed in the basic tab, and clear the figure in temp tab
+        Updates the result box and desorbtion rate plots as inputs in the basic tab are changed, rescaling the held sum of area and desorbtion rate per unit area rather than recalculating
+        """
+        if self.run.area is None or not (self.spa.value() and self.weight.value()):
+            self.result.setText("Undefined")
+        else:
+            self.sync_graph()
+            self.result.setText("%0.4f"%self.graph.get('total'))
+        if self.run.common_temp is None:
+            self.tempPlot.clear()
+        elif self.spa.value() and self.weight.value():
+            self.run.d_rate = self.graph.get('d_rate')
+            self.tempPlot.set_run(self.run)
+        self.canvas2.draw_idle()
+    
+    def onDelayChanged(self):
+        """
+        Realigns the temperature record onto the GC runs as the delay is changed, once calculated
         """
-        self.result.setText("Undefined")
-        self.figure2.clear()
+        if self.run.common_temp is None or self.job is not None:
+            return
+        self.sync_graph()
+        self.run.common_temp = self.graph.get('common_temp')
+        self.run.delay = self.delay.value()
+        self.tempPlot.set_run(self.run)
+        self.canvas2.draw_idle()
 
 
 def get_config(inputlist,filec):
@@ -392,10 +876,21 @@ def get_config(inputlist,filec):
 
     get_config_dialog.exec_()
 
+def get_delay(delays, cost, best):
+    '''
+    Shows the cost of each delay from calibrate_delay. Returns the delay accepted, best unless another is chosen, or None if cancelled.
+    '''
+    delay_dialog = QtWidgets.QDialog()
+    dui = Ui_delay_dialog()
+    dui.setupUi(delay_dialog, delays, cost, best)
+    if delay_dialog.exec_() != QtWidgets.QDialog.Accepted:
+        return None
+    return dui.delay.value()
+
 #Run as main
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
-    spl_fname=resource_filename("HydroTrace","meta/logo.png")
+    spl_fname=resource_path("meta/logo.png")
     splash_pix = QtGui.QPixmap(spl_fname,'PNG')
     splash = QtWidgets.QSplashScreen(splash_pix)
     splash.setMask(splash_pix.mask())
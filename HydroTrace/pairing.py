@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser pairing of GC reports and temperature records
+-------------------------------------------------------------------------------
+Finds the Pico temperature record which goes with a ChemStation report, or the
+report which goes with a record, among the files beside it: in its directory,
+the directory above, or the directories alongside (e.g. gc/ and temperature/
+folders of a campaign). The file whose time span overlaps the most is taken,
+or failing that, the one named after the ChemStation sequence, e.g.:
+
+>>>from HydroTrace.pairing import find_temperature
+>>>temp = find_temperature('campaign/gc/report.txt')
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, re, glob
+from HydroTrace.hydro_trace_common import parse_cs_file
+from HydroTrace.cache import get_cache
+from HydroTrace.timeindex import TimeIndex
+
+#files examined for a companion at most, the most recently modified first
+max_candidates = 64
+
+def neighbours(fname, pattern):
+    """
+    Returns the files matching pattern in the directory of fname, the directory above and the other
+    directories in it, most recently modified first and leaving out fname
+    """
+    here = os.path.dirname(os.path.abspath(fname))
+    parent = os.path.dirname(here)
+    dirs = [here]
+    if parent != here:
+        dirs += [parent] + sorted(d for d in glob.glob(os.path.join(parent, '*')) if os.path.isdir(d) and d != here)
+    found = {}
+    for d in dirs:
+        for path in glob.glob(os.path.join(d, pattern)):
+            try:
+                found[path] = os.stat(path).st_mtime
+            except OSError:
+                continue
+    found.pop(os.path.abspath(fname), None)
+    return sorted(found, key = lambda p: (-found[p], p))[:max_candidates]
+
+def best_overlap(span, spans):
+    """
+    Returns the key of the (start, stop) span in dict spans overlapping span the most, and the seconds
+    they overlap for; None and -1 if none overlap it
+    """
+    best, most = None, -1
+    for key, other in spans.items():
+        o = min(span[1], other[1]) - max(span[0], other[0])
+        if o > most:
+            best, most = key, o
+    return best, most
+
+def gc_span(fname):
+    """
+    Returns the epoch seconds of the first and last GC runs with peak areas in a ChemStation report,
+    None if it can't be read or has none
+    """
+    try:
+        int_run, area, dt = get_cache().load(fname, parse_cs_file, 'cs1')
+    except (OSError, UnicodeError, ValueError):
+        return None
+    if not len(int_run):
+        return None
+    runs = dt[int_run+1].view('int64')
+    return int(runs.min()), int(runs.max())
+
+def record_span(fname):
+    """
+    Returns the epoch seconds of the first and last lines of a Pico csv, from its time index, None if it
+    can't be read or is empty
+    """
+    try:
+        index = TimeIndex.open(fname)
+    except (OSError, UnicodeError, ValueError):
+        return None
+    if not index.offset:
+        return None
+    return index.first[0], index.last[-1]
+
+def record_spans(paths):
+    """
+    Returns a dict of the spans of those Pico csv files in paths which can be read, see record_span
+    """
+    spans = {path: record_span(path) for path in paths}
+    return {path: s for path, s in spans.items() if s is not None}
+
+def sequence_name(fname):
+    """
+    Returns the name of the sequence a ChemStation report was run from, the last part of the 'Sequence
+    table:' path in its header, which is wrapped over the lines after it. None if there isn't one.
+    """
+    path = None
+    try:
+        with open(fname, encoding='utf16') as f:
+            for num, line in enumerate(f):
+                if path is None:
+                    if line.startswith('Sequence table:'):
+                        path = line[len('Sequence table:'):].strip()
+                    elif num > 20:
+                        break
+                elif line[:1].isspace() and line.strip():
+                    path += line.strip()
+                else:
+                    break
+    except (OSError, UnicodeError):
+        return None
+    if not path:
+        return None
+    return os.path.splitext(re.split(r'[\\/]', path)[-1])[0] or None
+
+def _words(name):
+    return re.sub(r'[^0-9a-z]', '', name.lower())
+
+def _named(candidates, names):
+    """
+    Returns the first of candidates whose file name contains one of names, or is contained in it, ignoring
+    case, spaces and punctuation
+    """
+    names = [_words(n) for n in names if n]
+    names = [n for n in names if n]
+    for path in candidates:
+        stem = _words(os.path.splitext(os.path.basename(path))[0])
+        if stem and any(n in stem or stem in n for n in names):
+            return path
+    return None
+
+def find_temperature(gc, span = None, spans = None, pattern = '*.csv'):
+    """
+    Returns the Pico csv among the neighbours of ChemStation report gc which overlaps its GC runs the
+    most, or failing that, the one named after its sequence or gc itself. span gives the epoch seconds
+    of the first and last GC runs and spans those of the records beside gc (see record_spans) where
+    already known. None if there is no such record.
+    """
+    candidates = neighbours(gc, pattern)
+    spans = record_spans(candidates) if spans is None else spans
+    span = gc_span(gc) if span is None else span
+    if span is not None:
+        best, overlap = best_overlap(span, spans)
+        if best is not None:
+            return best
+    return _named(candidates, [sequence_name(gc), os.path.splitext(os.path.basename(gc))[0]])
+
+def find_report(temp, span = None, pattern = '*.txt'):
+    """
+    Returns the ChemStation report among the neighbours of Pico csv temp whose GC runs it overlaps the
+    most, or failing that, the one whose sequence is named after temp. span gives the epoch seconds of
+    the record where already known. None if there is no such report.
+    """
+    candidates = neighbours(temp, pattern)
+    span = record_span(temp) if span is None else span
+    if span is not None:
+        spans = {path: gc_span(path) for path in candidates}
+        best, overlap = best_overlap(span, {path: s for path, s in spans.items() if s is not None})
+        if best is not None:
+            return best
+    for path in candidates:
+        if _named([temp], [sequence_name(path), os.path.splitext(os.path.basename(path))[0]]):
+            return path
+    return None
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser desorbtion peak fitting
+-------------------------------------------------------------------------------
+Fits the sum of several overlapping peaks to desorbtion rate vs. temperature,
+either Gaussian or first-order desorbtion peaks in the analytic form of Kitis
+et al., J. Phys. D 31 (1998) 2636, with residuals and Jacobians evaluated for
+all points and peaks at once. Runs are fitted in parallel over a process pool,
+and the peak temperatures found at several heating rates give the activation
+energy of each trap by Kissinger's method, e.g.:
+
+>>>from HydroTrace.peaks import fit_runs, kissinger
+>>>fits = fit_runs(curves, n_peaks = 2, shape = 'first-order')
+>>>Ea, intercept, r2 = kissinger([f['heating_rate'] for f in fits], [f['peak_temp'][0] for f in fits])
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from HydroTrace.profiling import init_worker
+
+R = 8.314462618e-3 #gas constant, kJ/mol/K
+T0 = 273.15
+
+def gaussian(T, p):
+    """
+    Returns the sum of Gaussian peaks at temperatures T (m,) for parameters p, (n,3) rows of height,
+    peak temperature and standard deviation, along with the Jacobian with respect to p.ravel(), (m,3n)
+    """
+    h, Tm, w = p[:,0], p[:,1], p[:,2]
+    z = (T[:,None] - Tm)/w
+    e = np.exp(-0.5*z*z)
+    J = np.empty((len(T), p.shape[0], 3))
+    J[...,0] = e
+    J[...,1] = h*e*z/w
+    J[...,2] = h*e*z*z/w
+    return (h*e).sum(axis=1), J.reshape(len(T), -1)
+
+def first_order(T, p):
+    """
+    Returns the sum of first-order desorbtion peaks (Kitis et al. 1998) at temperatures T (m,), in
+    K, for parameters p, (n,3) rows of height, peak temperature (K) and activation energy over the gas
+    constant (K), along with the Jacobian with respect to p.ravel(), (m,3n)
+    """
+    h, Tm, x = p[:,0], p[:,1], p[:,2]
+    T = T[:,None]
+    u = x*(1/Tm - 1/T)
+    s = (T/Tm)**2*np.exp(u)
+    c = 1 - 2*T/x
+    g = 1 + u - s*c - 2*Tm/x
+    f = h*np.exp(g)
+    J = np.empty((T.shape[0], p.shape[0], 3))
+    J[...,0] = np.exp(g)
+    J[...,1] = f*(-x/Tm**2 + c*s*(2/Tm + x/Tm**2) - 2/x)
+    J[...,2] = f*(u/x - s*(c*u/x + 2*T/x**2) + 2*Tm/x**2)
+    return f.sum(axis=1), J.reshape(T.shape[0], -1)
+
+shapes = {'gaussian': gaussian, 'first-order': first_order}
+
+def initial_peaks(T, y, n_peaks):
+    """
+    Returns the temperatures of the n_peaks largest local maxima of y over sorted T, with any shortfall
+    spread evenly over T, in order of temperature
+    """
+    k = max(len(y)//50, 1)
+    ys = np.convolve(y, np.ones(k)/k, mode='same')
+    interior = np.flatnonzero((ys[1:-1] >= ys[:-2]) & (ys[1:-1] > ys[2:])) + 1
+    best = interior[np.argsort(ys[interior])[::-1][:n_peaks]]
+    Tm = list(T[best])
+    Tm += list(np.linspace(T[0], T[-1], n_peaks + 2)[1:-1][:n_peaks - len(Tm)])
+    return np.sort(np.array(Tm))
+
+def heating_rate(common_time, common_temp):
+    """
+    Returns the heating rate, °C/min, as the slope of a straight line through temperature vs. time
+    up to where 98% of the temperature rise is first reached, leaving out any hold which follows
+    """
+    valid = ~np.isnan(common_temp)
+    t, T = common_time[valid], common_temp[valid]
+    end = np.argmax(T >= T.min() + 0.98*(T.max() - T.min()))
+    return np.polyfit(t[:end+1], T[:end+1], 1)[0] if end > 0 else np.nan
+
+def fit_peaks(common_temp, d_rate, n_peaks = 1, shape = 'gaussian', peaks = None):
+    """
+    Fits n_peaks peaks of shape ('gaussian' or 'first-order') to d_rate vs. common_temp (°C), starting
+    from peaks, initial peak temperatures (°C), if given. Returns a dict of:
+        params: (n_peaks,3) fitted parameters as for gaussian or first_order, in °C for the Gaussian
+        peak_temp: peak temperatures (°C), in order
+        energy: activation energies (kJ/mol), first-order peaks only
+        temp, fitted: the temperatures fitted (°C, sorted) and the fitted curve at them
+        rss: residual sum of squares, r2: coefficient of determination
+        success, message: from scipy.optimize.least_squares
+        degenerate: why the peaks fitted aren't separate peaks, '' if they are: peaks which coincide,
+            or whose height or width is held at its bound
+    """
+    from scipy.optimize import least_squares
+    model = shapes[shape]
+    valid = ~(np.isnan(common_temp) | np.isnan(d_rate))
+    order = np.argsort(common_temp[valid])
+    T = np.asarray(common_temp, dtype=np.float64)[valid][order]
+    y = np.asarray(d_rate, dtype=np.float64)[valid][order]
+    if len(T) < 3*n_peaks:
+        raise ValueError('%d points are too few to fit %d peaks.'%(len(T),n_peaks))
+    Tm = initial_peaks(T, y, n_peaks) if peaks is None else np.sort(np.asarray(peaks, dtype=np.float64))
+    n_peaks = len(Tm)
+    span = T[-1] - T[0]
+    h = np.interp(Tm, T, y).clip(min=y.max()*0.05)
+    width = np.full(n_peaks, span/(4*n_peaks))
+    if shape == 'first-order':
+        T, Tm, lo_T, hi_T = T + T0, Tm + T0, T[0] + T0, T[-1] + T0
+        #E/R giving a peak of about width at half height, from the Gaussian approximation of a first-order peak
+        p0 = np.column_stack((h, Tm, 2.5*Tm**2/width))
+        lower = np.tile([0, lo_T, 1.0], n_peaks)
+    else:
+        lo_T, hi_T = T[0], T[-1]
+        p0 = np.column_stack((h, Tm, width))
+        lower = np.tile([0, lo_T, span*1e-3], n_peaks)
+    upper = np.tile([np.inf, hi_T, np.inf], n_peaks)
+
+    def resid(q):
+        return model(T, q.reshape(-1,3))[0] - y
+    def jac(q):
+        return model(T, q.reshape(-1,3))[1]
+    res = least_squares(resid, np.clip(p0.ravel(), lower, upper), jac=jac, bounds=(lower, upper), x_scale='jac')
+    params = res.x.reshape(-1,3)
+    order = np.argsort(params[:,1])
+    params = params[order]
+    at_bound = res.active_mask.reshape(-1,3)[order]
+    fitted = model(T, params)[0]
+    #standard deviation of each peak, for a first-order peak from its width at half height as for p0
+    sd = params[:,2] if shape == 'gaussian' else 2.5*params[:,1]**2/params[:,2]/2.355
+    if np.any(np.diff(params[:,1]) < 0.5*np.minimum(sd[1:], sd[:-1])):
+        degenerate = 'peaks coincide'
+    elif at_bound[:,[0,2]].any():
+        degenerate = 'peak height or width at its bound'
+    else:
+        degenerate = ''
+    rss = float(np.sum((fitted - y)**2))
+    tss = float(np.sum((y - y.mean())**2))
+    out = dict(params = params, peak_temp = params[:,1] - (T0 if shape == 'first-order' else 0),
+        energy = params[:,2]*R if shape == 'first-order' else None,
+        temp = T - (T0 if shape == 'first-order' else 0), fitted = fitted, rss = rss,
+        r2 = 1 - rss/tss if tss > 0 else np.nan, success = bool(res.success), message = res.message,
+        degenerate = degenerate)
+    return out
+
+def _fit_run(args):
+    """
+    Fits one run for fit_runs, capturing any failure
+    """
+    (common_time, common_temp, d_rate), n_peaks, shape, peaks = args
+    try:
+        out = fit_peaks(np.asarray(common_temp), np.asarray(d_rate), n_peaks, shape, peaks)
+    except Exception as e:
+        return dict(success = False, message = '%s: %s'%(type(e).__name__,e), peak_temp = np.full(n_peaks, np.nan),
+            heating_rate = np.nan, degenerate = '')
+    out['heating_rate'] = heating_rate(np.asarray(common_time), np.asarray(common_temp))
+    return out
+
+def fit_runs(curves, n_peaks = 1, shape = 'gaussian', peaks = None, workers = None):
+    """
+    Fits peaks to each of curves, (common_time, common_temp, d_rate) tuples such as the values of
+    RunLibrary.curves, over a pool of workers. Returns the results of fit_peaks in the same order as
+    curves, with the heating rate (°C/min) of each run; runs which couldn't be fitted have success
+    False and nan peak temperatures.
+    """
+    jobs = [(tuple(np.asarray(c) for c in curve), n_peaks, shape, peaks) for curve in curves]
+    if workers == 1 or len(jobs) < 2:
+        return [_fit_run(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers = workers, initializer = init_worker) as pool:
+        return list(pool.map(_fit_run, jobs, chunksize = max(len(jobs)//(4*(workers or 8)), 1)))
+
+def kissinger(heating_rates, peak_temps):
+    """
+    Kissinger analysis of peak temperatures (°C) found at several heating rates (any units): the slope
+    of ln(rate/Tm^2) against 1/Tm is -Ea/R. Returns the activation energy Ea (kJ/mol), the intercept
+    and the coefficient of determination of the fit, ignoring nan peak temperatures. Raises ValueError
+    unless there are at least two different heating rates and two different peak temperatures.
+    """
+    rate = np.asarray(heating_rates, dtype=np.float64)
+    Tm = np.asarray(peak_temps, dtype=np.float64) + T0
+    valid = ~(np.isnan(rate) | np.isnan(Tm))
+    if valid.sum() < 2:
+        raise ValueError('At least two peak temperatures are needed.')
+    x, y = 1/Tm[valid], np.log(rate[valid]/Tm[valid]**2)
+    if len(np.unique(rate[valid])) < 2:
+        raise ValueError('At least two different heating rates are needed.')
+    if len(np.unique(x)) < 2:
+        raise ValueError('At least two different peak temperatures are needed.')
+    slope, intercept = np.polyfit(x, y, 1)
+    resid = y - (slope*x + intercept)
+    tss = np.sum((y - y.mean())**2)
+    return -slope*R, intercept, 1 - np.sum(resid**2)/tss if tss > 0 else np.nan
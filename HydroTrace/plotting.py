@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser plotting
+-------------------------------------------------------------------------------
+Draws the temperature tab views onto a matplotlib figure, keeping one set of
+artists and updating their data rather than rebuilding the figure. Raw
+temperature records are decimated to the resolution of the axes and
+re-decimated whenever the view is zoomed or panned.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import numpy as np
+
+def minmax_decimate(x, y, n_bins, xlim = None):
+    """
+    Returns sorted indices of the points of y, with x sorted, giving the minimum and maximum of y
+    in each of n_bins equal sized blocks of the points inside xlim (default: all points), along
+    with the first and last points and one point either side of xlim so that lines run to the
+    edge of the view. At most 2*n_bins+4 indices are returned.
+    """
+    n = len(x)
+    if xlim is None:
+        i0, i1 = 0, n
+    else:
+        i0 = max(np.searchsorted(x, xlim[0], side='left') - 1, 0)
+        i1 = min(np.searchsorted(x, xlim[1], side='right') + 1, n)
+    if i1 - i0 <= 2*n_bins:
+        return np.arange(i0, i1)
+    k = -(-(i1 - i0)//n_bins) #points per block
+    nb = (i1 - i0)//k
+    blocks = np.asarray(y[i0:i0+nb*k]).reshape(nb, k)
+    offset = i0 + np.arange(nb)*k
+    idx = [offset + np.argmin(blocks, axis=1), offset + np.argmax(blocks, axis=1), [i0, i1-1]]
+    if i0 + nb*k < i1:
+        tail = np.asarray(y[i0+nb*k:i1])
+        idx.append([i0 + nb*k + np.argmin(tail), i0 + nb*k + np.argmax(tail)])
+    return np.unique(np.concatenate(idx))
+
+class TempTabPlot(object):
+    """
+    Persistent artists for the 'DvsTemp', 'DvsTime' and 'TvsTime' views of the temperature tab on
+    figure. set_data supplies the calculated series, show switches between views.
+    """
+    labels = dict(
+        DvsTemp = ('Temperature (°C)', 'Desorbtion rate (ppm/min)'),
+        DvsTime = ('Time (min)', 'Desorbtion rate (ppm/min)'),
+        TvsTime = ('Time (min)', 'Temperature (°C)'),
+        )
+
+    def __init__(self, figure):
+        self.figure = figure
+        self.mode = None
+        self.raw = None
+        self.rescaling = False
+        self.ax = figure.add_subplot(111)
+        ax = self.ax
+        ax.grid(True, which='major', color='#666666', linestyle='-')
+        ax.minorticks_on()
+        ax.grid(True, which='minor', color='#999999', linestyle='-', alpha=0.2)
+        ax.tick_params(axis='x', labelrotation=30)
+        self.artists = dict(
+            DvsTemp = [ax.plot([], [], 'o', ms=6, color=(0.3,0,0.6,1))[0]],
+            DvsTime = [ax.plot([], [], 'o', ms=6, color=(0,0.7,1,1))[0]],
+            TvsTime = [ax.plot([], [], 'o', ms=7.1, color=(1,0.549,0,1), label='Common')[0],
+                ax.plot([], [], 'o', ms=3.2, color=(1,0.647,0,0.25), label='Raw')[0]],
+            )
+        self.legend = ax.legend(handles=self.artists['TvsTime'], loc='upper left')
+        self.clear()
+        ax.callbacks.connect('xlim_changed', self._on_xlim)
+        figure.tight_layout()
+
+    def clear(self):
+        """
+        Hides all views
+        """
+        for artists in self.artists.values():
+            for a in artists:
+                a.set_visible(False)
+        self.legend.set_visible(False)
+        self.mode = None
+
+    def set_data(self, common_time, common_temp, d_rate, temp_time, temp):
+        """
+        Updates all views with a new calculation
+        """
+        self.artists['DvsTemp'][0].set_data(common_temp, d_rate)
+        self.artists['DvsTime'][0].set_data(common_time, d_rate)
+        self.artists['TvsTime'][0].set_data(common_time, common_temp)
+        self.raw = (temp_time, temp)
+        self.ymax = dict(DvsTemp = 1.1*np.nanmax(d_rate), DvsTime = 1.1*np.nanmax(d_rate),
+            TvsTime = 1.1*np.max(temp))
+        if self.mode is not None:
+            self.show(self.mode)
+
+    def set_run(self, run):
+        """
+        Updates all views with the results held in a RunData
+        """
+        self.set_data(run.common_time, run.common_temp, run.d_rate, run.temp_time, run.temp)
+
+    def _decimate_raw(self, xlim = None):
+        temp_time, temp = self.raw
+        width = max(int(self.ax.get_window_extent().width), 500)
+        idx = minmax_decimate(temp_time, temp, width, xlim)
+        self.artists['TvsTime'][1].set_data(temp_time[idx], temp[idx])
+
+    def _on_xlim(self, ax):
+        #show decimates and leaves drawing to its caller, only zooming and panning need a redraw
+        if self.mode == 'TvsTime' and self.raw is not None and not self.rescaling:
+            self._decimate_raw(ax.get_xlim())
+            self.figure.canvas.draw_idle()
+
+    def show(self, mode):
+        """
+        Switches to view mode, rescaling the axes to its data
+        """
+        self.clear()
+        self.mode = mode
+        if self.raw is None:
+            return
+        for a in self.artists[mode]:
+            a.set_visible(True)
+        self.legend.set_visible(mode == 'TvsTime')
+        if mode == 'TvsTime':
+            self._decimate_raw()
+        ax = self.ax
+        ax.set_xlabel(self.labels[mode][0])
+        ax.set_ylabel(self.labels[mode][1])
+        self.rescaling = True
+        try:
+            ax.relim(visible_only=True)
+            ax.autoscale(enable=True)
+            ax.autoscale_view()
+            ax.set_ylim(0, self.ymax[mode])
+        finally:
+            self.rescaling = False
+
+class AreaPlot(object):
+    """
+    Persistent artist for the basic tab, the area of each GC run against run number on figure
+    """
+    def __init__(self, figure):
+        self.figure = figure
+        self.ax = figure.add_subplot(111)
+        ax = self.ax
+        ax.set_xlabel('Run number')
+        ax.set_ylabel('Area (15 µV-s)')
+        ax.grid(True, which='major', color='#666666', linestyle='-')
+        ax.minorticks_on()
+        ax.grid(True, which='minor', color='#999999', linestyle='-', alpha=0.2)
+        self.points = ax.plot([], [], 'o', ms=6, color='C0')[0]
+        figure.tight_layout()
+
+    def set_data(self, int_run, area):
+        """
+        Updates the plot with a new GC report, rescaling the axes to it
+        """
+        self.points.set_data(int_run, area)
+        ax = self.ax
+        ax.relim()
+        ax.autoscale(enable=True)
+        ax.autoscale_view()
+
+    def set_run(self, run):
+        """
+        Updates the plot with the GC report held in a RunData
+        """
+        self.set_data(run.int_run, run.area)
+
+class DelayCostPlot(object):
+    """
+    Persistent artists showing the cost of each temperature delay from calibrate_delay on figure, with
+    the delay chosen marked
+    """
+    def __init__(self, figure):
+        self.figure = figure
+        self.ax = figure.add_subplot(111)
+        ax = self.ax
+        ax.set_xlabel('Temperature delay (min)')
+        ax.set_ylabel('Cost')
+        ax.grid(True, which='major', color='#666666', linestyle='-')
+        ax.minorticks_on()
+        ax.grid(True, which='minor', color='#999999', linestyle='-', alpha=0.2)
+        self.curve = ax.plot([], [], '-', color='C0')[0]
+        self.marker = ax.axvline(0, color='C3', linestyle='--')
+        figure.tight_layout()
+
+    def set_data(self, delays, cost):
+        """
+        Updates the curve, leaving out delays for which the record doesn't span the GC runs
+        """
+        finite = np.isfinite(cost)
+        self.curve.set_data(delays[finite], cost[finite])
+        ax = self.ax
+        ax.relim()
+        ax.autoscale(enable=True)
+        ax.autoscale_view()
+
+    def set_delay(self, delay):
+        self.marker.set_xdata([delay, delay])
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser profiling
+-------------------------------------------------------------------------------
+Records the time spent in each stage of processing as spans which are written
+out in Chrome's trace event format, to be opened with chrome://tracing or
+https://ui.perfetto.dev. Tracing is enabled by setting HYDROTRACE_TRACE to the
+file the trace is to be written to when the process exits, e.g.:
+
+>HYDROTRACE_TRACE=trace.json python -m HydroTrace.main
+
+Worker processes started with init_worker as their initializer write their
+spans alongside it on exit, which are merged into the trace. When it isn't set,
+span returns a shared do-nothing context and traced returns functions
+unchanged.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, glob, json, time, atexit, functools, threading
+
+enabled = False
+_events = []
+_trace_file = None
+
+class _Span(object):
+    """
+    Context recording a complete ('X') trace event on exit. The dict returned on entry holds the
+    arguments of the event, e.g. rows and bytes processed, and may be added to inside the span. The
+    size of a file argument is recorded as bytes.
+    """
+    __slots__ = ('name', 'args', 't')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self.args
+
+    def __exit__(self, exc_type, exc, tb):
+        t = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        if 'file' in self.args and 'bytes' not in self.args:
+            try:
+                self.args['bytes'] = os.path.getsize(self.args['file'])
+            except OSError:
+                pass
+        #perf_counter is system wide, so times from worker processes line up with the caller's
+        _events.append(dict(name = self.name, ph = 'X', ts = self.t*1e6, dur = (t - self.t)*1e6,
+            pid = os.getpid(), tid = threading.get_ident(), args = self.args))
+        return False
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        #arguments added inside the span are dropped with the dict
+        return {}
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_null = _NullSpan()
+
+def span(name, **args):
+    """
+    Returns a context timing the code inside it as name, with keyword arguments recorded alongside
+    """
+    if not enabled:
+        return _null
+    return _Span(name, args)
+
+def traced(name = None):
+    """
+    Decorator recording calls of a function as spans, named after the function unless name is given.
+    Functions are returned as they are unless tracing is enabled when they are decorated.
+    """
+    def wrap(fn):
+        if not enabled:
+            return fn
+        label = name or fn.__qualname__
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with _Span(label, {}):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def events():
+    """
+    Returns a list of the trace events recorded so far
+    """
+    return list(_events)
+
+def clear():
+    del _events[:]
+
+def _named_events():
+    """
+    Returns the events recorded so far, preceded by the names of the threads they were recorded on
+    """
+    recorded = events()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    meta = [dict(name = 'thread_name', ph = 'M', pid = pid, tid = tid, args = dict(name = names.get(tid, 'worker %d'%tid)))
+        for pid, tid in sorted({(e['pid'], e['tid']) for e in recorded})]
+    return meta + recorded
+
+def _part_pattern(fname, pid):
+    return glob.escape(fname) + '.%d.*.part'%pid
+
+def write_trace(fname):
+    """
+    Writes the events recorded so far, with the names of the threads they were recorded on, as a
+    Chrome trace event JSON file, along with those written by worker processes of this one which have
+    exited (see init_worker). The files they were written to are removed.
+    """
+    recorded = _named_events()
+    parts = sorted(glob.glob(_part_pattern(fname, os.getpid())))
+    for part in parts:
+        try:
+            with open(part) as f:
+                recorded += json.load(f)
+        except (OSError, ValueError):
+            continue
+    with open(fname, 'w') as f:
+        json.dump(dict(traceEvents = recorded, displayTimeUnit = 'ms'), f)
+    for part in parts:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+
+def _write_part(fname):
+    """
+    Writes the events recorded in a worker process beside fname, for the process which started it to
+    merge into its trace
+    """
+    recorded = _named_events()
+    if not recorded:
+        return
+    recorded.insert(0, dict(name = 'process_name', ph = 'M', pid = os.getpid(), args = dict(name = 'worker %d'%os.getpid())))
+    with open('%s.%d.%d.part'%(fname, os.getppid(), os.getpid()), 'w') as f:
+        json.dump(recorded, f)
+
+def init_worker():
+    """
+    Initializer for pools of worker processes, e.g. ProcessPoolExecutor(initializer = init_worker). If
+    tracing, the events a worker records are written out when it exits and merged into the trace of the
+    process which started it, rather than the worker replacing that trace.
+    """
+    if not (enabled and _trace_file):
+        return
+    #spawned workers enable tracing from HYDROTRACE_TRACE on import, forked ones inherit the caller's events
+    atexit.unregister(write_trace)
+    clear()
+    #workers leave through multiprocessing, which runs its finalizers rather than atexit when forked
+    from multiprocessing import util
+    util.Finalize(None, _write_part, args = (_trace_file,), exitpriority = 0)
+
+def enable(fname = None):
+    """
+    Turns on tracing for code decorated from here on, writing the trace to fname on exit if given.
+    Worker processes started from here on trace into it too.
+    """
+    global enabled, _trace_file
+    enabled = True
+    if fname:
+        _trace_file = os.path.abspath(fname)
+        os.environ['HYDROTRACE_TRACE'] = _trace_file
+        atexit.register(write_trace, _trace_file)
+
+if os.environ.get('HYDROTRACE_TRACE'):
+    enable(os.environ['HYDROTRACE_TRACE'])
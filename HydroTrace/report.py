@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser campaign reports
+-------------------------------------------------------------------------------
+Renders the figures of the basic and temperature tabs for each run of a
+campaign, along with a summary sheet of its parameters and total hydrogen
+content, offscreen with matplotlib's Agg backend. Runs are read from the .htb
+files written by batch processing with --htb and spread over a pool of worker
+processes, each of which builds its figures once and updates their data for
+every run it renders, e.g.:
+
+>python -m HydroTrace.report results/*.htb -o report -j 8
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, sys, csv, glob, argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from HydroTrace.hydro_trace_common import calc_total
+from HydroTrace.rundata import RunData
+from HydroTrace.runfile import read_run
+from HydroTrace.plotting import TempTabPlot, AreaPlot
+from HydroTrace.profiling import traced, init_worker
+
+#figures rendered for each run, those the run doesn't hold the columns for are left out
+views = ['summary', 'area', 'DvsTemp', 'DvsTime', 'TvsTime']
+report_fields = ['name', 'htb', 'total'] + views + ['status']
+
+#run parameters listed on the summary sheet, as stored by runfile.run_meta
+sheet_params = [
+    ('content', 'H standard content', 'ppm'),
+    ('molar_rate', 'Carrier gas molar rate', 'µmol/s'),
+    ('spa', 'Standard peak area', '15 µV-s'),
+    ('weight', 'Sample weight', 'g'),
+    ('rate', 'Flow rate', 'ml/min'),
+    ('cycletime', 'Cycle time', 'min'),
+    ('delay', 'Temperature delay', 'min'),
+    ]
+
+class SummarySheet(object):
+    """
+    Persistent text artists on figure listing the total hydrogen content of a run and the parameters
+    and source files it was calculated from
+    """
+    def __init__(self, figure):
+        self.figure = figure
+        self.title = figure.text(0.05, 0.93, '', fontsize = 14, weight = 'bold', va = 'top')
+        self.body = figure.text(0.05, 0.84, '', fontsize = 10, family = 'monospace', va = 'top',
+            linespacing = 1.6)
+
+    def set_run(self, name, run, meta, total):
+        """
+        Updates the sheet with the run name, the RunData run, its meta from read_run and total
+        """
+        params = meta.get('params', {})
+        lines = ['%-24s %0.4f ppm'%('Total hydrogen content', total), '%-24s %d'%('GC runs', len(run.area)), '']
+        for key, label, unit in sheet_params:
+            if params.get(key) is not None:
+                lines.append('%-24s %g %s'%(label, params[key], unit))
+        if run.d_rate is not None and run.common_temp is not None and np.isfinite(run.d_rate).any():
+            peak = np.nanargmax(run.d_rate)
+            lines += ['', '%-24s %0.4f ppm/min'%('Peak desorbtion rate', run.d_rate[peak]),
+                '%-24s %0.1f °C'%('at temperature', run.common_temp[peak])]
+        channel = meta.get('channel')
+        if channel is not None:
+            lines += ['', '%-24s %s'%('Temperature channel', channel if isinstance(channel, str) else ', '.join(channel))]
+        sources = meta.get('sources') or {}
+        if sources:
+            lines.append('')
+        for key, label in (('gc', 'GC report'), ('temp', 'Temperature record')):
+            if key in sources:
+                lines.append('%-24s %s'%(label, os.path.basename(sources[key]['path'])))
+        self.title.set_text(name)
+        self.body.set_text('\n'.join(lines))
+
+class ReportFigures(object):
+    """
+    The figures of a run report, built once on Agg canvases of size (in) and dpi and updated for each
+    run rendered
+    """
+    def __init__(self, size = (8, 6), dpi = 100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        self.dpi = dpi
+        self.figures = {}
+        for key in ('summary', 'area', 'temp'):
+            self.figures[key] = Figure(figsize = size, dpi = dpi)
+            FigureCanvasAgg(self.figures[key])
+        self.sheet = SummarySheet(self.figures['summary'])
+        self.area = AreaPlot(self.figures['area'])
+        self.temp = TempTabPlot(self.figures['temp'])
+
+    def _save(self, key, fname, fmt):
+        """
+        Writes figure key to fname, straight from its canvas where Agg writes fmt itself, which saves
+        the set up savefig goes through for each figure
+        """
+        figure = self.figures[key]
+        write = getattr(figure.canvas, 'print_' + fmt, None)
+        if write is None:
+            figure.savefig(fname, dpi = self.dpi, format = fmt)
+        else:
+            write(fname)
+        return fname
+
+    @traced()
+    def render(self, fname, outputd, fmt = 'png'):
+        """
+        Renders the views of the run in the .htb file fname to outputd as name_view.fmt, returning a
+        report row giving the file written for each view
+        """
+        name = os.path.splitext(os.path.basename(fname))[0]
+        row = dict(name = name, htb = fname, total = '', status = 'ok', **{v: '' for v in views})
+        columns, meta = read_run(fname)
+        run = RunData.from_columns(columns, meta.get('channel'))
+        if run.area is None:
+            row['status'] = 'No GC runs held.'
+            return row
+        total = meta.get('total')
+        if total is None:
+            params = meta['params']
+            total = calc_total(params['content'], params['spa'], params['weight'], params['molar_rate'],
+                params['rate'], params['cycletime'], run.area)
+        row['total'] = total
+        out = lambda view: os.path.join(outputd, '%s_%s.%s'%(name, view, fmt))
+        self.sheet.set_run(name, run, meta, total)
+        row['summary'] = self._save('summary', out('summary'), fmt)
+        self.area.set_run(run)
+        row['area'] = self._save('area', out('area'), fmt)
+        if run.common_temp is not None and run.d_rate is not None and run.temp is not None:
+            self.temp.set_run(run)
+            for mode in ('DvsTemp', 'DvsTime', 'TvsTime'):
+                self.temp.show(mode)
+                row[mode] = self._save('temp', out(mode), fmt)
+        return row
+
+#figures of this process by size and dpi, built on the first run rendered with them
+_figures = {}
+
+def _render_run(args):
+    """
+    Renders a run with the figures of this process, capturing any failure
+    """
+    fname, outputd, size, dpi, fmt = args
+    try:
+        if (size, dpi) not in _figures:
+            _figures[size, dpi] = ReportFigures(size, dpi)
+        return _figures[size, dpi].render(fname, outputd, fmt)
+    except Exception as e:
+        row = dict(name = os.path.splitext(os.path.basename(fname))[0], htb = fname, total = '', **{v: '' for v in views})
+        row['status'] = '%s: %s'%(type(e).__name__, e)
+        return row
+
+def render_campaign(files, outputd, workers = None, size = (8, 6), dpi = 100, fmt = 'png'):
+    """
+    Renders reports of the runs in a list of .htb files over a pool of workers, returning report rows
+    in the same order as files. Runs are handed to workers in chunks so that each builds its figures
+    once for many runs.
+    """
+    os.makedirs(outputd, exist_ok = True)
+    jobs = [(fname, outputd, size, dpi, fmt) for fname in files]
+    if workers == 1 or len(jobs) < 2:
+        return [_render_run(job) for job in jobs]
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers = workers, initializer = init_worker) as pool:
+        return list(pool.map(_render_run, jobs, chunksize = max(1, len(jobs)//(4*workers))))
+
+def write_report_index(fname, rows):
+    """
+    Writes report rows from render_campaign to a comma delimited file
+    """
+    with open(fname, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames = report_fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'python -m HydroTrace.report',
+        description = 'Renders figures and summary sheets of processed HydroTrace runs.')
+    parser.add_argument('runs', nargs = '+', help = '.htb run files, or directories of them')
+    parser.add_argument('-o', '--output', default = '.', help = 'output directory (default: current)')
+    parser.add_argument('-j', '--workers', type = int, default = None,
+        help = 'number of worker processes (default: number of processors)')
+    parser.add_argument('--size', default = '8x6', help = 'figure size in inches, as WxH (default: 8x6)')
+    parser.add_argument('--dpi', type = int, default = 100, help = 'resolution (default: 100)')
+    parser.add_argument('--format', default = 'png', help = 'image format, as for matplotlib savefig (default: png)')
+    args = parser.parse_args(argv)
+
+    files = []
+    for path in args.runs:
+        files += sorted(glob.glob(os.path.join(path, '*.htb'))) if os.path.isdir(path) else [path]
+    size = tuple(float(s) for s in args.size.lower().split('x'))
+    rows = render_campaign(files, args.output, args.workers, size, args.dpi, args.format)
+    write_report_index(os.path.join(args.output, 'report.csv'), rows)
+    failed = [r for r in rows if r['status'] != 'ok']
+    for r in failed:
+        print('%s: %s'%(r['name'], r['status']))
+    print('Rendered %d runs, %d failed.'%(len(rows), len(failed)))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
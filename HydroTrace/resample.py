@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser temperature record reduction
+-------------------------------------------------------------------------------
+A Pico logger records every second, far more often than the GC runs every 2-3
+minutes that the record is aligned onto, and thermocouple noise shows at that
+rate. Records can be reduced as they are read: averaged onto a uniform grid of
+a given step and smoothed with a rolling mean, median or Savitzky-Golay filter.
+Each stage works block by block, holding over only what the next block needs,
+so only the reduced record is ever held in full, e.g.:
+
+>>>from HydroTrace.resample import read_pico_reduced
+>>>names, temps, dt = read_pico_reduced('temp.csv', step = 10, method = 'median', window = 5)
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from HydroTrace.hydro_trace_common import _pico_layout, _pico_rows, _epoch, Cancelled
+from HydroTrace.timeindex import TimeIndex
+from HydroTrace.profiling import span
+
+#smoothing methods, as named by Smooth
+methods = ['mean', 'median', 'savgol']
+
+def _empty(k):
+    return np.empty(0, dtype = np.int64), np.empty((0, k))
+
+class Resample(object):
+    """
+    Averages a record onto a grid of step (whole) seconds from origin (default: the first time fed,
+    rounded down to step), giving the mean of the values within half a step of each grid time. Grid
+    times without values are left out, so that gaps in the record stay gaps.
+    """
+    def __init__(self, step, origin = None):
+        self.step = int(step)
+        if self.step < 1:
+            raise ValueError('Resampling step must be at least a second.')
+        self.origin = origin
+        self.k = 0
+        self.cell = None #the last grid time fed, which the next block may add to
+        self.sum = None
+        self.count = 0
+
+    def feed(self, t, v):
+        """
+        Takes epoch seconds t, in order, and an (n,k) array of values, returning the grid times and
+        means completed by them
+        """
+        self.k = v.shape[1]
+        if not len(t):
+            return _empty(self.k)
+        step = self.step
+        if self.origin is None:
+            self.origin = int(t[0]) - int(t[0]) % step
+        cell = (t - self.origin + step//2)//step
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(cell)) + 1))
+        sums = np.add.reduceat(v.astype(np.float64), starts, axis = 0)
+        counts = np.diff(np.append(starts, len(t)))
+        cells = cell[starts]
+        if self.cell is not None:
+            if cells[0] == self.cell:
+                sums[0] += self.sum
+                counts[0] += self.count
+            else:
+                cells = np.append(self.cell, cells)
+                sums = np.vstack((self.sum, sums))
+                counts = np.append(self.count, counts)
+        self.cell, self.sum, self.count = cells[-1], sums[-1].copy(), counts[-1]
+        return self.origin + cells[:-1]*step, sums[:-1]/counts[:-1,None]
+
+    def flush(self):
+        """
+        Returns the last grid time and mean, at the end of the record
+        """
+        if self.cell is None:
+            return _empty(self.k)
+        t, v = np.array([self.origin + self.cell*self.step]), self.sum[None,:]/self.count
+        self.cell = None
+        return t, v
+
+def savgol_coeffs(window, order):
+    """
+    Returns the weights of a Savitzky-Golay filter smoothing over window (odd) values with a polynomial
+    of order, the least squares fit at the centre of the window
+    """
+    half = window//2
+    A = np.vander(np.arange(-half, half + 1, dtype = np.float64), order + 1, increasing = True)
+    return np.linalg.pinv(A)[0]
+
+class Smooth(object):
+    """
+    Rolling filter over window (odd) values, method being 'mean', 'median' or 'savgol' (Savitzky-Golay,
+    of order), with the record extended at either end by repeating its first and last values. Values
+    come out half a window after they go in, the rest on flush.
+    """
+    def __init__(self, method, window, order = 2):
+        if method not in methods:
+            raise ValueError('No smoothing method %s, choose from %s.'%(method, ', '.join(methods)))
+        if window < 1 or window % 2 == 0:
+            raise ValueError('Smoothing window must be odd, not %d.'%window)
+        if method == 'savgol' and not 0 <= order < window:
+            raise ValueError('Savitzky-Golay order must be less than the window.')
+        self.method = method
+        self.window = int(window)
+        self.half = self.window//2
+        self.k = 0
+        #the last 2*half values fed, and the times of the last half, which are yet to come out
+        self.held = None
+        self.times = np.empty(0, dtype = np.int64)
+        if method == 'savgol':
+            self.coeffs = savgol_coeffs(self.window, order)
+
+    def _valid(self, x):
+        """
+        Returns the filter over each full window of x, len(x) - window + 1 values
+        """
+        w = self.window
+        if self.method == 'mean':
+            c = np.cumsum(np.vstack((np.zeros((1, x.shape[1])), x)), axis = 0)
+            return (c[w:] - c[:-w])/w
+        if self.method == 'savgol':
+            return np.column_stack([np.convolve(x[:,j], self.coeffs[::-1], 'valid') for j in range(x.shape[1])])
+        #median, in runs of rows so that the sorted copies of each window stay small
+        out, rows = [], 1<<16
+        for i in range(0, len(x) - w + 1, rows):
+            out.append(np.median(sliding_window_view(x[i:i + rows + w - 1], w, axis = 0), axis = -1))
+        return np.concatenate(out) if out else np.empty((0, x.shape[1]))
+
+    def feed(self, t, v):
+        """
+        Takes times t and an (n,k) array of values, returning the times and smoothed values of those
+        whose windows are now complete
+        """
+        self.k = v.shape[1]
+        if not len(t):
+            return _empty(self.k)
+        v = v.astype(np.float64, copy = False)
+        if self.held is None:
+            self.held = np.repeat(v[:1], self.half, axis = 0)
+        x = np.vstack((self.held, v))
+        times = np.concatenate((self.times, t))
+        n = max(len(x) - 2*self.half, 0)
+        self.held = x[len(x) - min(len(x), 2*self.half):]
+        self.times = times[n:]
+        if not n:
+            return _empty(self.k)
+        return times[:n], self._valid(x[:n + 2*self.half])
+
+    def flush(self):
+        """
+        Returns the times and smoothed values still held, at the end of the record
+        """
+        if self.held is None or not len(self.times):
+            return _empty(self.k)
+        x = np.vstack((self.held, np.repeat(self.held[-1:], self.half, axis = 0)))
+        t, self.times, self.held = self.times, np.empty(0, dtype = np.int64), None
+        return t, self._valid(x)
+
+class Pipeline(object):
+    """
+    Stages, such as Resample and Smooth, each taking what the one before gives
+    """
+    def __init__(self, stages):
+        self.stages = stages
+
+    def feed(self, t, v):
+        for s in self.stages:
+            t, v = s.feed(t, v)
+        return t, v
+
+    def flush(self):
+        t, v = None, None
+        for s in self.stages:
+            if t is None:
+                t, v = s.flush()
+                continue
+            t1, v1 = s.feed(t, v)
+            t2, v2 = s.flush()
+            t, v = np.concatenate((t1, t2)), np.vstack((v1, v2))
+        return t, v
+
+def pipeline(step = None, method = None, window = 5, order = 2):
+    """
+    Returns a Pipeline resampling onto a grid of step seconds (None: not resampled), then smoothing
+    with method (see Smooth, None: not smoothed) over window values
+    """
+    stages = []
+    if step:
+        stages.append(Resample(step))
+    if method:
+        stages.append(Smooth(method, window, order))
+    return Pipeline(stages)
+
+def read_pico_blocks(fname, channels = None, start = None, stop = None, block_size = 1<<24, progress = None,
+    dtype = np.float64):
+    """
+    Returns the channel names (see pico_columns, default: all) of a Pico csv and an iterator over blocks
+    of approximately block_size bytes of it, as epoch seconds and (n,len(channels)) arrays of dtype.
+    Where start and stop are given, only the blocks of the record spanning them are read, as for
+    read_pico_window. progress is called with the fraction read after each block.
+    """
+    index = TimeIndex.open(fname)
+    names, nfield, usecols = _pico_layout(index.header, channels)
+    if start is None or stop is None:
+        lo, hi = len(index.header), index.end
+    else:
+        found = index.byte_range(_epoch(start), _epoch(stop))
+        lo, hi = (0, 0) if found is None else found
+    def blocks():
+        with open(fname, 'rb') as f:
+            f.seek(lo)
+            pos = lo
+            while pos < hi:
+                data = f.read(min(block_size, hi - pos))
+                if pos + len(data) < hi and not data.endswith(b'\n'):
+                    data += f.readline()
+                pos += len(data)
+                dt, values = _pico_rows([data.decode('latin-1').replace('\r', '')], nfield, usecols, dtype)
+                yield dt.view(np.int64), values
+                if progress is not None:
+                    progress((pos - lo)/(hi - lo))
+    return names, blocks()
+
+def read_pico_reduced(fname, step = None, method = None, window = 5, order = 2, channels = None, start = None,
+    stop = None, block_size = 1<<24, progress = None, dtype = np.float64):
+    """
+    As read_pico_channels, or read_pico_window where start and stop are given, passing the record through
+    pipeline(step, method, window, order) block by block as it is read. Returns the channel names, an
+    (n,len(channels)) array of the reduced values, of dtype, and a datetime64[s] array.
+    """
+    with span('read_pico_reduced', file = fname) as s:
+        try:
+            names, blocks = read_pico_blocks(fname, channels, start, stop, block_size, progress, dtype)
+            reduce = pipeline(step, method, window, order)
+            dt, temp = [], []
+            for t, v in blocks:
+                t, v = reduce.feed(t, v)
+                dt.append(t)
+                temp.append(v.astype(dtype, copy = False))
+            t, v = reduce.flush()
+            if t is not None:
+                dt.append(t)
+                temp.append(v.astype(dtype, copy = False).reshape(-1, len(names)))
+            s['rows'] = sum(len(d) for d in dt)
+            if not dt:
+                return names, np.empty((0,len(names)),dtype=dtype), np.empty(0,dtype='datetime64[s]')
+            return names, np.concatenate(temp), np.concatenate(dt).astype(np.int64).view('datetime64[s]')
+        except Cancelled:
+            raise
+        except Exception as e:
+            print(e)
+            return None, None, None
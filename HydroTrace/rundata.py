@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser run data
+-------------------------------------------------------------------------------
+Holds the records of a run and the results calculated from them as compact
+numpy columns: times as int64 epoch seconds, with datetime64[s] views of them
+where dates are wanted, and temperatures as float32. Series derived from them,
+the times of GC runs and of the temperature record in minutes, are worked out
+when first asked for and kept until the columns they come from change, e.g.:
+
+>>>from HydroTrace.rundata import RunData
+>>>run = RunData.from_files('gc.txt', 'temp.csv', channel = 'Channel 2')
+>>>run.calculate(61, 86485, 1.66, 7.44, 20, delay = 2.64)
+>>>run.common_time, run.common_temp, run.d_rate
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import numpy as np
+from HydroTrace.hydro_trace_common import read_cs_file, read_pico_channels, interp_epoch, \
+    calc_total, calc_desorbtion_rate
+from HydroTrace.timeindex import read_pico_window
+from HydroTrace.resample import read_pico_reduced
+from HydroTrace.graph import Graph
+
+class RunData(object):
+    """
+    Columns of a run: the GC report (int_run, area and gc_epoch, the epoch seconds of each injection),
+    the temperature record (channels, an (n,k) float32 array of the channel_names recorded, and
+    temp_epoch) with temp the channel selected, and the results common_temp and d_rate calculated for
+    delay. Columns which haven't been read or calculated are None. dt and temp_dt are datetime64[s]
+    views of the epoch columns, run_epoch, common_time and temp_time are derived from them.
+    """
+    __slots__ = ('int_run', 'area', 'gc_epoch', 'channel_names', 'channels', 'channel', 'temp', 'temp_epoch',
+        'delay', 'common_temp', 'd_rate', '_run_epoch', '_common_time', '_temp_time')
+
+    def __init__(self):
+        self.int_run = self.area = self.gc_epoch = None
+        self.channel_names = self.channels = self.channel = self.temp = self.temp_epoch = None
+        self.delay = None
+        self.clear_results()
+        self._run_epoch = self._temp_time = None
+
+    def clear_results(self):
+        """
+        Drops results, which no longer hold once the records or parameters they came from change
+        """
+        self.common_temp = self.d_rate = None
+        self._common_time = None
+
+    def set_gc(self, int_run, area, dt):
+        """
+        Takes the GC report from read_cs_file; dt is held as epoch seconds without copying if it is
+        already datetime64[s]
+        """
+        self.int_run = np.asarray(int_run, dtype = np.int64)
+        self.area = np.asarray(area, dtype = np.float64)
+        self.gc_epoch = np.asarray(dt, dtype = 'datetime64[s]').view(np.int64)
+        self._run_epoch = None
+        self._temp_time = None
+        self.clear_results()
+
+    def set_temp(self, names, channels, dt):
+        """
+        Takes the temperature record from read_pico_channels, or a single channel, selecting the first.
+        Channels are held as float32, so reading them as float32 avoids a copy.
+        """
+        channels = np.asarray(channels, dtype = np.float32)
+        self.channels = channels.reshape(-1, 1) if channels.ndim == 1 else channels
+        self.channel_names = names
+        self.temp_epoch = np.asarray(dt, dtype = 'datetime64[s]').view(np.int64)
+        self._temp_time = None
+        self.select_channel(0)
+
+    def select_channel(self, i = 0):
+        """
+        Takes temp from channel i, a view of it, or the mean of all channels where i is None or beyond
+        the last channel. The channel used is recorded in channel, a list of names for the mean.
+        """
+        names = self.channel_names
+        if i is not None and i < self.channels.shape[1]:
+            self.temp = self.channels[:,i]
+            self.channel = None if names is None else names[i]
+        else:
+            self.temp = self.channels.mean(axis = 1)
+            self.channel = names
+        self.clear_results()
+
+    #datetime64[s] views of the epoch columns
+    dt = property(lambda self: None if self.gc_epoch is None else self.gc_epoch.view('datetime64[s]'))
+    temp_dt = property(lambda self: None if self.temp_epoch is None else self.temp_epoch.view('datetime64[s]'))
+
+    @property
+    def run_epoch(self):
+        """
+        Epoch seconds of each GC run, dt indexed by int_run
+        """
+        if self._run_epoch is None and self.gc_epoch is not None:
+            self._run_epoch = self.gc_epoch[self.int_run+1]
+        return self._run_epoch
+
+    @property
+    def origin(self):
+        """
+        Epoch seconds times are zeroed on, the earliest of either record
+        """
+        return min(self.run_epoch.min(), self.temp_epoch[0])
+
+    @property
+    def common_time(self):
+        """
+        Times of GC runs in minutes from origin
+        """
+        if self._common_time is None and self.gc_epoch is not None and self.temp_epoch is not None:
+            self._common_time = (self.run_epoch - self.origin)/60
+        return self._common_time
+
+    @common_time.setter
+    def common_time(self, values):
+        self._common_time = values
+
+    @property
+    def temp_time(self):
+        """
+        Times of the temperature record in minutes from origin, float32
+        """
+        if self._temp_time is None and self.gc_epoch is not None and self.temp_epoch is not None:
+            self._temp_time = ((self.temp_epoch - self.origin)/60).astype(np.float32)
+        return self._temp_time
+
+    @temp_time.setter
+    def temp_time(self, values):
+        self._temp_time = values
+
+    def aligned_temp(self, delay, out_of_range = 'nan'):
+        """
+        Returns the temperature at each GC run with the temperature record delayed by delay minutes,
+        as align_temp, without keeping it
+        """
+        return interp_epoch(self.temp_epoch, self.temp, self.run_epoch, delay*60, out_of_range)
+
+    def desorbtion_rate(self, content, spa, weight, molar_rate, rate):
+        """
+        Returns the desorbtion rate of each GC run, see calc_desorbtion_rate, without keeping it
+        """
+        return calc_desorbtion_rate(content, spa, weight, molar_rate, rate, self.area)
+
+    def total(self, content, spa, weight, molar_rate, rate, cycletime):
+        """
+        Returns the total hydrogen content, see calc_total
+        """
+        return calc_total(content, spa, weight, molar_rate, rate, cycletime, self.area)
+
+    def calculate(self, content, spa, weight, molar_rate, rate, delay, out_of_range = 'nan'):
+        """
+        Aligns the temperature record onto the GC runs with delay and calculates the desorbtion rate,
+        keeping both. Returns common_temp.
+        """
+        self.common_temp = self.aligned_temp(delay, out_of_range)
+        self.d_rate = self.desorbtion_rate(content, spa, weight, molar_rate, rate)
+        self.delay = delay
+        return self.common_temp
+
+    def columns(self):
+        """
+        Returns a dict of the columns of runfile.run_columns held, for write_run
+        """
+        columns = dict(common_time = self.common_time, common_temp = self.common_temp, d_rate = self.d_rate,
+            int_run = self.int_run, area = self.area, dt = self.dt, temp = self.temp, temp_dt = self.temp_dt,
+            temp_time = self.temp_time)
+        return {k: v for k, v in columns.items() if v is not None}
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held in columns, counting views once
+        """
+        held = {}
+        for name in self.__slots__:
+            a = getattr(self, name)
+            if isinstance(a, np.ndarray):
+                base = a if a.base is None or not isinstance(a.base, np.ndarray) else a.base
+                held[id(base)] = base.nbytes
+        return sum(held.values())
+
+    @classmethod
+    def from_columns(cls, columns, channel = None):
+        """
+        Returns the run held in a dict of columns from read_run, with the temperature channel(s) used
+        """
+        run = cls()
+        if all(k in columns for k in ('int_run', 'area', 'dt')):
+            run.set_gc(columns['int_run'], columns['area'], columns['dt'])
+        if 'temp' in columns and 'temp_dt' in columns:
+            run.set_temp(None, columns['temp'], columns['temp_dt'])
+            run.channel = channel
+        run.common_temp = columns.get('common_temp')
+        run.d_rate = columns.get('d_rate')
+        if 'common_time' in columns:
+            run.common_time = columns['common_time']
+        if 'temp_time' in columns:
+            run.temp_time = columns['temp_time']
+        return run
+
+    def temp_window(self, margin = 3600):
+        """
+        Returns the epoch seconds from margin seconds before the first GC run to margin seconds after the
+        last, the part of the temperature record needed for delays of up to margin
+        """
+        return self.run_epoch.min() - margin, self.run_epoch.max() + margin
+
+    @classmethod
+    def from_files(cls, gc = None, temp = None, channel = None, margin = 3600, reduction = None, cache = True):
+        """
+        Returns a run read from a ChemStation report and/or Pico csv, with the temperature taken from
+        channel (default: the first), or the mean of a list of channels, as for read_pico_csv_bulk.
+        Where both are read, only the window of the temperature record around the GC runs is, see
+        temp_window and read_pico_window, unless margin is None. If reduction gives the keyword
+        arguments of resample.pipeline, the temperature record is resampled and/or smoothed as it is
+        read, see read_pico_reduced. The GC report goes through the parsed file cache as for read_cs_file.
+        The columns of a file which couldn't be read are None.
+        """
+        run = cls()
+        if gc is not None:
+            int_run, area, dt = read_cs_file(gc, cache)
+            if area is not None:
+                run.set_gc(int_run, area, dt)
+        if temp is not None:
+            channel = 0 if channel is None else channel
+            channels = None
+            if run.area is not None and len(run.area) and margin is not None:
+                start, stop = run.temp_window(margin)
+                if reduction:
+                    names, channels, dt = read_pico_reduced(temp, channels = channel, start = start, stop = stop,
+                        dtype = np.float32, **reduction)
+                else:
+                    names, channels, dt = read_pico_window(temp, start, stop, channel, dtype = np.float32)
+            if channels is None or len(channels) < 2:
+                if reduction:
+                    names, channels, dt = read_pico_reduced(temp, channels = channel, dtype = np.float32, **reduction)
+                else:
+                    names, channels, dt = read_pico_channels(temp, channel, dtype = np.float32)
+            if channels is not None:
+                run.set_temp(names, channels, dt)
+                if channels.shape[1] > 1:
+                    run.select_channel(None)
+        return run
+
+#inputs of run_graph, run parameters named as stored by runfile.run_meta and columns of RunData
+graph_inputs = ['content','spa','weight','molar_rate','rate','cycletime','delay','area','temp','temp_epoch','run_epoch']
+
+def run_graph():
+    """
+    Returns a Graph of the calculations of the basic and temperature tabs from graph_inputs. As
+    calc_total and calc_desorbtion_rate are linear in area, the sum of area and the aligned temperatures
+    are held while parameters change and only the factors scaling area are recomputed:
+        area_sum, k_rate: sum of area and desorbtion rate per unit area
+        total, d_rate: total hydrogen content and desorbtion rate
+        common_temp: temperature at each GC run for delay
+    """
+    g = Graph()
+    for name in graph_inputs:
+        g.input(name)
+    g.stage('area_sum', np.sum, 'area')
+    g.stage('k_rate', lambda content, spa, weight, molar_rate, rate: calc_desorbtion_rate(content, spa, weight,
+        molar_rate, rate, 1.0), 'content', 'spa', 'weight', 'molar_rate', 'rate')
+    g.stage('total', lambda k_rate, cycletime, area_sum: k_rate*cycletime*area_sum, 'k_rate', 'cycletime', 'area_sum')
+    g.stage('d_rate', lambda k_rate, area: k_rate*area, 'k_rate', 'area')
+    g.stage('common_temp', lambda t0, temp, t1, delay: interp_epoch(t0, temp, t1, delay*60, 'nan'),
+        'temp_epoch', 'temp', 'run_epoch', 'delay')
+    return g
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser binary run files
+-------------------------------------------------------------------------------
+A processed run is stored as a .htb file: the magic bytes HTB1, each column as
+raw little endian array data aligned to 64 bytes, then a JSON footer giving the
+dtype, length and offset of each column along with run parameters, followed by
+the footer length as a uint64 and HTB1 again. Columns are written as they are
+supplied, in chunks if need be, and mapped straight back into memory on reading.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, json, struct
+import numpy as np
+from HydroTrace.cache import file_hash
+
+MAGIC = b'HTB1'
+ALIGN = 64
+
+#columns written for a run, those which aren't available are omitted
+run_columns = ['common_time','common_temp','d_rate','int_run','area','dt','temp','temp_dt','temp_time']
+
+class RunWriter(object):
+    """
+    Writes a .htb file column by column. Use as a context manager, or call close to write the footer.
+    """
+    def __init__(self, fname):
+        self.f = open(fname, 'wb')
+        self.f.write(MAGIC)
+        self.columns = {}
+        self.meta = {}
+        self._current = None
+
+    def _pad(self):
+        pos = self.f.tell()
+        self.f.write(b'\0'*(-pos % ALIGN))
+
+    def begin_column(self, name, dtype):
+        """
+        Starts a column which is then supplied in chunks with write_chunk
+        """
+        self.end_column()
+        self._pad()
+        dtype = np.dtype(dtype).newbyteorder('<')
+        self._current = name
+        self.columns[name] = dict(dtype = dtype.str, length = 0, offset = self.f.tell())
+
+    def write_chunk(self, values):
+        col = self.columns[self._current]
+        values = np.ascontiguousarray(values, dtype = np.dtype(col['dtype']))
+        self.f.write(values.tobytes())
+        col['length'] += len(values)
+
+    def end_column(self):
+        self._current = None
+
+    def write_column(self, name, values):
+        """
+        Writes a complete column
+        """
+        values = np.asarray(values)
+        self.begin_column(name, values.dtype)
+        self.write_chunk(values)
+        self.end_column()
+
+    def close(self):
+        self.end_column()
+        footer = json.dumps(dict(columns = self.columns, meta = self.meta)).encode('utf8')
+        self.f.write(footer)
+        self.f.write(struct.pack('<Q', len(footer)))
+        self.f.write(MAGIC)
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def read_run(fname, mmap = True):
+    """
+    Reads a .htb file, returning a dict of columns, memory mapped read only unless mmap is False,
+    and a dict of the run parameters stored with them.
+    """
+    with open(fname, 'rb') as f:
+        if f.read(4) != MAGIC:
+            raise ValueError('%s is not a HydroTrace run file.'%fname)
+        f.seek(-12, os.SEEK_END)
+        n, magic = struct.unpack('<Q4s', f.read(12))
+        if magic != MAGIC:
+            raise ValueError('%s is incomplete.'%fname)
+        f.seek(-12 - n, os.SEEK_END)
+        footer = json.loads(f.read(n).decode('utf8'))
+    columns = {}
+    for name, col in footer['columns'].items():
+        dtype = np.dtype(col['dtype'])
+        if col['length'] == 0:
+            columns[name] = np.empty(0, dtype = dtype)
+        elif mmap:
+            columns[name] = np.memmap(fname, dtype = dtype, mode = 'r', offset = col['offset'], shape = (col['length'],))
+        else:
+            columns[name] = np.fromfile(fname, dtype = dtype, count = col['length'], offset = col['offset'])
+    return columns, footer['meta']
+
+def write_run(fname, columns, meta):
+    """
+    Writes a dict of 1D arrays and a dict of JSON serialisable run parameters to a .htb file
+    """
+    with RunWriter(fname) as w:
+        w.meta = meta
+        for name, values in columns.items():
+            if values is not None:
+                w.write_column(name, values)
+
+def run_meta(content, molar_rate, spa, weight, rate, cycletime, delay, total = None,
+    gc = None, temp = None, channel = None, reduction = None):
+    """
+    Collects run parameters and source files into the form stored by write_run, hashing the
+    source files so that a run can be matched to them later. channel records the temperature
+    channel(s) used, as for read_pico_csv_bulk, and reduction how the temperature record was
+    resampled and smoothed, as for RunData.from_files.
+    """
+    meta = dict(params = dict(content = content, molar_rate = molar_rate, spa = spa,
+        weight = weight, rate = rate, cycletime = cycletime, delay = delay), total = total, sources = {},
+        channel = channel, reduction = reduction)
+    for key, fname in (('gc', gc), ('temp', temp)):
+        if fname is not None:
+            meta['sources'][key] = dict(path = os.path.abspath(fname), hash = file_hash(fname))
+    return meta
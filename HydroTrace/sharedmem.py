@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser shared memory worker process
+-------------------------------------------------------------------------------
+Runs file reading and calculations in a worker process, so that parsing doesn't
+hold the interpreter lock of the process running the interface, handing arrays
+back through shared memory rather than pickling them. The worker copies the
+arrays it returns into a single shared block, which the caller maps and views
+as numpy arrays without copying; arrays viewing a block are passed back to the
+worker the same way, so a temperature record read in the worker is never
+serialised or copied between processes. A block is freed by the next call once
+the caller holds no arrays viewing it. Calls may be made from several threads at
+once, e.g.:
+
+>>>from HydroTrace.sharedmem import SharedPool
+>>>with SharedPool() as pool:
+>>>    names, temps, dt = pool.call(read_pico_channels, ('temp.csv',))
+>>>    common_temp = pool.call(interp_epoch, (dt.view(np.int64), temps[:,0], t1))
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, queue, weakref, threading, multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from HydroTrace.hydro_trace_common import Cancelled
+from HydroTrace import profiling
+
+ALIGN = 64
+
+#an array held in shared block name, as for numpy.ndarray
+ArrayRef = namedtuple('ArrayRef', ['name', 'offset', 'dtype', 'shape', 'strides'])
+
+def _walk(value, fn):
+    """
+    Returns value with fn applied to each array or ArrayRef in the tuples, lists and dicts it is made of
+    """
+    if isinstance(value, (np.ndarray, ArrayRef)):
+        return fn(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(_walk(v, fn) for v in value)
+    if isinstance(value, dict):
+        return {k: _walk(v, fn) for k, v in value.items()}
+    return value
+
+def _view(buf, ref):
+    return np.ndarray(ref.shape, np.dtype(ref.dtype), buffer = buf, offset = ref.offset, strides = ref.strides)
+
+#worker process: blocks returned until the caller has mapped them, progress and cancel flags of each
+#call slot, and the slot of the call running
+_held = {}
+_progress = _cancel = None
+_slot = 0
+
+def _init(progress, cancel):
+    global _progress, _cancel
+    _progress, _cancel = progress, cancel
+    profiling.init_worker()
+
+def _report(fraction):
+    """
+    Progress callback handed to functions called in the worker, raising Cancelled once the caller cancels
+    """
+    if _cancel[_slot]:
+        raise Cancelled()
+    _progress[_slot] = fraction
+
+def _export(value):
+    """
+    Copies the arrays in value into a new shared block, returning value with ArrayRefs in their place
+    """
+    arrays, size = [], 0
+    def place(a):
+        nonlocal size
+        if a.dtype.hasobject or a.nbytes == 0:
+            return a
+        offset = -(-size//ALIGN)*ALIGN
+        size = offset + a.nbytes
+        arrays.append((a, offset))
+        return ArrayRef(None, offset, a.dtype.str, a.shape, None)
+    value = _walk(value, lambda a: a if isinstance(a, ArrayRef) else place(a))
+    if not arrays:
+        return value
+    shm = SharedMemory(create = True, size = size)
+    for a, offset in arrays:
+        _view(shm.buf, ArrayRef(None, offset, a.dtype.str, a.shape, None))[...] = a
+    _held[shm.name] = shm
+    return _walk(value, lambda r: r._replace(name = shm.name) if isinstance(r, ArrayRef) and r.name is None else r)
+
+def _call(fn, args, kwargs, report, slot):
+    """
+    Calls fn in the worker with ArrayRefs among its arguments mapped to arrays, returning its result
+    with the arrays in it exported. Progress and cancellation go through the flags of slot.
+    """
+    global _slot
+    _slot = slot
+    opened = {}
+    def attach(r):
+        if not isinstance(r, ArrayRef):
+            return r
+        if r.name not in opened:
+            opened[r.name] = SharedMemory(r.name)
+        return _view(opened[r.name].buf, r)
+    try:
+        args, kwargs = _walk(args, attach), _walk(kwargs, attach)
+        if report:
+            kwargs['progress'] = _report
+        return _export(fn(*args, **kwargs))
+    finally:
+        args = kwargs = None
+        for shm in opened.values():
+            try:
+                shm.close()
+            except BufferError:
+                pass #still viewed by something fn kept, closed when that is
+
+def _release(name):
+    """
+    Closes the worker's handle on a block once the caller has mapped it
+    """
+    shm = _held.pop(name, None)
+    if shm is not None:
+        shm.close()
+
+class SharedPool(object):
+    """
+    A pool of worker processes (default: one) returning arrays through shared memory, see call. Use as
+    a context manager, or call close once done with it. Up to slots calls report progress at once, any
+    more wait for one to finish.
+    """
+    def __init__(self, workers = 1, slots = 8):
+        if os.name == 'posix':
+            #the caller and workers share one tracker, which unlinks any blocks left if they exit early
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+        #workers are spawned rather than forked, as forking a process running Qt threads isn't safe
+        ctx = multiprocessing.get_context('spawn')
+        self._progress = ctx.RawArray('d', slots)
+        self._cancel = ctx.RawArray('b', slots)
+        self._slots = queue.Queue()
+        for slot in range(slots):
+            self._slots.put(slot)
+        self.pool = ProcessPoolExecutor(max_workers = workers, mp_context = ctx, initializer = _init,
+            initargs = (self._progress, self._cancel))
+        self._lock = threading.Lock()
+        self._blocks = {} #name: weak reference to the array viewing the whole block
+        self._names = {} #id of that array: name
+        self._freed = [] #(name, id, SharedMemory) of blocks no longer viewed, to be closed and unlinked
+
+    def call(self, fn, args = (), kwargs = None, progress = None, report = False):
+        """
+        Calls fn(*args, **kwargs) in a worker, returning its result with any arrays in it viewing shared
+        memory. Arrays among args and kwargs which view memory shared by this pool are handed over
+        without copying, others are pickled. fn is passed a progress callback as progress if report is
+        True. progress, if given, is called here with the fraction reported as fn runs, and may raise
+        Cancelled to cancel it, which is then raised once fn has stopped.
+        """
+        kwargs = {} if kwargs is None else kwargs
+        slot = self._slots.get()
+        try:
+            self._cancel[slot] = 0
+            self._progress[slot] = 0.0
+            future = self.pool.submit(_call, fn, self._share(args), self._share(kwargs), report, slot)
+            cancelled = False
+            while not future.done():
+                wait([future], timeout = 0.05)
+                if progress is not None and not cancelled:
+                    try:
+                        progress(self._progress[slot])
+                    except Cancelled:
+                        self._cancel[slot] = cancelled = 1
+            #results are mapped even when cancelled so that their block is freed
+            result = self._attach(future.result())
+        finally:
+            self._slots.put(slot)
+        if cancelled:
+            raise Cancelled()
+        return result
+
+    def _share(self, value):
+        """
+        Replaces arrays viewing blocks of this pool with ArrayRefs
+        """
+        def ref(a):
+            root = a
+            while isinstance(root.base, np.ndarray):
+                root = root.base
+            name = self._names.get(id(root))
+            if name is None or self._blocks[name]() is not root:
+                return a
+            offset = a.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+            return ArrayRef(name, offset, a.dtype.str, a.shape, a.strides)
+        self._drain()
+        with self._lock:
+            return _walk(value, ref)
+
+    def _attach(self, value):
+        """
+        Maps the blocks ArrayRefs in value are held in, returning value with arrays in their place
+        """
+        new = []
+        def view(r):
+            if not isinstance(r, ArrayRef):
+                return r
+            with self._lock:
+                block = self._blocks[r.name]() if r.name in self._blocks else None
+                if block is None:
+                    block = self._map(r.name)
+                    new.append(r.name)
+            return _view(block, r)
+        value = _walk(value, view)
+        for name in new:
+            self.pool.submit(_release, name)
+        return value
+
+    def _map(self, name):
+        """
+        Returns an array viewing the whole of block name through the SharedMemory opening it, which is
+        kept until the last array viewing the block has gone
+        """
+        shm = SharedMemory(name)
+        block = np.frombuffer(shm.buf, dtype = np.uint8)
+        self._blocks[name] = weakref.ref(block)
+        self._names[id(block)] = name
+        #the finalizer may run from garbage collection anywhere, even where this thread holds the lock,
+        #and while the array still exports the buffer, so it only queues the block to be freed
+        weakref.finalize(block, self._freed.append, (name, id(block), shm))
+        return block
+
+    def _drain(self):
+        """
+        Closes and unlinks the blocks no arrays view any more
+        """
+        freed = []
+        while self._freed:
+            freed.append(self._freed.pop())
+        with self._lock:
+            for name, key, shm in freed:
+                if self._names.get(key) == name:
+                    del self._names[key]
+                if name in self._blocks and self._blocks[name]() is None:
+                    del self._blocks[name]
+        for item in freed:
+            try:
+                item[2].close()
+            except BufferError:
+                #the array is still being deallocated in another thread
+                self._freed.append(item)
+                continue
+            item[2].unlink()
+
+    def close(self):
+        """
+        Shuts the workers down and frees the blocks no longer viewed. Arrays already returned stay valid,
+        their blocks being freed by the next call or close once they have gone.
+        """
+        self.pool.shutdown(wait = True)
+        self._drain()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
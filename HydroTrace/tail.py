@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser live following of in-progress runs
+-------------------------------------------------------------------------------
+Follows a growing Pico temperature record by parsing only the bytes appended
+since it was last read, and a ChemStation report as it is rewritten, keeping
+the total hydrogen content and desorbtion vs. temperature record up to date.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os
+import numpy as np
+from HydroTrace.hydro_trace_common import _pico_block, pico_epoch, pico_columns, parse_cs_file, \
+    ChemStationError, interp_epoch, calc_total, calc_desorbtion_rate
+
+class GrowableArray(object):
+    """
+    1D array which can be extended in place, with capacity doubling as needed. data is a view of
+    the values held.
+    """
+    def __init__(self, dtype, capacity = 1024):
+        self._buf = np.empty(capacity, dtype = dtype)
+        self.n = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype = self._buf.dtype)
+        need = self.n + len(values)
+        if need > len(self._buf):
+            buf = np.empty(max(need, 2*len(self._buf)), dtype = self._buf.dtype)
+            buf[:self.n] = self._buf[:self.n]
+            self._buf = buf
+        self._buf[self.n:need] = values
+        self.n = need
+
+    def clear(self):
+        self.n = 0
+
+    @property
+    def data(self):
+        return self._buf[:self.n]
+
+    def __len__(self):
+        return self.n
+
+class PicoTail(object):
+    """
+    Follows a Pico csv as it is written, see read_pico_csv_bulk. Each poll parses the complete lines
+    added since the last, a partly written last line is left for the next poll. If the file shrinks
+    it is assumed to have been restarted and is read again from the beginning. channel is as for
+    read_pico_csv_bulk. Temperatures are held as float32, as for RunData.
+    """
+    def __init__(self, fname, channel = None):
+        self.fname = fname
+        self.channel = 0 if channel is None else channel
+        self.temp = GrowableArray(np.float32)
+        self.dt = GrowableArray('datetime64[s]')
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.nfield = None
+        self.temp.clear()
+        self.dt.clear()
+
+    def poll(self):
+        """
+        Reads any new lines, returning the number of values added. None are while the record can't be
+        opened, e.g. while it is locked or being replaced; it is read again on the next poll.
+        """
+        try:
+            if os.path.getsize(self.fname) < self.offset:
+                self.reset()
+            with open(self.fname, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return 0
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        text = data[:end].decode('latin-1')
+        self.offset += end
+        if self.nfield is None:
+            header, _, text = text.partition('\n')
+            self.nfield = header.count(',') + 6
+            names = [h.strip() for h in header.rstrip('\r').split(',')[2:]]
+            self.cols = [7 + c for c in pico_columns(names, self.channel)]
+        block = _pico_block([text], self.nfield)
+        self.dt.extend(pico_epoch(*block[:,1:7].T))
+        self.temp.extend(block[:,self.cols].mean(axis=1))
+        return len(block)
+
+class CSFollower(object):
+    """
+    Follows a Chem Station report, parsing it again when its size or modification time change. A
+    report which can't be opened or parsed, e.g. while it is locked or being written, leaves the last
+    result in place until the next poll.
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self.stamp = None
+        self.int_run = np.empty(0, dtype = np.int64)
+        self.area = np.empty(0)
+        self.dt = np.empty(0, dtype = 'datetime64[s]')
+
+    def poll(self):
+        """
+        Returns True if the report has been read again
+        """
+        try:
+            st = os.stat(self.fname)
+            if (st.st_size, st.st_mtime_ns) == self.stamp:
+                return False
+            int_run, area, dt = parse_cs_file(self.fname)
+        except (ChemStationError, UnicodeError, OSError):
+            return False
+        self.stamp = (st.st_size, st.st_mtime_ns)
+        #only runs which can be indexed in dt
+        valid = int_run + 1 < len(dt)
+        self.int_run, self.area, self.dt = int_run[valid], area[valid], dt
+        return True
+
+class LiveRun(object):
+    """
+    Keeps the results of the basic and temperature tabs up to date for a GC report and temperature
+    record which are still being written. poll picks up new data; temperature values are only
+    converted for new lines and GC runs are only aligned once the temperature record covers them.
+    """
+    def __init__(self, cs_fname, temp_fname, content, spa, weight, flowconst, rate, cycletime, delay,
+        channel = None):
+        self.cs = CSFollower(cs_fname)
+        self.pico = PicoTail(temp_fname, channel)
+        self.temp_time = GrowableArray(np.float32)
+        self.origin = None
+        self.area_sum = 0.0
+        self.common_temp = np.empty(0)
+        self.pending = 0 #first GC run not yet covered by the temperature record
+        self.set_params(content, spa, weight, flowconst, rate, cycletime, delay)
+
+    def set_params(self, content, spa, weight, flowconst, rate, cycletime, delay):
+        """
+        Updates run parameters; both calc_total and calc_desorbtion_rate are linear in area
+        """
+        self.k_total = calc_total(content, spa, weight, flowconst, rate, cycletime, 1.0)
+        self.k_rate = calc_desorbtion_rate(content, spa, weight, flowconst, rate, 1.0)
+        if self.origin is not None and delay != self.delay:
+            self.common_temp = np.full(len(self.area), np.nan)
+            self.pending = 0
+        self.delay = delay
+        self._align()
+
+    #current state of the followed files
+    int_run = property(lambda self: self.cs.int_run)
+    area = property(lambda self: self.cs.area)
+    dt = property(lambda self: self.cs.dt)
+    temp = property(lambda self: self.pico.temp.data)
+    temp_dt = property(lambda self: self.pico.dt.data)
+    total = property(lambda self: self.k_total*self.area_sum)
+    d_rate = property(lambda self: self.k_rate*self.area)
+
+    @property
+    def common_time(self):
+        return (self.dt[self.int_run+1].view(np.int64) - self.origin)/60
+
+    def poll(self):
+        """
+        Reads new data from both files, returning True if anything changed
+        """
+        n_prev = len(self.area)
+        prev_area, prev_run = self.area, self.int_run
+        try:
+            restarted = len(self.pico.temp) and os.path.getsize(self.pico.fname) < self.pico.offset
+        except OSError:
+            restarted = False
+        new_temp = self.pico.poll()
+        new_runs = self.cs.poll()
+        if not (new_temp or new_runs or restarted):
+            return False
+
+        if restarted or (new_runs and not (len(self.area) >= n_prev and
+            np.array_equal(self.area[:n_prev], prev_area) and np.array_equal(self.int_run[:n_prev], prev_run))):
+            #start over if either file has been replaced rather than added to
+            self.origin = None
+            self.temp_time.clear()
+            self.area_sum = np.sum(self.area)
+            self.common_temp = np.full(len(self.area), np.nan)
+            self.pending = 0
+        elif new_runs:
+            self.area_sum += np.sum(self.area[n_prev:])
+            self.common_temp = np.append(self.common_temp, np.full(len(self.area) - n_prev, np.nan))
+
+        if self.origin is None:
+            if len(self.area) == 0 or len(self.temp) == 0:
+                return True
+            self.origin = min(self.dt[self.int_run+1].view(np.int64).min(), self.temp_dt.view(np.int64)[0])
+            self.temp_time.clear()
+        t0 = self.temp_dt.view(np.int64)
+        self.temp_time.extend((t0[len(self.temp_time):] - self.origin)/60)
+        self._align()
+        return True
+
+    def _align(self):
+        """
+        Aligns GC runs from the first pending one which are now covered by the temperature record
+        """
+        if self.origin is None or len(self.temp) < 2:
+            return
+        t0 = self.temp_dt.view(np.int64)
+        t1 = self.dt[self.int_run+1].view(np.int64)
+        covered = np.searchsorted(t1 - self.delay*60, t0[-1], side='right')
+        if covered > self.pending:
+            self.common_temp[self.pending:covered] = interp_epoch(t0, self.temp,
+                t1[self.pending:covered], self.delay*60, 'nan')
+            self.pending = covered
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser time index for temperature records
+-------------------------------------------------------------------------------
+A Pico logger left running across several GC sequences gives a record far
+longer than any one of them needs. A sparse index of the record, kept in the
+cache directory (see HydroTrace.cache) rather than beside the record, gives the
+byte offset and first and last time of each block of about a megabyte, so that
+the window of the record covering a GC sequence can be read on its own. Only the lines either side of
+each block boundary are read to build the index, and it is extended rather than
+rebuilt as the record grows, e.g.:
+
+>>>from HydroTrace.timeindex import read_pico_window
+>>>names, temps, dt = read_pico_window('temp.csv', '2020-03-09T17:00', '2020-03-10T09:00')
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, json, hashlib, tempfile
+import numpy as np
+from HydroTrace.hydro_trace_common import _pico_layout, _pico_rows, _pico_fields, pico_epoch, _epoch, Cancelled
+from HydroTrace.cache import default_cache_dir
+from HydroTrace.profiling import span
+
+VERSION = 1
+HEAD = 4096 #bytes at the start of a record checked to tell if it has been replaced
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+#mode of saved indices, as for files opened for writing rather than the owner only mode of mkstemp
+_mode = 0o666 & ~_umask()
+
+def _stamp(line):
+    """
+    Returns the epoch seconds of a line of a Pico csv
+    """
+    d, m, y, hh, mm, ss = line.decode('latin-1').translate(_pico_fields).split(',')[1:7]
+    return int(pico_epoch(int(d), int(m), int(y), int(hh), int(mm), int(ss)).astype(np.int64))
+
+def _head_hash(f, n):
+    f.seek(0)
+    return hashlib.blake2b(f.read(n), digest_size = 20).hexdigest()
+
+def index_path(fname):
+    """
+    Returns the file in the cache directory holding the index of fname, keyed by its absolute path as
+    the record may still be growing; a record replaced at the same path is told apart by its start
+    """
+    key = hashlib.blake2b(os.path.abspath(fname).encode('utf8'), digest_size = 20).hexdigest()
+    return os.path.join(default_cache_dir(), 'index', key + '.hti')
+
+class TimeIndex(object):
+    """
+    Sparse time index of a Pico csv. Block i starts at byte offset[i] and ends where the next begins,
+    or at end for the last, which is the end of the last complete line indexed. first and last are the
+    epoch seconds of the first and last lines of each block; as Pico records are written in time
+    order, these are the earliest and latest times in the block.
+    """
+    def __init__(self, fname, block = 1<<20):
+        self.fname = fname
+        self.block = block
+        self.header = None
+        self.head = (0, None)
+        self.offset, self.first, self.last = [], [], []
+        self.end = 0
+
+    @classmethod
+    def open(cls, fname, block = 1<<20):
+        """
+        Returns the index of fname, loading any saved index and bringing it up to date with the record, and
+        saving it again if anything was added
+        """
+        index = cls(fname, block)
+        index.load()
+        if index.update():
+            try:
+                index.save()
+            except OSError as e:
+                print(e)
+        return index
+
+    def load(self):
+        """
+        Loads the saved index, if there is one for the same block size; returns True if so
+        """
+        try:
+            with open(index_path(self.fname)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get('version') != VERSION or state.get('block') != self.block:
+            return False
+        self.header = state['header']
+        self.head = tuple(state['head'])
+        self.offset, self.first, self.last = state['offset'], state['first'], state['last']
+        self.end = state['end']
+        return True
+
+    def save(self):
+        """
+        Saves the index, replacing any previous one in a single step so readers in other processes see
+        either the old or new index
+        """
+        path = index_path(self.fname)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)), suffix = '.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(version = VERSION, block = self.block, header = self.header, head = list(self.head),
+                offset = self.offset, first = self.first, last = self.last, end = self.end), f)
+        os.chmod(tmp, _mode)
+        os.replace(tmp, path)
+
+    def reset(self):
+        self.header = None
+        self.head = (0, None)
+        self.offset, self.first, self.last = [], [], []
+        self.end = 0
+
+    def update(self):
+        """
+        Indexes lines added to the record since the index was last brought up to date, starting again if
+        the record has shrunk or its start has changed. The last block is indexed again as it may have
+        grown. Returns True if the index changed.
+        """
+        with span('TimeIndex.update', file = self.fname) as s, open(self.fname, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.end or (self.head[1] is not None and _head_hash(f, self.head[0]) != self.head[1]):
+                self.reset()
+            if size == self.end and self.header is not None:
+                return False
+            if self.header is None:
+                f.seek(0)
+                header = f.readline()
+                if not header.endswith(b'\n'):
+                    return False
+                self.header = header.decode('latin-1')
+                self.end = len(header)
+            pos = self.end
+            if self.offset:
+                #the last block is extended rather than followed by a short one
+                pos = self.offset.pop()
+                self.first.pop()
+                self.last.pop()
+            added = 0
+            while pos < size:
+                if size - pos <= 2*self.block:
+                    f.seek(pos)
+                    data = f.read(size - pos)
+                    stop = pos + data.rfind(b'\n') + 1
+                    if stop <= pos:
+                        break
+                    lines = data[:stop-pos].splitlines()
+                    first, last = lines[0], lines[-1]
+                else:
+                    f.seek(pos + self.block - 1)
+                    f.readline()
+                    stop = f.tell()
+                    f.seek(pos)
+                    first = f.readline()
+                    back = max(pos, stop - 4096)
+                    f.seek(back)
+                    last = f.read(stop - back).rstrip(b'\r\n').rsplit(b'\n', 1)[-1]
+                self.offset.append(pos)
+                self.first.append(_stamp(first))
+                self.last.append(_stamp(last))
+                added += 1
+                pos = stop
+            self.end = pos
+            self.head = (min(size, HEAD), _head_hash(f, min(size, HEAD)))
+            s['blocks'] = added
+            return True
+
+    def byte_range(self, start, stop):
+        """
+        Returns the byte offsets (lo, hi) of the blocks holding epoch seconds start to stop, including a
+        line at or before start and one at or after stop where the record has them, or None if the record
+        doesn't reach into start to stop
+        """
+        if not self.offset or start > self.last[-1] or stop < self.first[0]:
+            return None
+        first = np.array(self.first, dtype = np.int64)
+        last = np.array(self.last, dtype = np.int64)
+        i0 = max(np.searchsorted(first, start, side = 'right') - 1, 0)
+        i1 = min(np.searchsorted(last, stop, side = 'left'), len(last) - 1)
+        ends = self.offset[1:] + [self.end]
+        return self.offset[i0], ends[i1]
+
+def read_pico_window(fname, start, stop, channels = None, block_size = 1<<24, progress = None,
+    dtype = np.float64, index = None):
+    """
+    As read_pico_channels, reading only the blocks of the record spanning start to stop (epoch seconds,
+    or dates as for numpy.datetime64) found from its TimeIndex (default: TimeIndex.open(fname)). The
+    values returned run from the last before start, or the first, to the first after stop, or the last,
+    with some either side; they are empty if the record lies wholly outside start to stop.
+    """
+    with span('read_pico_window', file = fname) as s:
+        try:
+            index = TimeIndex.open(fname) if index is None else index
+            names, nfield, usecols = _pico_layout(index.header, channels)
+            found = index.byte_range(_epoch(start), _epoch(stop))
+            temp, dt = [], []
+            if found is not None:
+                lo, hi = found
+                with open(fname, 'rb') as f:
+                    f.seek(lo)
+                    pos = lo
+                    while pos < hi:
+                        data = f.read(min(block_size, hi - pos))
+                        if pos + len(data) < hi and not data.endswith(b'\n'):
+                            data += f.readline()
+                        pos += len(data)
+                        d, t = _pico_rows([data.decode('latin-1').replace('\r', '')], nfield, usecols, dtype)
+                        dt.append(d)
+                        temp.append(t)
+                        if progress is not None:
+                            progress((pos - lo)/(hi - lo))
+                s['bytes'] = hi - lo
+            s['rows'] = sum(len(d) for d in dt)
+            if not dt:
+                return names, np.empty((0,len(names)),dtype=dtype), np.empty(0,dtype='datetime64[s]')
+            return names, np.concatenate(temp), np.concatenate(dt)
+        except Cancelled:
+            raise
+        except Exception as e:
+            print(e)
+            return None, None, None
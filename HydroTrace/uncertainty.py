@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser uncertainty propagation
+-------------------------------------------------------------------------------
+Monte Carlo propagation of the uncertainty in run parameters to the total
+hydrogen content and the desorbtion vs. temperature record. Parameters are
+drawn from normal distributions given their standard uncertainties and the
+calculations carried out for all draws at once, e.g.:
+
+>>>from HydroTrace.uncertainty import propagate
+>>>params = dict(content=61, spa=86485, weight=1.66, molar_rate=7.44, rate=20, cycletime=2.3, delay=2.64)
+>>>res = propagate(params, dict(spa=1500, weight=0.005, delay=0.2), area, temp, temp_dt, dt, int_run)
+>>>res['total'] #2.5, 50 and 97.5 percentiles of total hydrogen content in ppm
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import numpy as np
+from HydroTrace.hydro_trace_common import calc_desorbtion_rate, interp_epoch
+
+#run parameters in the order of calc_total, named as stored by runfile.run_meta
+param_names = ['content','spa','weight','molar_rate','rate','cycletime','delay']
+
+def draw_params(params, sd, n = 100000, seed = None):
+    """
+    Returns a dict of n normally distributed draws of each of params (dict keyed by param_names)
+    which has a standard uncertainty in sd, in the same units. Others are held at their nominal value.
+    """
+    unknown = set(sd) - set(param_names)
+    if unknown:
+        raise ValueError('Unknown parameters %s.'%', '.join(sorted(unknown)))
+    rng = np.random.default_rng(seed)
+    draws = dict(params)
+    for name in param_names:
+        if sd.get(name):
+            draws[name] = params[name] + sd[name]*rng.standard_normal(n)
+    return draws
+
+def propagate(params, sd, area, temp = None, temp_dt = None, dt = None, int_run = None, n = 100000,
+    percentiles = (2.5, 50, 97.5), seed = None, n_delay = 500, block = 1<<22):
+    """
+    Propagates standard uncertainties sd in params through calc_total and calc_desorbtion_rate for
+    area from read_cs_file with n draws. Both are linear in area, so the factor relating them to
+    area is evaluated for all draws at once rather than an n by len(area) array of results.
+    Returns a dict of:
+        total: percentiles of total hydrogen content (ppm)
+        total_samples: the n draws of total hydrogen content
+        d_rate: percentiles of desorbtion rate (ppm/min), shape (len(percentiles),len(area))
+        common_temp: percentiles of the temperature of each GC run, of the same shape, if the
+        temperature record is given (temp, temp_dt, dt, int_run as for align_temp), otherwise None.
+    The temperature percentiles are found for n_delay quantiles of the delay draws, a run for which
+    any of these fall outside the temperature record has nan percentiles. GC runs are taken in
+    blocks so that at most block temperatures are interpolated at once.
+    """
+    draws = draw_params(params, sd, n, seed)
+    area = np.asarray(area, dtype = np.float64)
+    k = np.broadcast_to(calc_desorbtion_rate(draws['content'], draws['spa'], draws['weight'],
+        draws['molar_rate'], draws['rate'], 1.0), (n,))
+    total_samples = k*draws['cycletime']*np.sum(area)
+    #scaling by a negative area turns the p-th percentile of k into the (100-p)th
+    q = np.percentile(k, percentiles)
+    q_neg = np.percentile(k, 100 - np.asarray(percentiles, dtype = np.float64))
+    d_rate = np.where(area >= 0, q[:,None]*area, q_neg[:,None]*area)
+    res = dict(total = np.percentile(total_samples, percentiles), total_samples = total_samples,
+        d_rate = d_rate, common_temp = None)
+    if temp is not None:
+        t0 = np.asarray(temp_dt, dtype = 'datetime64[s]').view(np.int64)
+        t1 = np.asarray(dt, dtype = 'datetime64[s]')[int_run+1].view(np.int64)
+        delays = np.atleast_1d(draws['delay'])
+        if len(delays) > n_delay:
+            delays = np.quantile(delays, (np.arange(n_delay) + 0.5)/n_delay)
+        res['common_temp'] = np.empty((len(percentiles), len(t1)))
+        step = max(block//len(delays), 1)
+        for i in range(0, len(t1), step):
+            common_temp = interp_epoch(t0, temp, t1[i:i+step], delays[:,None]*60, 'nan')
+            res['common_temp'][:,i:i+step] = np.percentile(common_temp, percentiles, axis = 0)
+    return res
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser watch folder service
+-------------------------------------------------------------------------------
+Watches a directory which finished ChemStation reports and Pico temperature
+records are dropped into, pairing each report with the temperature record which
+covers its GC runs and processing the pairs as batch processing does, e.g.:
+
+>python -m HydroTrace.watch incoming -o results --spa 86485 --weight 1.66 --rate 20 --cycletime 2.3
+
+Reports are processed once per content, however often they are copied in or
+renamed, on a bounded pool of worker processes, with failed jobs retried. Job
+state is kept in results/watch_state.json so that the service can be stopped
+and started again without processing anything twice, with a log of what has
+been done in results/watch.log and a summary of all runs in results/summary.csv.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import os, sys, time, glob, json, argparse, tempfile, yaml
+from concurrent.futures import ProcessPoolExecutor
+from HydroTrace.hydro_trace_common import parse_cs_file, ChemStationError
+from HydroTrace.cache import file_hash
+from HydroTrace.timeindex import TimeIndex
+from HydroTrace.pairing import best_overlap
+from HydroTrace.profiling import init_worker
+from HydroTrace.batch import process_run, _failed_row, write_summary, read_settings, summary_fields, unreadable
+
+#parameters of each run, as for a batch manifest
+run_params = ['spa','weight','rate','cycletime','delay','channel','material']
+
+def _attempt_run(args):
+    """
+    As batch._process_run, returning the summary row and whether the run may pass if tried again: if
+    its files couldn't be read or processing raised an error, as happens while they are being written
+    """
+    try:
+        row = process_run(*args)
+    except Exception as e:
+        return _failed_row(args[0], e), True
+    return row, row['status'] in unreadable
+
+class WatchService(object):
+    """
+    Pairs and processes the GC reports (gc_pattern) and temperature records (temp_pattern) in watchd,
+    writing results to outputd. params gives the run parameters applied to all runs, see run_params.
+    A report is taken once it has been left unchanged for settle seconds, and paired with the
+    temperature record overlapping its GC runs the most. While a record which doesn't yet cover all of
+    them is still being written, the report waits for it. Jobs which fail as their files couldn't be
+    read or processing raised an error are tried up to retries times, waiting longer each time; other
+    failures, e.g. a record which doesn't span the GC runs, would be the same again and are final.
+    """
+    def __init__(self, watchd, outputd, params, content, flowconst, workers = None, htb = False,
+        gc_pattern = '*.txt', temp_pattern = '*.csv', settle = 5.0, retries = 3, backoff = 10.0):
+        self.watchd = watchd
+        self.outputd = outputd
+        self.params = params
+        self.content = content
+        self.flowconst = flowconst
+        self.workers = workers or os.cpu_count() or 1
+        self.htb = htb
+        self.patterns = dict(gc = gc_pattern, temp = temp_pattern)
+        self.settle = settle
+        self.retries = retries
+        self.backoff = backoff
+        os.makedirs(outputd, exist_ok = True)
+        self.state_file = os.path.join(outputd, 'watch_state.json')
+        self.log_file = os.path.join(outputd, 'watch.log')
+        self.state = self._load_state()
+        self.running = {}
+        self.indices = {}
+        #jobs interrupted when the service last stopped are run again
+        for job in self.state['jobs'].values():
+            if job['status'] == 'running':
+                job['status'] = 'queued'
+
+    def _load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict(files = {}, jobs = {})
+
+    def save(self):
+        """
+        Writes the job state, replacing the previous one in a single step
+        """
+        fd, tmp = tempfile.mkstemp(dir = self.outputd, suffix = '.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.state, f, indent = 1)
+        os.replace(tmp, self.state_file)
+
+    def log(self, msg):
+        line = '%s %s'%(time.strftime('%Y-%m-%d %H:%M:%S'), msg)
+        print(line)
+        with open(self.log_file, 'a') as f:
+            f.write(line + '\n')
+
+    def scan(self):
+        """
+        Examines files which are new or have changed since the last scan, reading the span of GC runs
+        of reports which have settled and the span of temperature records. Returns True if any changed.
+        """
+        changed = False
+        files = self.state['files']
+        now = time.time()
+        for kind, pattern in self.patterns.items():
+            for path in sorted(glob.glob(os.path.join(self.watchd, pattern))):
+                path = os.path.abspath(path)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                seen = files.get(path)
+                if seen is not None and seen['size'] == st.st_size and seen['mtime'] == st.st_mtime_ns:
+                    continue
+                if kind == 'gc' and now - st.st_mtime < self.settle:
+                    continue
+                info = dict(kind = kind, size = st.st_size, mtime = st.st_mtime_ns, start = None, stop = None, error = None)
+                try:
+                    if kind == 'gc':
+                        int_run, area, dt = parse_cs_file(path)
+                        if not len(int_run):
+                            raise ValueError('no GC runs with peak areas.')
+                        runs = dt[int_run+1].view('int64')
+                        info.update(start = int(runs.min()), stop = int(runs.max()), hash = file_hash(path))
+                    else:
+                        index = self.indices.get(path)
+                        if index is None:
+                            index = self.indices[path] = TimeIndex.open(path)
+                        elif index.update():
+                            index.save()
+                        if index.offset:
+                            info.update(start = index.first[0], stop = index.last[-1])
+                except (OSError, UnicodeError, ValueError, ChemStationError) as e:
+                    info['error'] = str(e)
+                    if seen is None or seen.get('error') != info['error']:
+                        self.log('Cannot read %s: %s'%(path, e))
+                files[path] = info
+                changed = True
+        #files which have been removed
+        for path in [p for p in files if not os.path.exists(p)]:
+            del files[path]
+            changed = True
+        return changed
+
+    def pair(self):
+        """
+        Queues a job for each settled GC report whose content hasn't been seen before and for which a
+        temperature record can be found. Returns the number of jobs queued.
+        """
+        files, jobs = self.state['files'], self.state['jobs']
+        temps = {p: f for p, f in files.items() if f['kind'] == 'temp' and f['start'] is not None}
+        queued = 0
+        now = time.time()
+        for path, gc in sorted(files.items()):
+            if gc['kind'] != 'gc' or gc['error'] is not None or gc['hash'] in jobs:
+                continue
+            best, overlap = best_overlap((gc['start'], gc['stop']), {p: (t['start'], t['stop']) for p, t in temps.items()})
+            if best is None:
+                continue
+            t = temps[best]
+            covered = t['start'] <= gc['start'] and t['stop'] >= gc['stop']
+            if not covered and now - t['mtime']/1e9 < self.settle:
+                continue #the record is still being written
+            name = os.path.splitext(os.path.basename(path))[0]
+            if any(j['name'] == name for j in jobs.values()):
+                name = '%s_%s'%(name, gc['hash'][:8])
+            jobs[gc['hash']] = dict(name = name, gc = path, temp = best, status = 'queued', attempts = 0,
+                not_before = 0, row = None, queued = now)
+            self.log('Queued %s: %s with %s'%(name, os.path.basename(path), os.path.basename(best)))
+            queued += 1
+        return queued
+
+    def dispatch(self, pool):
+        """
+        Submits queued jobs which are due to pool, keeping at most twice as many in flight as workers
+        """
+        now = time.time()
+        queued = sorted((j['queued'], key) for key, j in self.state['jobs'].items()
+            if j['status'] == 'queued' and j['not_before'] <= now)
+        for _, key in queued[:max(2*self.workers - len(self.running), 0)]:
+            job = self.state['jobs'][key]
+            run = dict(name = job['name'], gc = job['gc'], temp = job['temp'])
+            run.update((p, self.params.get(p)) for p in run_params)
+            run['delay'] = run['delay'] or 0
+            job['status'] = 'running'
+            job['attempts'] += 1
+            self.running[pool.submit(_attempt_run, (run, self.content, self.flowconst, self.outputd, self.htb))] = key
+        return len(queued)
+
+    def collect(self, timeout = 0):
+        """
+        Records the results of finished jobs, queueing those which may pass another time to be tried
+        again (see _attempt_run). Returns the number finished.
+        """
+        done = [f for f in self.running if f.done()]
+        if not done and timeout:
+            time.sleep(timeout)
+            done = [f for f in self.running if f.done()]
+        for future in done:
+            key = self.running.pop(future)
+            job = self.state['jobs'][key]
+            try:
+                row, retry = future.result()
+            except Exception as e:
+                row, retry = _failed_row(job, e), True
+            job['row'] = {k: (v if isinstance(v, (str, int)) else float(v)) for k, v in row.items()}
+            if row['status'] == 'ok':
+                job['status'] = 'done'
+                self.log('Processed %s: %s ppm'%(job['name'], row['total']))
+            elif retry and job['attempts'] < self.retries:
+                job['status'] = 'queued'
+                job['not_before'] = time.time() + self.backoff*2**(job['attempts'] - 1)
+                self.log('Failed %s (attempt %d of %d), retrying: %s'%(job['name'], job['attempts'], self.retries, row['status']))
+            else:
+                job['status'] = 'failed'
+                self.log('Failed %s: %s'%(job['name'], row['status']))
+        if done:
+            self.write_summary()
+        return len(done)
+
+    def write_summary(self):
+        rows = [j['row'] for j in sorted(self.state['jobs'].values(), key = lambda j: j['queued'])
+            if j['status'] in ('done', 'failed') and j['row'] is not None]
+        write_summary(os.path.join(self.outputd, 'summary.csv'), [{k: r.get(k, '') for k in summary_fields} for r in rows])
+
+    def pending(self):
+        """
+        Returns the number of jobs queued or running
+        """
+        return sum(j['status'] in ('queued', 'running') for j in self.state['jobs'].values())
+
+    def run(self, interval = 5.0, once = False):
+        """
+        Scans, pairs and processes until interrupted, every interval seconds. If once is True, returns
+        when everything found on the first scan has been processed.
+        """
+        self.log('Watching %s with %d workers.'%(os.path.abspath(self.watchd), self.workers))
+        with ProcessPoolExecutor(max_workers = self.workers, initializer = init_worker) as pool:
+            try:
+                next_scan = 0
+                while True:
+                    if time.time() >= next_scan and not (once and next_scan):
+                        changed = self.scan()
+                        if self.pair() or changed:
+                            self.save()
+                        next_scan = time.time() + interval
+                    self.dispatch(pool)
+                    if self.collect(timeout = 0.05 if self.running else 0):
+                        self.save()
+                    if once and not self.pending():
+                        break
+                    if not self.running:
+                        time.sleep(min(max(next_scan - time.time(), 0), interval, 0.5))
+            except KeyboardInterrupt:
+                self.log('Stopping, waiting for %d running jobs.'%len(self.running))
+                while self.running:
+                    self.collect(timeout = 0.1)
+            finally:
+                self.save()
+        return sum(j['status'] == 'failed' for j in self.state['jobs'].values())
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'python -m HydroTrace.watch',
+        description = 'Watches a directory for GC reports and temperature records, processing each pair.')
+    parser.add_argument('directory', help = 'directory to watch')
+    parser.add_argument('-o', '--output', default = None, help = 'output directory (default: results in the watched directory)')
+    parser.add_argument('-j', '--workers', type = int, default = None,
+        help = 'number of worker processes (default: number of processors)')
+    parser.add_argument('--params', default = None, help = 'YAML file of run parameters, overridden by those given below')
+    for p in ('spa', 'weight', 'rate', 'cycletime', 'delay'):
+        parser.add_argument('--' + p, type = float, default = None)
+    parser.add_argument('--channel', default = None, help = 'temperature channel(s), separated by ;')
+    parser.add_argument('--material', default = None)
+    parser.add_argument('--content', type = float, default = None,
+        help = 'hydrogen standard content in ppm (default: from settings)')
+    parser.add_argument('--molar-rate', type = float, default = None,
+        help = 'carrier gas molar flow rate in µmol/s (default: from settings)')
+    parser.add_argument('--settings', default = None, help = 'alternative settings file')
+    parser.add_argument('--htb', action = 'store_true', help = 'also write binary .htb run files')
+    parser.add_argument('--gc-pattern', default = '*.txt', help = 'GC report file names (default: *.txt)')
+    parser.add_argument('--temp-pattern', default = '*.csv', help = 'temperature record file names (default: *.csv)')
+    parser.add_argument('--interval', type = float, default = 5.0, help = 'seconds between scans (default: 5)')
+    parser.add_argument('--settle', type = float, default = 5.0,
+        help = 'seconds a GC report is left unchanged before it is taken (default: 5)')
+    parser.add_argument('--retries', type = int, default = 3, help = 'attempts at each job (default: 3)')
+    parser.add_argument('--once', action = 'store_true', help = 'process what is there and exit')
+    args = parser.parse_args(argv)
+
+    params = {}
+    if args.params is not None:
+        with open(args.params, 'r') as ymlfile:
+            params = yaml.load(ymlfile, Loader=yaml.FullLoader) or {}
+    for p in run_params:
+        if getattr(args, p) is not None:
+            params[p] = getattr(args, p)
+    missing = [p for p in ('spa', 'weight', 'rate', 'cycletime') if params.get(p) is None]
+    if missing:
+        parser.error('run parameters %s are needed, with --params or on the command line'%', '.join(missing))
+    if isinstance(params.get('channel'), str):
+        params['channel'] = [c.strip() for c in params['channel'].split(';')]
+
+    content, flowconst = args.content, args.molar_rate
+    if content is None or flowconst is None:
+        cfg_content, cfg_flowconst = read_settings(args.settings)
+        content = cfg_content if content is None else content
+        flowconst = cfg_flowconst if flowconst is None else flowconst
+
+    outputd = args.output or os.path.join(args.directory, 'results')
+    service = WatchService(args.directory, outputd, params, content, flowconst, args.workers, args.htb,
+        args.gc_pattern, args.temp_pattern, args.settle, args.retries, backoff = 2*args.interval)
+    return 1 if service.run(args.interval, args.once) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
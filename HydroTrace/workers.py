@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+'''
+Trace hydrogen analyser background workers
+-------------------------------------------------------------------------------
+Runs file reading and calculations on a QThread so that the interface stays
+responsive, or ahead of them being asked for with Prefetch, and measures how
+responsive it stays. Event loop latency while reading a temperature record can
+be checked offscreen with:
+
+>QT_QPA_PLATFORM=offscreen python -m HydroTrace.workers record.csv
+
+adding --process to read it in a worker process instead.
+'''
+__author__ = "M.J. Roy"
+__version__ = "0.1"
+__email__ = "matthew.roy@manchester.ac.uk"
+__status__ = "Experimental"
+__copyright__ = "(c) M. J. Roy, 2019-2020"
+
+import sys, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from PyQt5 import QtCore, QtWidgets
+from HydroTrace.hydro_trace_common import Cancelled, read_pico_csv_bulk
+
+class Job(QtCore.QObject):
+    """
+    Runs fn(progress) on its own QThread. fn should call progress with the fraction complete as it
+    goes, which raises Cancelled once cancel has been called. Emits finished with the return value
+    of fn, failed with a description of any exception, or cancelled.
+    """
+    progress = QtCore.pyqtSignal(float)
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+
+    def __init__(self, fn):
+        super(Job, self).__init__()
+        self.fn = fn
+        self._cancel = False
+        self.thread = QtCore.QThread()
+        self.moveToThread(self.thread)
+        self.thread.started.connect(self.run)
+
+    def report(self, fraction):
+        """
+        Progress callback handed to fn
+        """
+        if self._cancel:
+            raise Cancelled()
+        self.progress.emit(fraction)
+
+    def run(self):
+        try:
+            result = self.fn(self.report)
+            if self._cancel:
+                raise Cancelled()
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit('%s: %s'%(type(e).__name__,e))
+        else:
+            self.finished.emit(result)
+        finally:
+            self.thread.quit()
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self._cancel = True
+
+    def wait(self):
+        self.thread.wait()
+
+#thread prefetches run on, one at a time
+_prefetcher = None
+
+class Prefetch(QtCore.QObject):
+    """
+    Runs fn(progress) on a background thread ahead of its result being asked for, see result. tags
+    describe what is being fetched, see matches. progress raises Cancelled once cancel has been called,
+    so that fn can stop early once what it fetches is no longer wanted. Emits ready once fn has
+    returned or raised.
+    """
+    ready = QtCore.pyqtSignal()
+
+    def __init__(self, fn, **tags):
+        global _prefetcher
+        super(Prefetch, self).__init__()
+        if _prefetcher is None:
+            _prefetcher = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'prefetch')
+        self.tags = tags
+        self.fraction = 0.0
+        self._cancel = False
+        self.future = _prefetcher.submit(fn, self.report)
+        self.future.add_done_callback(lambda future: self.ready.emit())
+
+    def report(self, fraction):
+        """
+        Progress callback handed to fn
+        """
+        if self._cancel:
+            raise Cancelled()
+        self.fraction = fraction
+
+    def matches(self, **tags):
+        return all(self.tags.get(k) == v for k, v in tags.items())
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, progress = None):
+        """
+        Returns the return value of fn, raising what it raised, waiting for it if it hasn't finished.
+        progress is called with the fraction fn has reported while waiting, and may raise Cancelled to
+        stop waiting, which cancels fn.
+        """
+        while True:
+            try:
+                return self.future.result(timeout = 0.05)
+            except TimeoutError:
+                if progress is not None:
+                    try:
+                        progress(self.fraction)
+                    except Cancelled:
+                        self.cancel()
+                        raise
+
+    def cancel(self):
+        self._cancel = True
+
+class LatencyProbe(QtCore.QObject):
+    """
+    Measures event loop latency as the lateness of a timer firing every interval ms
+    """
+    def __init__(self, interval = 10):
+        super(LatencyProbe, self).__init__()
+        self.interval = interval
+        self.lags = []
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.lags.append(max(now - self.last - self.interval/1000, 0))
+        self.last = now
+
+    def start(self):
+        self.lags = []
+        self.last = time.perf_counter()
+        self.timer.start(self.interval)
+
+    def stop(self):
+        """
+        Stops the probe, returning the number of ticks and the mean and max latency in ms
+        """
+        self.timer.stop()
+        if not self.lags:
+            return dict(ticks = 0, mean = 0.0, max = 0.0)
+        return dict(ticks = len(self.lags), mean = 1000*sum(self.lags)/len(self.lags),
+            max = 1000*max(self.lags))
+
+def measure_latency(fn, interval = 10):
+    """
+    Runs fn(progress) as a Job while spinning an event loop with a LatencyProbe. Returns the
+    latency statistics from LatencyProbe.stop and the result of fn (None if it failed).
+    """
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication([])
+    result = []
+    loop = QtCore.QEventLoop()
+    job = Job(fn)
+    job.finished.connect(result.append)
+    job.finished.connect(loop.quit)
+    job.failed.connect(loop.quit)
+    job.cancelled.connect(loop.quit)
+    probe = LatencyProbe(interval)
+    probe.start()
+    job.start()
+    loop.exec_()
+    stats = probe.stop()
+    job.wait()
+    return stats, result[0] if result else None
+
+if __name__ == '__main__':
+    if '--process' in sys.argv:
+        #parse in a worker process, see sharedmem
+        from HydroTrace.sharedmem import SharedPool
+        pool = SharedPool()
+        read = lambda progress: pool.call(read_pico_csv_bulk, (sys.argv[1], 1<<22), progress = progress, report = True)
+    else:
+        read = lambda progress: read_pico_csv_bulk(sys.argv[1], 1<<22, progress)
+    stats, result = measure_latency(read)
+    print('Read %d values, event loop latency over %d ticks: mean %0.2f ms, max %0.2f ms'%(
+        0 if result is None or result[0] is None else len(result[0]), stats['ticks'], stats['mean'], stats['max']))
@@ -17,11 +17,12 @@ setup(name = 'HydroTrace',
         'Topic :: Scientific/Engineering :: Visualization',
         'License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)',
         'Operating System :: Microsoft :: Windows :: Windows 7',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.9',
         'Intended Audience :: End Users/Desktop',
         'Natural Language :: English',
         ],
 
+    python_requires='>=3.9',
     install_requires=['numpy','scipy','pyyaml>=5.0','matplotlib','PyQt5>=5.13'],
     license = 'Creative Commons Attribution-Noncommercial-Share Alike license',
     keywords = 'Hydrogen, Trace, Curve-fit',
@@ -0,0 +1,50 @@
+import csv
+from HydroTrace.batch import write_kissinger, summary_fields
+
+def row(status, rate, peaks):
+    r = dict.fromkeys(summary_fields, '')
+    r.update(status = status, heating_rate = rate, fit_peaks = peaks)
+    return r
+
+def test_kissinger_uses_successful_fits_only(tmp_path):
+    rows = [row('ok', 2.0, '400.00;500.00'), row('ok', 5.0, '420.00;nan'), row('ok', 10.0, '440.00'),
+        row('Peak fit: did not converge', 20.0, '100.00;100.00'), row('ok', '', '450.00;550.00')]
+    fname = str(tmp_path/'kissinger.csv')
+    write_kissinger(fname, rows, 2)
+    with open(fname) as f:
+        out = list(csv.DictReader(f))
+    assert out[0]['runs'] == '3' and float(out[0]['energy']) > 0
+    #one run has the second peak, which isn't enough for a fit
+    assert out[1]['runs'] == '1' and out[1]['energy'] == ''
+
+def test_kissinger_notes_degenerate_rates(tmp_path):
+    rows = [row('ok', 2.0, '400.00'), row('ok', 2.0, '410.00')]
+    fname = str(tmp_path/'kissinger.csv')
+    write_kissinger(fname, rows, 1)
+    with open(fname) as f:
+        out, = list(csv.DictReader(f))
+    assert out['energy'] == '' and 'heating rates' in out['note']
+
+def test_uncertainty_interval_is_reproducible(tmp_path):
+    import os
+    from HydroTrace.batch import process_run
+    example = os.path.join(os.path.dirname(__file__), '..', 'exampledata')
+    run = dict(name = 'example', gc = os.path.join(example, 'Example_GC_Data.txt'),
+        temp = os.path.join(example, 'Example_Temp_Data.csv'), spa = 86485, weight = 1.66, rate = 20,
+        cycletime = 2.3, delay = 2.64)
+    sd = dict(spa = 1500, weight = 0.005)
+    a = process_run(run, 61, 7.44, str(tmp_path), sd = sd)
+    b = process_run(run, 61, 7.44, str(tmp_path), sd = sd)
+    assert (a['total_low'], a['total_high'], a['seed']) == (b['total_low'], b['total_high'], 0)
+    assert a['total_low'] < a['total'] < a['total_high']
+
+def test_rows_have_every_summary_field(tmp_path):
+    import os
+    from HydroTrace.batch import process_run, _process_run
+    example = os.path.join(os.path.dirname(__file__), '..', 'exampledata')
+    run = dict(name = 'example', gc = os.path.join(example, 'Example_GC_Data.txt'),
+        temp = os.path.join(example, 'Example_Temp_Data.csv'), spa = 86485, weight = 1.66, rate = 20,
+        cycletime = 2.3, delay = 2.64)
+    assert list(process_run(run, 61, 7.44, str(tmp_path))) == summary_fields
+    failed = _process_run((dict(run, spa = None), 61, 7.44, str(tmp_path)))
+    assert list(failed) == summary_fields and failed['status'] != 'ok'
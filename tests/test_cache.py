@@ -0,0 +1,49 @@
+import os, json
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from HydroTrace.cache import FileCache
+
+def read_bytes(fname):
+    return (np.fromfile(fname, dtype = np.uint8),)
+
+def load(args):
+    cachedir, fname = args
+    return len(FileCache(cachedir).load(fname, read_bytes, 'raw')[0])
+
+def make_files(path, n, size = 1000):
+    files = []
+    for i in range(n):
+        fname = os.path.join(str(path), 'f%02d.bin'%i)
+        np.full(size, i, dtype = np.uint8).tofile(fname)
+        files.append(fname)
+    return files
+
+def read_index(cachedir):
+    with open(os.path.join(cachedir, 'index.json')) as f:
+        return json.load(f)
+
+def test_concurrent_loads_are_all_indexed(tmp_path):
+    cachedir = str(tmp_path/'cache')
+    files = make_files(tmp_path, 24)
+    jobs = [(cachedir, f) for f in files]
+    with ThreadPoolExecutor(max_workers = 8) as pool:
+        assert list(pool.map(load, jobs[:12])) == [1000]*12
+    with ProcessPoolExecutor(max_workers = 4, mp_context = multiprocessing.get_context('spawn')) as pool:
+        assert list(pool.map(load, jobs[12:])) == [1000]*12
+    index = read_index(cachedir)
+    assert len(index['entries']) == 24
+    assert sorted(index['paths']) == sorted(os.path.abspath(f) for f in files)
+
+def test_eviction_prunes_paths(tmp_path):
+    cachedir = str(tmp_path/'cache')
+    files = make_files(tmp_path, 6, size = 1<<16)
+    cache = FileCache(cachedir, max_bytes = 3*(1<<16) + 1024)
+    for f in files:
+        cache.load(f, read_bytes, 'raw')
+    index = read_index(cachedir)
+    assert sum(e['bytes'] for e in index['entries'].values()) <= cache.max_bytes
+    held = {k.split('-')[0] for k in index['entries']}
+    assert sorted(held) == sorted(index['paths'][os.path.abspath(f)]['hash'] for f in files[-len(held):])
+    assert len(index['paths']) == len(held)
+    assert sorted(d for d in os.listdir(cachedir) if os.path.isdir(os.path.join(cachedir, d))) == sorted(index['entries'])
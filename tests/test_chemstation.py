@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import pytest
+from HydroTrace.hydro_trace_common import parse_cs_file, ChemStationError
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata', 'Example_GC_Data.txt')
+
+def lines():
+    with open(example, encoding = 'utf16') as f:
+        return f.read().splitlines()
+
+def write(path, text):
+    with open(str(path), 'w', encoding = 'utf16') as f:
+        f.write('\n'.join(text) + '\n')
+    return str(path)
+
+def test_example():
+    int_run, area, dt = parse_cs_file(example)
+    assert int_run.dtype == np.int64 and area.dtype == np.float64 and dt.dtype == np.dtype('datetime64[s]')
+    assert len(int_run) == len(area) == 80
+    assert dt[0] == np.datetime64('2020-03-09T17:09:28')
+    assert np.all(np.diff(dt.view(np.int64)) > 0)
+    #runs are numbered in the sequence table
+    assert int_run.max() + 1 < len(dt)
+
+def test_bad_sequence_line_is_located(tmp_path):
+    text = lines()
+    num = next(i for i, l in enumerate(text) if '09/03/2020 17:14:09' in l)
+    text[num] = text[num].replace('17:14:09', '17-14-09')
+    with pytest.raises(ChemStationError) as e:
+        parse_cs_file(write(tmp_path/'bad.txt', text))
+    assert e.value.lineno == num + 1 and 'date/time' in str(e.value)
+
+def test_bad_area_line_is_located(tmp_path):
+    text = lines()
+    head = next(i for i, l in enumerate(text) if 'Peak area' in l)
+    num = next(i for i in range(head, len(text)) if text[i].strip().startswith('---|')) + 2
+    text[num] = '  x'
+    with pytest.raises(ChemStationError) as e:
+        parse_cs_file(write(tmp_path/'bad.txt', text))
+    assert e.value.lineno == num + 1 and 'peak area' in str(e.value)
+
+def test_truncated_report(tmp_path):
+    text = lines()
+    head = next(i for i, l in enumerate(text) if 'Peak area' in l)
+    with pytest.raises(ChemStationError) as e:
+        parse_cs_file(write(tmp_path/'short.txt', text[:head]))
+    assert 'peak area table' in str(e.value) and e.value.lineno == head
@@ -0,0 +1,16 @@
+import os
+import numpy as np
+from HydroTrace.hydro_trace_common import parse_cs_file, read_pico_csv_bulk, calibrate_delay
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata')
+
+def test_example_delay():
+    int_run, area, dt = parse_cs_file(os.path.join(example, 'Example_GC_Data.txt'))
+    temp, temp_dt = read_pico_csv_bulk(os.path.join(example, 'Example_Temp_Data.csv'))
+    best, delays, cost = calibrate_delay(temp, temp_dt, dt, int_run, area)
+    assert len(cost) == len(delays)
+    #Example_readme.md gives 2.64 min; resampling the example runs puts 90% of the estimates within
+    #about 5 min of the delay they were simulated with, so only the neighbourhood is checked
+    assert abs(best - 2.64) < 1.5
+    #one basin rather than a minimum at the end of the sweep
+    assert np.nanargmin(cost) not in (0, len(delays) - 1)
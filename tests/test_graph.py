@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from HydroTrace.graph import Graph
+from HydroTrace.rundata import RunData, run_graph
+
+def chain():
+    g = Graph()
+    g.input('k', 2.0); g.input('area', np.arange(4.0))
+    g.stage('d_rate', lambda k, area: k*area, 'k', 'area')
+    g.stage('peak', np.max, 'd_rate')
+    return g
+
+def test_stages_are_only_recomputed_when_inputs_change():
+    g = chain()
+    assert g.get('peak') == 6 and g.get('peak') == 6
+    assert g.computed == {'d_rate': 1, 'peak': 1}
+    #setting an equal value changes nothing, a new array does
+    assert not g.set('k', 2.0)
+    assert g.fresh('peak')
+    assert g.set('k', 3.0) and not g.fresh('peak') and not g.fresh('d_rate')
+    assert g.get('peak') == 9 and g.computed == {'d_rate': 2, 'peak': 2}
+    assert g.set('area', g.values['area'].copy())
+    g.get('d_rate')
+    assert g.computed['d_rate'] == 3 and g.computed['peak'] == 2
+
+def test_stale_store_is_recomputed():
+    g = chain()
+    key = g.key('d_rate')
+    #inputs change while d_rate is computed elsewhere from the old ones
+    g.set('k', 5.0)
+    g.store('d_rate', 2.0*g.values['area'], key)
+    assert not g.fresh('d_rate')
+    assert np.array_equal(g.get('d_rate'), 5.0*np.arange(4.0))
+    #a store from current inputs is kept
+    g.store('d_rate', np.ones(4), g.key('d_rate'))
+    assert g.fresh('d_rate') and np.array_equal(g.get('d_rate'), np.ones(4))
+
+def test_missing_inputs():
+    with pytest.raises(ValueError):
+        Graph().stage('x', abs, 'y')
+
+def test_run_graph_only_rescales_for_parameters():
+    run = RunData()
+    run.set_gc(np.array([0, 1]), np.array([1.0, 3.0]), np.array([0, 60, 120], dtype = 'datetime64[s]'))
+    run.set_temp(None, np.arange(5, dtype = np.float32), np.arange(0, 300, 60).astype('datetime64[s]'))
+    g = run_graph()
+    values = dict(content = 61, spa = 86485, weight = 1.66, molar_rate = 7.44, rate = 20, cycletime = 2.3,
+        delay = 0, area = run.area, temp = run.temp, temp_epoch = run.temp_epoch, run_epoch = run.run_epoch)
+    for name, value in values.items():
+        g.set(name, value)
+    total = g.get('total'); g.get('d_rate'); g.get('common_temp')
+    g.set('weight', 3.32)
+    assert np.isclose(g.get('total'), total/2)
+    g.get('d_rate'); g.get('common_temp')
+    assert g.computed['area_sum'] == 1 and g.computed['common_temp'] == 1 and g.computed['k_rate'] == 2
+    assert run.total(61, 86485, 3.32, 7.44, 20, 2.3) == pytest.approx(g.get('total'))
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from HydroTrace.hydro_trace_common import interp_epoch
+
+t0 = np.array([0, 10, 20, 40], dtype = np.int64)
+d0 = np.array([0.0, 1.0, 3.0, 7.0])
+
+def test_matches_np_interp_with_fractional_delays():
+    t1 = np.arange(-5, 50, dtype = np.int64)
+    for delay in (0, 2.5, -3.25, 7):
+        expected = np.interp(t1 - delay, t0, d0, left = np.nan, right = np.nan)
+        assert np.allclose(interp_epoch(t0, d0, t1, delay), expected, equal_nan = True)
+
+def test_delays_broadcast():
+    t1 = np.arange(0, 40, 3, dtype = np.int64)
+    delays = np.array([0, 1.5, 4])[:,None]
+    out = interp_epoch(t0, d0, t1, delays)
+    assert out.shape == (3, len(t1))
+    for row, delay in zip(out, delays[:,0]):
+        assert np.allclose(row, interp_epoch(t0, d0, t1, delay), equal_nan = True)
+
+def test_out_of_range_policies():
+    t1 = np.array([-1, 0, 40, 41], dtype = np.int64)
+    assert np.array_equal(interp_epoch(t0, d0, t1), [np.nan, 0, 7, np.nan], equal_nan = True)
+    assert np.array_equal(interp_epoch(t0, d0, t1, out_of_range = 'clip'), [0, 0, 7, 7])
+    with pytest.raises(ValueError):
+        interp_epoch(t0, d0, t1, out_of_range = 'raise')
+    interp_epoch(t0, d0, t1[1:3], out_of_range = 'raise')
+    with pytest.raises(ValueError):
+        interp_epoch(t0, d0, t1, out_of_range = 'wrap')
+    with pytest.raises(ValueError):
+        interp_epoch(t0[:1], d0[:1], t1)
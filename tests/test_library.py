@@ -0,0 +1,24 @@
+import os
+from HydroTrace.batch import process_run
+from HydroTrace.library import RunLibrary
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata')
+
+def run(name, reduction = None):
+    return dict(name = name, gc = os.path.join(example, 'Example_GC_Data.txt'),
+        temp = os.path.join(example, 'Example_Temp_Data.csv'), spa = 86485, weight = 1.66, rate = 20,
+        cycletime = 2.3, delay = 2.64, reduction = reduction)
+
+def test_runs_are_told_apart_by_name_and_reduction(tmp_path, monkeypatch):
+    monkeypatch.setenv('HYDROTRACE_CACHE', str(tmp_path/'cache'))
+    out = str(tmp_path)
+    smoothed = dict(step = None, method = 'mean', window = 5, order = 2)
+    files = [process_run(r, 61, 7.44, out, htb = True)['htb'] for r in
+        (run('a'), run('b'), run('c', smoothed))]
+    with RunLibrary(str(tmp_path/'library.sqlite')) as lib:
+        for fname in files:
+            lib.add_run_file(fname)
+        assert sorted(r['name'] for r in lib.query()) == ['a', 'b', 'c']
+        #processing a run again replaces it
+        lib.add_run_file(process_run(run('a'), 61, 7.44, out, htb = True)['htb'])
+        assert sorted(r['name'] for r in lib.query()) == ['a', 'b', 'c']
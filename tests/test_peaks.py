@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from HydroTrace.peaks import kissinger, fit_peaks, gaussian
+
+def test_kissinger_needs_distinct_rates_and_temperatures():
+    with pytest.raises(ValueError):
+        kissinger([1, 1], [300, 300])
+    with pytest.raises(ValueError):
+        kissinger([1, 1], [300, 310])
+    with pytest.raises(ValueError):
+        kissinger([1, 2], [300, 300])
+    energy, intercept, r2 = kissinger([2, 5, 10], [400, 420, 440])
+    assert energy > 0 and r2 > 0.9
+
+def test_coinciding_peaks_are_degenerate():
+    T = np.linspace(20, 400, 400)
+    y = gaussian(T, np.array([[1, 150, 15], [0.6, 260, 20]]))[0]
+    two = fit_peaks(T, y, 2)
+    assert two['degenerate'] == '' and np.allclose(two['peak_temp'], [150, 260], atol = 0.1)
+    #two peaks started at one which is there
+    one = gaussian(T, np.array([[1, 200, 20]]))[0]
+    assert fit_peaks(T, one, 2, peaks = [200, 200])['degenerate']
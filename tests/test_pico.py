@@ -0,0 +1,33 @@
+import os
+from datetime import datetime
+import numpy as np
+from HydroTrace.hydro_trace_common import read_pico_csv_bulk, read_pico_channels
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata', 'Example_Temp_Data.csv')
+
+def read_lines(fname):
+    """
+    The original line by line reader, parsing each stamp with strptime
+    """
+    dt, temp = [], []
+    with open(fname, encoding='latin-1') as f:
+        next(f)
+        for line in f:
+            ls = line.split(',')
+            dt.append(datetime.strptime(ls[1], '%d/%m/%Y %H:%M:%S'))
+            temp.append(float(ls[2]))
+    return np.asarray(temp), np.array(dt, dtype='datetime64[s]')
+
+def test_bulk_matches_line_by_line():
+    temp, dt = read_lines(example)
+    for block_size in (1<<10, 1<<24):
+        bulk_temp, bulk_dt = read_pico_csv_bulk(example, block_size)
+        assert np.array_equal(bulk_temp, temp)
+        assert np.array_equal(bulk_dt, dt)
+
+def test_channels_match_bulk():
+    temp, dt = read_pico_csv_bulk(example)
+    names, channels, channels_dt = read_pico_channels(example, 0)
+    assert names == ['Channel 1 (\xb0C)']
+    assert np.array_equal(channels[:,0], temp)
+    assert np.array_equal(channels_dt, dt)
@@ -0,0 +1,42 @@
+import os, sys, json, subprocess
+import pytest
+from HydroTrace import profiling
+
+example = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'exampledata', 'Example_Temp_Data.csv'))
+
+script = '''
+import sys, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from HydroTrace.profiling import init_worker
+from HydroTrace.hydro_trace_common import read_pico_channels
+if __name__ == '__main__':
+    ctx = multiprocessing.get_context(sys.argv[1])
+    with ProcessPoolExecutor(max_workers = 2, mp_context = ctx, initializer = init_worker) as pool:
+        list(pool.map(read_pico_channels, [sys.argv[2]]*4))
+    read_pico_channels(sys.argv[2])
+'''
+
+@pytest.mark.parametrize('method', ['fork', 'spawn'])
+def test_worker_spans_are_merged(tmp_path, method):
+    if method not in __import__('multiprocessing').get_all_start_methods():
+        pytest.skip('%s is not available'%method)
+    trace = tmp_path/'trace.json'
+    env = dict(os.environ, HYDROTRACE_TRACE = str(trace),
+        PYTHONPATH = os.pathsep.join([os.path.join(os.path.dirname(__file__), '..'), os.environ.get('PYTHONPATH', '')]))
+    (tmp_path/'run.py').write_text(script)
+    subprocess.run([sys.executable, str(tmp_path/'run.py'), method, example], env = env, check = True, cwd = str(tmp_path))
+    events = json.load(open(trace))['traceEvents']
+    spans = [e for e in events if e['ph'] == 'X' and e['name'] == 'read_pico_channels']
+    #four in the workers and one in the caller, each once
+    assert len(spans) == 5
+    assert len({e['pid'] for e in spans}) >= 2
+    #the files written by the workers are merged and removed
+    assert set(os.listdir(str(tmp_path))) == {'run.py', 'trace.json'}
+
+def test_null_span_args_are_not_shared():
+    if profiling.enabled:
+        pytest.skip('tracing is enabled')
+    with profiling.span('a') as args:
+        args['rows'] = 1
+    with profiling.span('b') as args:
+        assert args == {}
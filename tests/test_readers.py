@@ -0,0 +1,22 @@
+import os
+import numpy as np
+from HydroTrace.cache import FileCache
+from HydroTrace.hydro_trace_common import read_cs_file, read_pico_csv
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata')
+gc = os.path.join(example, 'Example_GC_Data.txt')
+temp = os.path.join(example, 'Example_Temp_Data.csv')
+
+def test_readers_go_through_cache(tmp_path):
+    cache = FileCache(str(tmp_path))
+    parsed = read_cs_file(gc, cache = False)
+    first = read_cs_file(gc, cache = cache)
+    again = read_cs_file(gc, cache = cache)
+    for p, f, a in zip(parsed, first, again):
+        assert np.array_equal(p, f) and np.array_equal(p, a)
+    #the second read maps the arrays held in the cache
+    assert isinstance(again[0], np.memmap)
+    temps, dt = read_pico_csv(temp, cache = cache)
+    parsed_temps, parsed_dt = read_pico_csv(temp, cache = False)
+    assert np.array_equal(parsed_temps, temps) and parsed_dt == dt
+    assert len(cache._read_index()['entries']) == 2
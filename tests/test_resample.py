@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import pytest
+from HydroTrace.resample import Resample, Smooth, pipeline, read_pico_reduced, methods
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata', 'Example_Temp_Data.csv')
+
+rng = np.random.default_rng(0)
+t = np.cumsum(rng.integers(1, 4, 500)) + 1000
+t[250:] += 60 #a gap in the record
+v = rng.standard_normal((500, 2))
+
+def run(stage, splits):
+    out = [stage.feed(t[a:b], v[a:b]) for a, b in zip(splits[:-1], splits[1:])]
+    out.append(stage.flush())
+    return np.concatenate([o[0] for o in out]), np.vstack([o[1] for o in out])
+
+def splits(n):
+    return [0] + sorted(rng.integers(0, len(t), n).tolist()) + [len(t)]
+
+def stages():
+    yield lambda: Resample(5)
+    for method in methods:
+        yield lambda method = method: Smooth(method, 7, 3)
+    yield lambda: pipeline(10, 'median', 5)
+
+@pytest.mark.parametrize('make', list(stages()))
+def test_blocks_give_the_same_result(make):
+    whole_t, whole_v = run(make(), [0, len(t)])
+    for n in (1, 7, 100):
+        part_t, part_v = run(make(), splits(n))
+        assert np.array_equal(part_t, whole_t) and np.allclose(part_v, whole_v)
+
+def test_resample_means():
+    rt, rv = run(Resample(5), [0, len(t)])
+    cell = (t - (t[0] - t[0] % 5) + 2)//5
+    for time, mean in zip(rt, rv):
+        inside = cell == (time - (t[0] - t[0] % 5))//5
+        assert np.allclose(mean, v[inside].mean(axis = 0))
+    assert np.all(np.diff(rt) % 5 == 0) and np.any(np.diff(rt) > 5)
+
+def test_smooth_matches_padded_filter():
+    st, sv = run(Smooth('mean', 5), [0, len(t)])
+    padded = np.concatenate(([v[0,0]]*2, v[:,0], [v[-1,0]]*2))
+    assert np.array_equal(st, t) and np.allclose(sv[:,0], np.convolve(padded, np.ones(5)/5, 'valid'))
+    st, sv = run(Smooth('median', 5), [0, len(t)])
+    assert np.allclose(sv[:,0], [np.median(padded[i:i+5]) for i in range(len(t))])
+
+def test_reduced_read_is_independent_of_block_size():
+    whole = read_pico_reduced(example, step = 20, method = 'savgol', window = 5)
+    blocks = read_pico_reduced(example, step = 20, method = 'savgol', window = 5, block_size = 1<<12)
+    assert whole[0] == blocks[0] and np.array_equal(whole[2], blocks[2]) and np.allclose(whole[1], blocks[1])
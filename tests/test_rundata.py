@@ -0,0 +1,44 @@
+import numpy as np
+from HydroTrace.rundata import RunData
+
+def make():
+    run = RunData()
+    dt = np.array([0, 60, 120, 180, 240], dtype = 'datetime64[s]')
+    run.set_gc(np.array([0, 1, 2]), np.array([1.0, 2.0, 3.0]), dt)
+    channels = np.column_stack((np.arange(10, dtype = np.float32), 2*np.arange(10, dtype = np.float32)))
+    run.set_temp(['a', 'b'], channels, np.arange(-60, 540, 60).astype('datetime64[s]'))
+    return run, dt, channels
+
+def test_records_are_held_without_copies():
+    run, dt, channels = make()
+    assert np.shares_memory(run.gc_epoch, dt) and np.shares_memory(run.channels, channels)
+    assert np.shares_memory(run.temp, channels) and run.channel == 'a'
+    run.select_channel(None)
+    assert np.array_equal(run.temp, channels.mean(axis = 1)) and run.channel == ['a', 'b']
+
+def test_derived_columns_are_kept_until_records_change():
+    run, dt, channels = make()
+    assert np.array_equal(run.run_epoch, [60, 120, 180])
+    assert run.run_epoch is run.run_epoch
+    assert run.origin == -60
+    common_time = run.common_time
+    assert np.array_equal(common_time, [2, 3, 4]) and run.common_time is common_time
+    assert run.temp_time.dtype == np.float32 and run.temp_time[0] == 0
+    run.calculate(61, 86485, 1.66, 7.44, 20, 0)
+    assert np.allclose(run.common_temp, [2, 3, 4])
+    #a new GC report drops the results and the times derived from it
+    run.set_gc(np.array([0]), np.array([1.0]), dt[:2] + np.timedelta64(600, 's'))
+    assert run.common_temp is None and run.d_rate is None
+    assert np.array_equal(run.run_epoch, [660]) and np.array_equal(run.common_time, [12])
+
+def test_columns_round_trip():
+    run, dt, channels = make()
+    run.calculate(61, 86485, 1.66, 7.44, 20, 0.5)
+    again = RunData.from_columns(run.columns(), channel = 'a')
+    for name, values in run.columns().items():
+        assert np.array_equal(again.columns()[name], values)
+    #temp views a channel, so selecting another only drops the results
+    results = run.common_temp.nbytes + run.d_rate.nbytes + run.common_time.nbytes
+    held = run.nbytes
+    run.select_channel(1)
+    assert run.nbytes == held - results
@@ -0,0 +1,44 @@
+import os
+import numpy as np
+import pytest
+from HydroTrace.runfile import RunWriter, read_run, write_run, run_meta, ALIGN
+from HydroTrace.cache import file_hash
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata', 'Example_GC_Data.txt')
+
+def test_round_trip(tmp_path):
+    fname = str(tmp_path/'run.htb')
+    columns = dict(common_time = np.linspace(0, 10, 7), d_rate = np.arange(7, dtype = np.float32),
+        int_run = np.arange(7), dt = np.arange(8).astype('datetime64[s]'), temp = np.empty(0), area = None)
+    meta = run_meta(61, 7.44, 86485, 1.66, 20, 2.3, 2.64, total = 1.5, gc = example, channel = [0, 1])
+    write_run(fname, columns, meta)
+    for mmap in (True, False):
+        read, read_meta = read_run(fname, mmap)
+        assert sorted(read) == sorted(k for k, v in columns.items() if v is not None)
+        for name, values in read.items():
+            assert values.dtype == columns[name].dtype and np.array_equal(values, columns[name])
+        assert read_meta == meta
+    assert meta['sources']['gc']['hash'] == file_hash(example)
+
+def test_chunks_are_aligned(tmp_path):
+    fname = str(tmp_path/'run.htb')
+    with RunWriter(fname) as w:
+        w.write_column('a', np.arange(3, dtype = np.int8))
+        w.begin_column('b', np.float64)
+        for chunk in np.array_split(np.arange(100.0), 7):
+            w.write_chunk(chunk)
+    assert all(col['offset'] % ALIGN == 0 for col in w.columns.values())
+    columns, meta = read_run(fname)
+    assert np.array_equal(columns['b'], np.arange(100.0)) and meta == {}
+
+def test_incomplete_file(tmp_path):
+    fname = str(tmp_path/'run.htb')
+    write_run(fname, dict(a = np.arange(10)), {})
+    with open(fname, 'rb') as f:
+        data = f.read()
+    with open(fname, 'wb') as f:
+        f.write(data[:-6])
+    with pytest.raises(ValueError):
+        read_run(fname)
+    with pytest.raises(ValueError):
+        read_run(example)
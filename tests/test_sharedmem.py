@@ -0,0 +1,30 @@
+import os, gc
+import numpy as np
+import pytest
+from HydroTrace.sharedmem import SharedPool
+
+@pytest.fixture(scope = 'module')
+def pool():
+    with SharedPool() as pool:
+        yield pool
+
+def test_blocks_are_freed_once_unused(pool):
+    a = pool.call(np.arange, (1000,))
+    assert np.array_equal(a, np.arange(1000))
+    name, = pool._blocks
+    #arrays passed back view the same block
+    b = pool.call(np.add, (a[10:], 1))
+    assert np.array_equal(b, np.arange(11, 1001))
+    del a, b
+    gc.collect()
+    pool.call(int, (0,))
+    assert not pool._blocks and not pool._names and not pool._freed
+    if os.path.isdir('/dev/shm'):
+        assert not os.path.exists(os.path.join('/dev/shm', name.lstrip('/')))
+
+def test_freeing_under_the_lock(pool):
+    a = pool.call(np.ones, (100,))
+    with pool._lock:
+        #as when garbage collection frees a block while this thread holds the lock
+        del a
+    assert pool.call(np.zeros, (10,)).sum() == 0
@@ -0,0 +1,26 @@
+import os, shutil, stat
+import numpy as np
+from HydroTrace import timeindex
+from HydroTrace.timeindex import TimeIndex, index_path, read_pico_window
+from HydroTrace.hydro_trace_common import read_pico_channels
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata', 'Example_Temp_Data.csv')
+
+def test_index_is_kept_in_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('HYDROTRACE_CACHE', str(tmp_path/'cache'))
+    data = tmp_path/'data'
+    data.mkdir()
+    fname = str(data/'temp.csv')
+    shutil.copy(example, fname)
+    index = TimeIndex.open(fname, block = 1<<12)
+    #nothing is written to the instrument data folder
+    assert os.listdir(str(data)) == ['temp.csv']
+    path = index_path(fname)
+    assert path.startswith(str(tmp_path/'cache'))
+    assert stat.S_IMODE(os.stat(path).st_mode) == timeindex._mode
+    assert TimeIndex(fname, block = 1<<12).load()
+    names, temps, dt = read_pico_channels(fname)
+    start, stop = dt[len(dt)//3], dt[len(dt)//2]
+    w_names, w_temps, w_dt = read_pico_window(fname, start, stop, index = index)
+    assert w_dt[0] <= start and w_dt[-1] >= stop
+    assert np.array_equal(w_temps, temps[np.searchsorted(dt, w_dt[0]):np.searchsorted(dt, w_dt[-1], 'right')])
@@ -0,0 +1,29 @@
+import numpy as np
+from HydroTrace.uncertainty import propagate
+from HydroTrace.hydro_trace_common import calc_total, calc_desorbtion_rate
+
+params = dict(content = 61, spa = 86485, weight = 1.66, molar_rate = 7.44, rate = 20, cycletime = 2.3, delay = 2.64)
+sd = dict(spa = 1500, weight = 0.005)
+
+def test_percentiles_match_direct_draws():
+    area = np.array([1000.0, -200.0, 0.0, 5000.0])
+    percentiles = (5, 50)
+    res = propagate(params, sd, area, n = 20000, percentiles = percentiles, seed = 1)
+    #the results of each draw in full, with the same draws
+    rng = np.random.default_rng(1)
+    spa = params['spa'] + sd['spa']*rng.standard_normal(20000)
+    weight = params['weight'] + sd['weight']*rng.standard_normal(20000)
+    k = calc_desorbtion_rate(params['content'], spa, weight, params['molar_rate'], params['rate'], 1.0)
+    d_rate = k[:,None]*area
+    assert np.allclose(res['d_rate'], np.percentile(d_rate, percentiles, axis = 0))
+    total = k*params['cycletime']*area.sum()
+    assert np.allclose(res['total'], np.percentile(total, percentiles))
+    nominal = calc_total(params['content'], params['spa'], params['weight'], params['molar_rate'], params['rate'],
+        params['cycletime'], area)
+    assert abs(res['total'][1] - nominal) < 0.01*nominal
+
+def test_seed_reproduces():
+    area = np.linspace(0, 100, 10)
+    a = propagate(params, sd, area, n = 1000, seed = 3)
+    b = propagate(params, sd, area, n = 1000, seed = 3)
+    assert np.array_equal(a['total_samples'], b['total_samples'])
@@ -0,0 +1,20 @@
+import os, shutil
+from HydroTrace.watch import WatchService
+
+example = os.path.join(os.path.dirname(__file__), '..', 'exampledata')
+
+def test_deterministic_failure_is_final(tmp_path, monkeypatch):
+    monkeypatch.setenv('HYDROTRACE_CACHE', str(tmp_path/'cache'))
+    watchd, outputd = tmp_path/'in', tmp_path/'out'
+    watchd.mkdir()
+    shutil.copy(os.path.join(example, 'Example_GC_Data.txt'), str(watchd/'run.txt'))
+    shutil.copy(os.path.join(example, 'Example_Temp_Data.csv'), str(watchd/'run.csv'))
+    #a delay of a week moves the record clear of the GC runs
+    params = dict(spa = 1.0, weight = 1.0, rate = 10.0, cycletime = 1.0, delay = 7*24*60.0)
+    service = WatchService(str(watchd), str(outputd), params, 1.0, 1.0, workers = 1, settle = 0,
+        retries = 3, backoff = 0)
+    service.run(interval = 0.1, once = True)
+    job, = service.state['jobs'].values()
+    assert job['status'] == 'failed' and job['attempts'] == 1
+    assert job['row']['status'] == 'Temperature record does not span the GC runs.'
+    assert sorted(os.listdir(str(watchd))) == ['run.csv', 'run.txt']